@@ -0,0 +1,77 @@
+# coding: utf-8
+"""
+Сравнение обработки выстрелов соперника на полях-списках и битовых полях.
+
+Запуск: python benchmarks/bench_bitboard.py [число партий]
+
+Поля и порядок выстрелов строятся из SEED, так что запуски меряют одну и ту
+же работу. На машине разработки (python 2.7.18, лучшее из четырёх запусков
+по 200 партий) вышло:
+
+    all cells   list 1.64 us/shot   bitboard 1.38 us/shot
+    ship cells  list 3.11 us/shot   bitboard 2.34 us/shot
+
+Машина шумная, отдельные запуски расходятся до полутора раз. Выигрыш битовых
+полей - на попаданиях; на ходе соперника в целом (bench_game.py --game
+seabattle.bitboard, handle_enemy_shot) разница в пределах шума: 1.4-1.9 us
+у списков и 1.6-1.9 us у битовых полей.
+"""
+
+from __future__ import unicode_literals, print_function
+
+import random
+import sys
+import timeit
+
+from seabattle import bitboard, game as gm
+
+
+SEED = 20180701
+REPEAT = 10
+
+
+def _prepare(games):
+    rng = random.Random(SEED)
+    fields = []
+    for seed in xrange(games):
+        g = gm.Game(seed=SEED + seed)
+        g.start_new_game()
+        positions = [(x, y) for x in xrange(1, 11) for y in xrange(1, 11)]
+        rng.shuffle(positions)
+        fields.append((list(g.field), positions))
+    return fields
+
+
+def _games(game_cls, fields, only_ships=False):
+    games = []
+    for field, positions in fields:
+        g = game_cls()
+        g.start_new_game(field=list(field))
+        if only_ships:
+            positions = [p for p in positions if field[g.calc_index(p)] == gm.SHIP]
+        games.append((g, positions))
+    return games
+
+
+def _run(games):
+    for g, positions in games:
+        for position in positions:
+            g.handle_enemy_shot(position)
+        for position in positions:
+            g.handle_enemy_shot(position)
+
+
+def main():
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    fields = _prepare(games)
+
+    for title, only_ships in [('all cells', False), ('ship cells', True)]:
+        for name, game_cls in [('list', gm.Game), ('bitboard', bitboard.Game)]:
+            runs = [_games(game_cls, fields, only_ships) for _ in xrange(REPEAT)]
+            shots = 2 * sum(len(positions) for _, positions in runs[0])
+            best = min(timeit.timeit(lambda: _run(prepared), number=1) for prepared in runs)
+            print('%-10s %-8s %.3f us/shot' % (title, name, best / shots * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# coding: utf-8
+"""
+Цена хранения игры вне процесса: encode/decode на ход и размер состояния
+в сравнении с pickle, а также get+save сессии в SQLite.
+
+Запуск: python benchmarks/bench_codec.py [число партий]
+
+Последние записанные числа (1 CPU, состояния после каждого хода 20 партий):
+
+    game.Game      encode 121 us, decode 106 us, 547 байт (pickle 5879 байт)
+    bitboard.Game  encode 112 us, decode 151 us, 547 байт
+    density.Game   encode  99 us, decode 167 us, 598 байт (pickle 14364 байт)
+    sqlite get+save сессии 261 us на ход
+
+До версии 4 формата состояние генератора занимало 2.5 КБ из 3044 байт записи,
+а get+save стоил около 325 us. Время encode и decode в пределах шума: первый
+encode после перемешивания генератора засевает его заново (около 80 us), дальше
+число перемешиваний берётся из запомненного.
+"""
+
+from __future__ import unicode_literals, print_function
+
+import cPickle as pickle
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+from seabattle import codec, game as gm, session
+
+
+def _states(game_cls, games):
+    """Состояния игрока после каждого хода в нескольких партиях"""
+    states = []
+    for seed in xrange(games):
+        defender = gm.Game(seed=seed)
+        defender.start_new_game()
+        player = game_cls(seed=seed + 1)
+        player.start_new_game(numbers=True)
+        while not player.is_victory():
+            player.do_shot()
+            player.handle_enemy_reply(defender.handle_enemy_shot(player.last_shot_position))
+            states.append(codec.decode(codec.encode(player)))
+    return states
+
+
+def _best(func, states):
+    return min(timeit.repeat(lambda: [func(state) for state in states], number=1, repeat=3)) / len(states) * 1e6
+
+
+def main():
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    for game_cls in codec.KINDS:
+        states = _states(game_cls, games)
+        encoded = [codec.encode(state) for state in states]
+        pickled = [pickle.dumps(state, 2) for state in states]
+        print('%-20s codec encode %6.1f us, decode %6.1f us, %5d bytes | pickle dumps %6.1f us, loads %6.1f us, %5d bytes' % (
+            game_cls.__module__,
+            _best(codec.encode, states),
+            _best(codec.decode, encoded),
+            sum(len(data) for data in encoded) // len(encoded),
+            _best(lambda state: pickle.dumps(state, 2), states),
+            _best(pickle.loads, pickled),
+            sum(len(data) for data in pickled) // len(pickled),
+        ))
+
+    directory = tempfile.mkdtemp()
+    try:
+        store = session.SqliteSessionStore(os.path.join(directory, 'sessions.db'))
+        states = _states(gm.Game, games)
+        for number, state in enumerate(states):
+            session_obj = store.get(number % 100)
+            session_obj['game'] = state
+            store.save(session_obj)
+
+        def turn(number):
+            session_obj = store.get(number % 100)
+            store.save(session_obj)
+
+        best = min(timeit.repeat(lambda: [turn(number) for number in xrange(1000)], number=1, repeat=3))
+        print('sqlite session get+save %.1f us/turn' % (best / 1000 * 1e6))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
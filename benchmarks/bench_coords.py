@@ -0,0 +1,149 @@
+# coding: utf-8
+"""
+Разбор координат: прежний Game.convert_to_position (регулярные выражения и
+list.index) против таблицы coords.PositionParser - цена разбора и доля
+реплик, которые разобраны правильно.
+
+Запуск: PYTHONPATH=. python benchmarks/bench_coords.py [--repeat 5] [--seed 20180701]
+
+Корпус - все клетки поля в тех написаниях, в которых их присылает
+распознавание речи: цифры, числительные, буквы, слитно и с запятой, а также
+числительные с одной опечаткой. Неверно разобранная реплика хуже
+неразобранной (навык стреляет не туда), поэтому она считается отдельно.
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import random
+import re
+import timeit
+
+from seabattle import coords
+from seabattle import game as gm
+
+
+LETTERS = gm.BaseGame.str_letters
+NUMBERS = gm.BaseGame.str_numbers
+LATIN = ['a', 'b', 'v', 'g', 'd', 'e', 'zh', 'z', 'i', 'k']
+RUSSIAN = 'абвгдежзиклмнопрстуфхцчшщыэюя'
+
+_PATTERNS = [re.compile('^([a-zа-я]+)(\d+)$', re.UNICODE),
+             re.compile('^([a-zа-я]+)\s+(\w+)$', re.UNICODE),
+             re.compile('^(\w+)\s+(\w+)$', re.UNICODE)]
+
+
+def legacy_convert_to_position(position):
+    """Game.convert_to_position до таблицы написаний"""
+    position = position.lower()
+    for pattern in _PATTERNS:
+        match = pattern.match(position)
+        if match is not None:
+            break
+    else:
+        raise ValueError('Can\'t parse entire position: %s' % position)
+
+    def _try_number(bit):
+        bit = gm.BaseGame.letters_mapping.get(bit, bit)
+        if bit.isdigit():
+            return int(bit)
+        return NUMBERS.index(bit) + 1
+
+    x, y = [bit.strip() for bit in match.groups()]
+    return _try_number(x), _try_number(y)
+
+
+def _typo(rng, word):
+    """Одна опечатка: пропуск, лишняя, замена или перестановка буквы"""
+    i = rng.randrange(len(word))
+    kind = rng.choice(['drop', 'add', 'replace', 'swap'])
+    if kind == 'drop':
+        return word[:i] + word[i + 1:]
+    if kind == 'add':
+        return word[:i] + rng.choice(RUSSIAN) + word[i:]
+    if kind == 'replace':
+        return word[:i] + rng.choice(RUSSIAN) + word[i + 1:]
+    i = min(i, len(word) - 2)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def corpus(seed):
+    """[(реплика, правильная позиция)]"""
+    rng = random.Random(seed)
+    texts = []
+    for x in xrange(1, 11):
+        for y in xrange(1, 11):
+            expected = (x, y)
+            texts.extend((text, expected) for text in [
+                '%s %s' % (x, y),
+                '%s, %s' % (x, y),
+                '%s %s' % (NUMBERS[x - 1], NUMBERS[y - 1]),
+                '%s %s' % (x, NUMBERS[y - 1]),
+                '%s %s' % (LETTERS[x - 1], y),
+                '%s%s' % (LETTERS[x - 1], y),
+                '%s %s' % (LATIN[x - 1], y),
+                '%s %s' % (LETTERS[x - 1].upper(), NUMBERS[y - 1]),
+                '%s %s' % (_typo(rng, NUMBERS[x - 1]), y),
+                '%s %s' % (x, _typo(rng, NUMBERS[y - 1])),
+            ])
+    return texts
+
+
+def accuracy(parse, texts):
+    right = wrong = 0
+    for text, expected in texts:
+        try:
+            position = parse(text)
+        except ValueError:
+            continue
+        if position == expected:
+            right += 1
+        else:
+            wrong += 1
+    return right, wrong
+
+
+def cost(parse, texts, repeat):
+    def run():
+        for text, _ in texts:
+            try:
+                parse(text)
+            except ValueError:
+                pass
+
+    return min(timeit.repeat(run, number=1, repeat=repeat)) / len(texts) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=20180701)
+    args = parser.parse_args()
+
+    texts = corpus(args.seed)
+    table = coords.PositionParser(LETTERS, NUMBERS, gm.BaseGame.letters_mapping)
+
+    def table_without_memo(text):
+        result = table._parse(text)
+        if not isinstance(result, tuple):
+            raise ValueError(result)
+        return result
+
+    variants = [
+        ('legacy', legacy_convert_to_position),
+        ('table', table_without_memo),
+        ('table + memo', table.parse),
+    ]
+    # цена на репликах, которые понимал и прежний разбор: остальные он бросает рано
+    known = [(text, expected) for text, expected in texts if accuracy(legacy_convert_to_position, [(text, expected)])[0]]
+
+    print('%s texts, %s known to legacy' % (len(texts), len(known)))
+    for name, parse in variants:
+        right, wrong = accuracy(parse, texts)
+        print('%-14s %6.2f us/text   %6.2f us/known   parsed %5.1f%%   wrong %4.1f%%' % (
+            name, cost(parse, texts, args.repeat), cost(parse, known, args.repeat),
+            100.0 * right / len(texts), 100.0 * wrong / len(texts)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+# coding: utf-8
+"""
+Время генерации поля: p50, p99 и максимум по каждому распределению.
+
+Запуск: python benchmarks/bench_fieldgen.py [число полей]
+"""
+
+from __future__ import unicode_literals, print_function
+
+import random
+import sys
+import time
+
+from seabattle import fieldgen, simulate
+
+
+SHIPS = [1, 1, 1, 1, 2, 2, 2, 3, 3, 4]
+
+
+def measure(distribution, fields):
+    rng = random.Random(0)
+    timings = []
+    for _ in xrange(fields):
+        started = time.time()
+        fieldgen.generate(10, SHIPS, rng, distribution)
+        timings.append(time.time() - started)
+    return timings
+
+
+def main():
+    fields = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    for distribution in fieldgen.DISTRIBUTIONS:
+        timings = measure(distribution, fields)
+        print('%-8s p50 %.1f us, p99 %.1f us, max %.1f us, %s fields' % (
+            distribution,
+            simulate.percentile(timings, 0.5) * 1e6,
+            simulate.percentile(timings, 0.99) * 1e6,
+            max(timings) * 1e6,
+            fields,
+        ))
+
+
+if __name__ == '__main__':
+    main()
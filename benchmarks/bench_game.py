@@ -0,0 +1,308 @@
+# coding: utf-8
+"""
+Набор микробенчмарков горячих путей seabattle.game с базовой линией.
+
+Каждый замер - лучшее из --repeat повторов, в микросекундах на операцию. Все
+партии и поля строятся из фиксированных seed, поэтому повторные запуски
+меряют одну и ту же работу.
+
+    PYTHONPATH=. python benchmarks/bench_game.py                       # только вывести
+    PYTHONPATH=. python benchmarks/bench_game.py --save benchmarks/baseline_game.json
+    PYTHONPATH=. python benchmarks/bench_game.py --compare benchmarks/baseline_game.json
+
+С --compare скрипт сравнивает результат с сохранённым и завершается с кодом 1,
+если какой-то замер медленнее базовой линии больше чем на --threshold (по
+умолчанию 25%: меньшие отличия обычно шум). Базовая линия привязана к машине:
+перед сравнением её нужно снять на той же машине до изменений.
+
+--game меряет другую реализацию с тем же интерфейсом, например seabattle.bitboard.
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import collections
+import importlib
+import io
+import json
+import platform
+import random
+import sys
+import timeit
+
+from seabattle import game as gm
+
+
+GAMES = 100
+SEED = 20180701
+
+# координаты так, как их отдаёт распознавание речи в hit_entity
+STT_POSITIONS = [
+    '2 10', '10 10', '1 1', '7 3', '5 5', 'три пять', 'семь девять', 'десять один',
+    'один десять', 'трень 4', '4 трень', '6 восемь', 'девять 2', 'пять   шесть',
+]
+# а так - то, что прежний convert_to_position не разбирал (буквы теперь понимает coords)
+STT_GARBAGE = ['а пять', 'к 10', 'в5', 'ноль 1', 'сто двадцать', 'я хожу', 'е семь']
+
+CASES = collections.OrderedDict()
+
+
+def case(unit):
+    def register(func):
+        CASES[func.__name__] = (func, unit)
+        return func
+    return register
+
+
+def _fields(game_cls):
+    fields = []
+    for seed in xrange(GAMES):
+        g = game_cls(seed=SEED + seed)
+        g.start_new_game()
+        fields.append(list(g.field))
+    return fields
+
+
+def _ship_cells(field):
+    return [index for index, state in enumerate(field) if state == gm.SHIP]
+
+
+@case('field')
+def generate_field(game_cls, fields, timer):
+    games = []
+    for seed in xrange(GAMES):
+        g = game_cls(seed=SEED + seed)
+        g.size, g.ships = 10, g.default_ships
+        games.append(g)
+
+    started = timer()
+    for g in games:
+        g.generate_field()
+    return len(games), timer() - started
+
+
+@case('game')
+def build_maps(game_cls, fields, timer):
+    games = []
+    for field in fields:
+        g = game_cls(seed=SEED)
+        g.start_new_game(field=list(field))
+        games.append(g)
+
+    started = timer()
+    for g in games:
+        g.build_maps()
+    return len(games), timer() - started
+
+
+@case('game')
+def start_new_game(game_cls, fields, timer):
+    """Начало партии с готовым полем: карты стрельбы, корабли соперника"""
+    games = [(game_cls(seed=SEED + seed), list(field)) for seed, field in enumerate(fields)]
+
+    started = timer()
+    for g, field in games:
+        g.start_new_game(field=field)
+    return len(games), timer() - started
+
+
+@case('shot')
+def do_shot(game_cls, fields, timer):
+    """Выбор выстрела на протяжении целых партий; ответы соперника вне замера"""
+    shots = 0
+    spent = 0.0
+    for seed, field in enumerate(fields):
+        defender = gm.Game(seed=seed)
+        defender.start_new_game(field=list(field))
+        player = game_cls(seed=SEED + seed)
+        player.start_new_game()
+        while not player.is_victory():
+            started = timer()
+            player.do_shot()
+            spent += timer() - started
+            shots += 1
+            player.handle_enemy_reply(defender.handle_enemy_shot(player.last_shot_position))
+    return shots, spent
+
+
+@case('shot')
+def handle_enemy_shot(game_cls, fields, timer):
+    rng = random.Random(SEED)
+    games = []
+    for field in fields:
+        g = game_cls(seed=SEED)
+        g.start_new_game(field=list(field))
+        positions = [(x, y) for x in xrange(1, 11) for y in xrange(1, 11)]
+        rng.shuffle(positions)
+        games.append((g, positions))
+
+    started = timer()
+    for g, positions in games:
+        for position in positions:
+            g.handle_enemy_shot(position)
+    return sum(len(positions) for _, positions in games), timer() - started
+
+
+@case('call')
+def is_dead_ship(game_cls, fields, timer):
+    """Подбита часть палуб: одни корабли ещё живы, другие потоплены"""
+    rng = random.Random(SEED)
+    games = []
+    for field in fields:
+        field = list(field)
+        hits = [index for index in _ship_cells(field) if rng.random() < 0.6]
+        for index in hits:
+            field[index] = gm.HIT
+        g = game_cls(seed=SEED)
+        g.start_new_game(field=field)
+        games.append((g, hits))
+
+    started = timer()
+    for g, hits in games:
+        for index in hits:
+            g.is_dead_ship(index)
+    return sum(len(hits) for _, hits in games), timer() - started
+
+
+@case('ship')
+def mark_killed_ship_bounds(game_cls, fields, timer):
+    """Все корабли соперника подбиты, обводим каждый после "убил" """
+    games = []
+    for field in fields:
+        g = game_cls(seed=SEED)
+        g.start_new_game()
+        g.enemy_field = [gm.SHIP if state == gm.SHIP else gm.EMPTY for state in field]
+        # по одной палубе каждого корабля: клетка, у которой нет соседа-палубы слева и сверху
+        heads = [
+            g.calc_position(index) for index in _ship_cells(field)
+            if (index % 10 == 0 or field[index - 1] != gm.SHIP) and (index < 10 or field[index - 10] != gm.SHIP)
+        ]
+        games.append((g, heads))
+
+    started = timer()
+    for g, heads in games:
+        for position in heads:
+            g.mark_killed_ship_bounds(position)
+    return sum(len(heads) for _, heads in games), timer() - started
+
+
+@case('text')
+def convert_to_position(game_cls, fields, timer):
+    g = game_cls(seed=SEED)
+    g.start_new_game(field=list(fields[0]))
+    texts = STT_POSITIONS * 50
+
+    started = timer()
+    for text in texts:
+        g.convert_to_position(text)
+    return len(texts), timer() - started
+
+
+@case('text')
+def convert_to_position_garbage(game_cls, fields, timer):
+    g = game_cls(seed=SEED)
+    g.start_new_game(field=list(fields[0]))
+    texts = STT_GARBAGE * 50
+
+    started = timer()
+    for text in texts:
+        try:
+            g.convert_to_position(text)
+        except ValueError:
+            pass
+    return len(texts), timer() - started
+
+
+@case('position')
+def convert_from_position(game_cls, fields, timer):
+    g = game_cls(seed=SEED)
+    g.start_new_game(field=list(fields[0]))
+    positions = [(x, y) for x in xrange(1, 11) for y in xrange(1, 11)] * 10
+
+    started = timer()
+    for position in positions:
+        g.convert_from_position(position, numbers=True)
+        g.convert_from_position(position, numbers=False)
+    return 2 * len(positions), timer() - started
+
+
+def measure(game_cls, names, repeat):
+    fields = _fields(game_cls)
+    best = {}
+    # повторы идут по кругу через все замеры, а не подряд для каждого: если
+    # машина притормозила на время, это заденет все замеры, а не один
+    for _ in xrange(repeat):
+        for name in names:
+            count, spent = CASES[name][0](game_cls, fields, timeit.default_timer)
+            per_op = spent / count * 1e6
+            best[name] = min(best.get(name, per_op), per_op)
+
+    results = collections.OrderedDict()
+    for name in names:
+        results[name] = {'us': round(best[name], 3), 'unit': CASES[name][1]}
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Строки сравнения и список замеров, которые стали медленнее порога"""
+    lines, regressions = [], []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            lines.append('%-28s %10s %10.3f   new' % (name, '-', result['us']))
+            continue
+        ratio = result['us'] / before['us'] if before['us'] else float('inf')
+        mark = ''
+        if ratio > 1 + threshold:
+            mark = 'REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            mark = 'faster'
+        lines.append('%-28s %10.3f %10.3f %7.2fx %s' % (name, before['us'], result['us'], ratio, mark))
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Микробенчмарки seabattle.game')
+    parser.add_argument('--game', default='seabattle.game', help='модуль с классом Game')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--only', nargs='+', choices=list(CASES), help='только эти замеры')
+    parser.add_argument('--save', help='записать результат в JSON')
+    parser.add_argument('--compare', help='сравнить с JSON, записанным через --save')
+    parser.add_argument('--threshold', type=float, default=0.25)
+    args = parser.parse_args()
+
+    game_cls = importlib.import_module(args.game).Game
+    results = measure(game_cls, args.only or list(CASES), args.repeat)
+
+    if args.compare:
+        with io.open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('game') != args.game:
+            print('warning: baseline is for %s' % baseline.get('game'))
+        print('%-28s %10s %10s   (us/op)' % ('', 'baseline', 'current'))
+        lines, regressions = compare(results, baseline['results'], args.threshold)
+        for line in lines:
+            print(line)
+    else:
+        regressions = []
+        for name, result in results.items():
+            print('%-28s %10.3f us/%s' % (name, result['us'], result['unit']))
+
+    if args.save:
+        with io.open(args.save, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({
+                'game': args.game,
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'repeat': args.repeat,
+                'results': results,
+            }, indent=2, ensure_ascii=False, sort_keys=True) + '\n')
+
+    if regressions:
+        print('regressions: %s' % ', '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+# coding: utf-8
+"""
+Таблицы geometry против прежнего перебора сдвигов [-1, 0, 1] с проверкой
+границ: обводка потопленного корабля и выбор клетки для добивания на полях
+10x10 и больших.
+
+Запуск: PYTHONPATH=. python benchmarks/bench_geometry.py [--sizes 10 32 100] [--repeat 5]
+
+Game.start_new_game не даёт поле больше 10x10, поэтому здесь размер и поле
+соперника задаются напрямую: меряются только сами методы.
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import random
+import timeit
+
+from seabattle import game as gm
+from seabattle import geometry
+
+
+class LegacyGame(gm.Game):
+    """game.Game с прежними hunt_for_wounded и mark_killed_ship_bounds"""
+
+    def hunt_for_wounded(self):
+        if len(self.ship_under_fire) == 1:
+            variants = set(filter(
+                lambda point: 1 <= point[0] <= self.size and 1 <= point[1] <= self.size,
+                [
+                    (self.last_hit[0], self.last_hit[1] - 1),
+                    (self.last_hit[0], self.last_hit[1] + 1),
+                    (self.last_hit[0] - 1, self.last_hit[1]),
+                    (self.last_hit[0] + 1, self.last_hit[1]),
+                ],
+            ))
+        else:
+            if self.ship_under_fire[0][0] == self.ship_under_fire[1][0]:
+                variants = set([(point[0], point[1] - 1) for point in self.ship_under_fire]).union(
+                    [(point[0], point[1] + 1) for point in self.ship_under_fire]
+                )
+            else:
+                variants = set([(point[0] - 1, point[1]) for point in
+                                self.ship_under_fire]).union(
+                    [(point[0] + 1, point[1]) for point in self.ship_under_fire]
+                )
+            variants = set(filter(
+                lambda point: 1 <= point[0] <= self.size and 1 <= point[1] <= self.size,
+                variants
+            ))
+        while len(variants):
+            candidate = self.rng.sample(variants, 1)[0]
+            variants.discard(candidate)
+            if self.enemy_field[self.calc_index(candidate)] == gm.EMPTY:
+                break
+        else:
+            raise Exception('SHOULD BE KILLED ALREADY!')
+        return candidate
+
+    def mark_killed_ship_bounds(self, position):
+        def mark_point((x, y)):
+            for i in [-1, 0, 1]:
+                for j in [-1, 0, 1]:
+                    if i == 0 and j == 0:
+                        continue
+                    new_position = (x + i, y + j)
+                    if new_position[0] <= 0 or new_position[1] <= 0 or new_position[0] > self.size or new_position[1] > self.size:
+                        continue
+                    index_to_mark = self.calc_index(new_position)
+                    if self.enemy_field[index_to_mark] == gm.SHIP and new_position not in marked_positions:
+                        marked_positions.add(new_position)
+                        mark_point(new_position)
+                    elif self.enemy_field[index_to_mark] != gm.SHIP:
+                        self.enemy_field[index_to_mark] = gm.MISS
+
+        marked_positions = {position}
+        mark_point(position)
+
+
+def _game(game_cls, size):
+    g = game_cls(seed=size)
+    g.size = size
+    g.enemy_field = [gm.EMPTY] * size ** 2
+    return g
+
+
+def _ships(size, rng):
+    """Горизонтальные и вертикальные корабли по 1-4 палубы, не касающиеся друг друга"""
+    ships = []
+    for top in xrange(0, size - 3, 5):
+        for left in xrange(0, size - 3, 5):
+            length = rng.randint(1, 4)
+            if rng.random() < 0.5:
+                ships.append([(left + i + 1, top + 1) for i in xrange(length)])
+            else:
+                ships.append([(left + 1, top + i + 1) for i in xrange(length)])
+    return ships
+
+
+def mark_bounds(game_cls, size, rng):
+    ships = _ships(size, rng)
+    g = _game(game_cls, size)
+
+    def run():
+        g.enemy_field = [gm.EMPTY] * size ** 2
+        for ship in ships:
+            for position in ship:
+                g.enemy_field[g.calc_index(position)] = gm.SHIP
+        for ship in ships:
+            g.mark_killed_ship_bounds(ship[-1])
+
+    return run, len(ships)
+
+
+def wounded(game_cls, size, rng):
+    g = _game(game_cls, size)
+    targets = []
+    for _ in xrange(1000):
+        x, y = rng.randint(1, size - 1), rng.randint(1, size - 1)
+        targets.append(rng.choice([[(x, y)], [(x, y), (x + 1, y)], [(x, y), (x, y + 1)]]))
+
+    def run():
+        for ship in targets:
+            g.ship_under_fire = ship
+            g.last_hit = ship[-1]
+            g.hunt_for_wounded()
+
+    return run, len(targets)
+
+
+CASES = [('mark_killed_ship_bounds', mark_bounds, 'ship'), ('hunt_for_wounded', wounded, 'shot')]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 32, 100])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        started = timeit.default_timer()
+        geometry.Geometry(size)
+        print('%sx%s: geometry built in %.1f ms' % (size, size, (timeit.default_timer() - started) * 1000))
+        geometry.get_geometry(size)
+        for name, make, unit in CASES:
+            line = []
+            for game_cls in [LegacyGame, gm.Game]:
+                run, count = make(game_cls, size, random.Random(size))
+                best = min(timeit.repeat(run, number=1, repeat=args.repeat))
+                line.append(best / count * 1e6)
+            print('  %-26s legacy %8.2f us/%s   geometry %8.2f us/%s   %5.2fx' % (
+                name, line[0], unit, line[1], unit, line[0] / line[1]))
+
+
+if __name__ == '__main__':
+    main()
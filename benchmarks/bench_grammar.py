@@ -0,0 +1,123 @@
+# coding: utf-8
+"""
+Грамматика против rasa: какую долю реплик грамматика разбирает сама, насколько
+верно и сколько времени уходит на реплику.
+
+Запуск: python benchmarks/bench_grammar.py [--repeats N] [--model mldata/]
+
+Точность считается на отложенных репликах benchmarks/grammar_heldout.json,
+которых нет в config/intents_config.json: 10 из 40 - обучающие фразы в том виде,
+в каком их присылает Алиса (с заглавными буквами и знаками препинания),
+остальное - другие формулировки хода и ответов. Обучающая выборка печатается
+только как покрытие: фразы грамматики взяты из неё же, так что точность на ней
+ничего не говорит.
+
+Время rasa меряется, только если установлен rasa_nlu и по пути --model есть
+обученная модель. Последние записанные числа (1 CPU, 40 отложенных реплик):
+
+    parser          matched    correct   us/message
+    grammar         19 (48%)   19 of 19  3.1
+    rasa            40 (100%)  25 of 40  1556.3
+    grammar + rasa  40 (100%)  29 of 40  826.2
+
+Модель rasa для этих чисел обучена на config/intents_config.json с пайплайном
+config/nlu_config.yml, но вместо xx_ent_wiki_sm (его нельзя было скачать)
+подключена пустая модель spacy xx со случайными векторами слов выборки.
+Настоящий xx_ent_wiki_sm ещё и прогоняет свой NER на каждой реплике, так что
+время rasa здесь - оценка снизу, а её точность - не та, что у боевой модели.
+"grammar + rasa" - путь DialogManager: грамматика, а что она не узнала - rasa.
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import io
+import json
+import os
+import timeit
+
+from seabattle import grammar
+
+
+HELDOUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'grammar_heldout.json')
+
+
+def _training_examples():
+    with io.open(grammar.INTENTS_CONFIG, encoding='utf-8') as f:
+        return json.load(f)['rasa_nlu_data']['common_examples']
+
+
+def _heldout_examples():
+    with io.open(HELDOUT, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _is_correct(parsed, example):
+    entities = [(e['entity'], grammar.normalize(e['value'])) for e in parsed['entities']]
+    return parsed['intent']['name'] == example['intent'] and \
+        entities == [(e['entity'], grammar.normalize(e['value'])) for e in example['entities']]
+
+
+def accuracy(parse, examples):
+    """(разобрано, из них верно): parse возвращает None, если реплику не узнал"""
+    matched = correct = 0
+    for example in examples:
+        parsed = parse(example['text'])
+        if parsed is None:
+            continue
+        matched += 1
+        if _is_correct(parsed, example):
+            correct += 1
+    return matched, correct
+
+
+def _rasa_parse(model):
+    try:
+        from rasa_nlu.data_router import DataRouter
+        router = DataRouter(model)
+        router.parse(router.extract({'q': 'я хожу 2 10'}))
+    except Exception as e:
+        print('rasa: not measured (%s)' % e)
+        return None
+    return lambda text: router.parse(router.extract({'q': text}))
+
+
+def _fast_path(rasa_parse):
+    def parse(text):
+        parsed = grammar.parse(text)
+        return parsed if parsed is not None else rasa_parse(text)
+    return parse
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeats', type=int, default=100)
+    parser.add_argument('--model', default='mldata/')
+    args = parser.parse_args()
+
+    training = _training_examples()
+    matched, _ = accuracy(grammar.parse, training)
+    print('training examples %s, grammar matched %s (%.0f%%): coverage only, '
+          'the phrases come from this set' % (len(training), matched, 100.0 * matched / len(training)))
+
+    examples = _heldout_examples()
+    texts = [example['text'] for example in examples]
+    print('held-out examples %s' % len(examples))
+
+    parsers = [('grammar', grammar.parse)]
+    rasa_parse = _rasa_parse(args.model)
+    if rasa_parse is not None:
+        parsers += [('rasa', rasa_parse), ('grammar + rasa', _fast_path(rasa_parse))]
+
+    print('%-15s %-10s %-9s %s' % ('parser', 'matched', 'correct', 'us/message'))
+    for name, parse in parsers:
+        matched, correct = accuracy(parse, examples)
+        repeats = args.repeats if name == 'grammar' else max(1, args.repeats // 20)
+        best = min(timeit.repeat(lambda: [parse(text) for text in texts], number=1, repeat=repeats))
+        print('%-15s %-10s %-9s %.1f' % (
+            name, '%s (%.0f%%)' % (matched, 100.0 * matched / len(examples)),
+            '%s of %s' % (correct, matched), best / len(texts) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
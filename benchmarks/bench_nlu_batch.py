@@ -0,0 +1,118 @@
+# coding: utf-8
+"""
+Разбор пачками (nlu_batch) против разбора по одной реплике: пропускная
+способность и задержка при concurrency потоках, которые одновременно ждут rasa.
+
+Запуск: python benchmarks/bench_nlu_batch.py [--concurrency 16] [--requests 2000] [--max-batch 16] [--stub]
+
+Если rasa_nlu не установлен или в mldata/ нет модели (или задан --stub), вместо
+неё работает заглушка: один вызов модели стоит --stub-call мс плюс --stub-text мс
+на реплику, и одновременно модель выполняет только один вызов, как занятый
+процессор.
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import io
+import json
+import threading
+import time
+
+from seabattle import grammar, nlu_batch, simulate
+
+
+class StubRouter(object):
+    def __init__(self, call_ms, text_ms):
+        self.call = call_ms / 1000.0
+        self.text = text_ms / 1000.0
+        self._busy = threading.Lock()
+
+    def extract(self, data):
+        return {'text': data['q']}
+
+    def parse(self, data):
+        return self.parse_many([data])[0]
+
+    def parse_many(self, datas):
+        with self._busy:
+            time.sleep(self.call + self.text * len(datas))
+        return [{'text': data['text']} for data in datas]
+
+
+def _rasa_router():
+    try:
+        from seabattle import nlu
+        from rasa_nlu.data_router import DataRouter
+        router = DataRouter(nlu.MODEL_DIR)
+        nlu._load_interpreters(router)
+        router.parse(router.extract({'q': 'я хожу 2 10'}))
+    except Exception as e:
+        print('rasa: not available (%s), using stub' % e)
+        return None
+    return router
+
+
+def _texts():
+    with io.open(grammar.INTENTS_CONFIG, encoding='utf-8') as f:
+        return [example['text'] for example in json.load(f)['rasa_nlu_data']['common_examples']]
+
+
+def run(router, texts, concurrency, requests):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(number):
+        for i in xrange(requests // concurrency):
+            text = texts[(number + i * concurrency) % len(texts)]
+            started = time.time()
+            router.parse(router.extract({'q': text}))
+            elapsed = time.time() - started
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in xrange(concurrency)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(latencies) / (time.time() - started), latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--max-batch', type=int, default=nlu_batch.DEFAULT_SIZE)
+    parser.add_argument('--stub', action='store_true')
+    parser.add_argument('--stub-call', type=float, default=8.0, help='мс на вызов модели')
+    parser.add_argument('--stub-text', type=float, default=0.5, help='мс на реплику в вызове')
+    args = parser.parse_args()
+
+    router = None if args.stub else _rasa_router()
+    parse_many = None
+    if router is None:
+        router = StubRouter(args.stub_call, args.stub_text)
+        parse_many = router.parse_many
+    texts = _texts()
+
+    variants = [('single', router)]
+    for window_ms in [0, 1, 2, 5]:
+        batching = nlu_batch.BatchingRouter(router, window_ms / 1000.0, args.max_batch, parse_many)
+        variants.append(('batch %s ms' % window_ms, batching))
+
+    print('concurrency %s, requests %s' % (args.concurrency, args.requests))
+    for name, variant in variants:
+        throughput, latencies = run(variant, texts, args.concurrency, args.requests)
+        mean = variant.metrics()['mean'] if name != 'single' else 1.0
+        print('%-12s %7.0f texts/s   p50 %6.1f ms   p99 %6.1f ms   mean batch %.1f' % (
+            name, throughput,
+            simulate.percentile(latencies, 0.5) * 1000,
+            simulate.percentile(latencies, 0.99) * 1000,
+            mean,
+        ))
+
+
+if __name__ == '__main__':
+    main()
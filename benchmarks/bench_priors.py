@@ -0,0 +1,85 @@
+# coding: utf-8
+"""
+Сколько выстрелов до победы экономит статистика расстановок соперника.
+
+Запуск: PYTHONPATH=. python benchmarks/bench_priors.py [--train 2000] [--games 2000] [--seed 1]
+
+Соперники - game.Game с генерацией поля corners (длинные корабли у краёв и
+углов) и uniform. Сначала game.Game доигрывает --train партий против каждого,
+итоги партий проходят через лог (строки события game) и priors.Aggregator, потом
+на других полях те же партии играются без статистики и с ней. Против uniform
+статистика почти ничего не знает и не должна мешать.
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import json
+import timeit
+
+from seabattle import game as gm
+from seabattle import priors
+
+
+class Corners(gm.Game):
+    FIELD_DISTRIBUTION = 'corners'
+
+
+class Uniform(gm.Game):
+    FIELD_DISTRIBUTION = 'uniform'
+
+
+OPPONENTS = [('corners', Corners), ('uniform', Uniform)]
+
+
+def play(opponent_cls, seed, prior_order=None):
+    """Партия game.Game против поля opponent_cls; возвращает игру после победы и число выстрелов"""
+    enemy = opponent_cls(seed)
+    enemy.start_new_game()
+    player = gm.Game(seed + 1)
+    player.start_new_game()
+    player.prior_order = prior_order
+    shots = 0
+    while not player.is_victory():
+        player.do_shot()
+        shots += 1
+        player.handle_enemy_reply(enemy.handle_enemy_shot(player.last_shot_position))
+    return player, shots
+
+
+def train(count, seed):
+    """Строки лога с итогами count партий против каждого соперника"""
+    lines = []
+    for name, opponent_cls in OPPONENTS:
+        for index in xrange(count):
+            player, _ = play(opponent_cls, seed * 1000003 + index * 2)
+            lines.append(json.dumps(dict(priors.record(player, name), event='game'), ensure_ascii=False))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--train', type=int, default=2000)
+    parser.add_argument('--games', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    started = timeit.default_timer()
+    lines = train(args.train, args.seed)
+    aggregator = priors.Aggregator()
+    aggregator.read(lines)
+    table = priors.Priors(aggregator.table())
+    print('%s games aggregated in %.1f s' % (aggregator.stats['games'], timeit.default_timer() - started))
+
+    for name, opponent_cls in OPPONENTS:
+        order = table.order(name, 10)
+        # другие поля, чем при обучении
+        seeds = [(args.seed + 1) * 1000003 + index * 2 for index in xrange(args.games)]
+        without = [play(opponent_cls, seed)[1] for seed in seeds]
+        with_priors = [play(opponent_cls, seed, order)[1] for seed in seeds]
+        print('%-8s top cells %3s   shots to win: without %6.2f   with priors %6.2f' % (
+            name, len(order or ()), float(sum(without)) / len(without), float(sum(with_priors)) / len(with_priors)))
+
+
+if __name__ == '__main__':
+    main()
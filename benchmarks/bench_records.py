@@ -0,0 +1,115 @@
+# coding: utf-8
+"""
+Записи партий: скорость записи, чтения через mmap и переигровки.
+
+Запуск: PYTHONPATH=. python benchmarks/bench_records.py [--games 2000] [--copies 500]
+        PYTHONPATH=. python benchmarks/bench_records.py --records /var/lib/seabattle/records
+
+Без --records партии играет simulate (game.Game против density.Game) в
+записываемую временную директорию. Для чтения сегмент размножается в --copies
+раз, чтобы мерить миллионы записей, не играя их. С --records те же замеры
+идут по записанным боевым партиям: доля точно переигранных партий показывает,
+не поменялись ли решения стратегий, а время переигровки - не стали ли они
+медленнее.
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import os
+import shutil
+import tempfile
+import timeit
+
+from seabattle import records
+from seabattle import simulate
+
+
+def _rate(count, seconds):
+    return '%10.0f records/s' % (count / seconds)
+
+
+def play(directory, games):
+    started = timeit.default_timer()
+    simulate.run_tournament('seabattle.game', 'seabattle.density', games, seed=1, workers=1, record=directory)
+    played = timeit.default_timer() - started
+
+    segment, = records.segments([directory])
+    writer = records.RecordWriter(os.path.join(directory, 'copy'))
+    games_played = [records.replay(record).game for record in segment]
+    started = timeit.default_timer()
+    for game in games_played:
+        writer.append(game)
+    written = timeit.default_timer() - started
+    writer.close()
+    shutil.rmtree(os.path.join(directory, 'copy'))
+    print('played %s games in %.1f s, append %s' % (len(segment), played, _rate(len(segment), written)))
+    return segment.path
+
+
+def multiply(path, copies):
+    """Сегмент из copies копий записей path"""
+    with open(path, 'rb') as f:
+        header = f.read(records.HEADER.size)
+        body = f.read()
+    copied = path + '.copies'
+    with open(copied, 'wb') as f:
+        f.write(header)
+        for _ in xrange(copies):
+            f.write(body)
+    return copied
+
+
+def read(paths):
+    started = timeit.default_timer()
+    segments = list(records.segments(paths))
+    stats = [records.summary(segment.records) for segment in segments]
+    summarized = timeit.default_timer() - started
+    count = sum(item['games'] for item in stats)
+
+    started = timeit.default_timer()
+    shots = 0
+    for record in records.iter_records(paths):
+        shots += record['shots']
+    iterated = timeit.default_timer() - started
+    print('%s records: summary %s, iteration %s' % (count, _rate(count, summarized), _rate(count, iterated)))
+
+
+def replay(paths, limit):
+    exact = diverged = count = 0
+    started = timeit.default_timer()
+    for record in records.iter_records(paths):
+        if count >= limit:
+            break
+        result = records.replay(record)
+        exact += result.exact
+        diverged += result.diverged is not None
+        count += 1
+    elapsed = timeit.default_timer() - started
+    print('replayed %s games: %s, exact %s, diverged %s' % (count, _rate(count, elapsed), exact, diverged))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--games', type=int, default=2000)
+    parser.add_argument('--copies', type=int, default=500)
+    parser.add_argument('--replay', type=int, default=2000, help='сколько записей переиграть')
+    parser.add_argument('--records', nargs='+', default=None, help='сегменты или директории с записями')
+    args = parser.parse_args()
+
+    if args.records:
+        read(args.records)
+        replay(args.records, args.replay)
+        return
+
+    directory = tempfile.mkdtemp()
+    try:
+        path = play(directory, args.games)
+        read([multiply(path, args.copies)])
+        replay([path], args.replay)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+# coding: utf-8
+"""
+Нагрузка на webhook: пропускная способность и перцентили задержки.
+
+    PYTHONPATH=. python benchmarks/bench_server.py http://localhost:5000/ -c 32 -n 5000 --idle 1000
+
+Сравнение Flask, gunicorn и асинхронного сервера: --serve поднимает сервер в
+дочернем процессе с заглушкой вместо rasa (loadtest.StubDataRouter), которая
+отвечает за --stub-nlu мс, и гоняет нагрузку на него:
+
+    PYTHONPATH=. python benchmarks/bench_server.py --serve flask --stub-nlu 30 --rasa-share 0.2
+    PYTHONPATH=. python benchmarks/bench_server.py --serve gunicorn --workers 4 --stub-nlu 30 --rasa-share 0.2
+    PYTHONPATH=. python benchmarks/bench_server.py --serve async --workers 8 --stub-nlu 30 --rasa-share 0.2
+
+flask - это flask run --with-threads, gunicorn - seabattle/gunicorn_config.py
+с --workers синхронными воркерами, async - async_api с --workers потоками.
+Воркерам gunicorn нужны общие сессии, поэтому он работает с SqliteSessionStore
+во временной директории, остальные - с сессиями в памяти.
+
+Каждый из concurrency клиентов играет за своих пользователей: "новая игра", потом
+ходы "я хожу X Y". Доля --rasa-share ходов сказана так ("ну я хожу X Y"), что
+грамматика их не узнаёт и они уходят в rasa. --idle открывает столько
+соединений, которые ничего не шлют, и держит их всё время замера, как медленные
+клиенты.
+
+Замер на одном ядре (-c 32 -n 5000, --stub-nlu 30 --rasa-share 0.2, лучший из трёх по req/s):
+
+    server           idle   req/s    p50 ms   p99 ms   errors
+    flask               0     522      60.0     95.2        0
+    gunicorn -w 4       0     347      88.1    155.9        0
+    async -w 8          0     538      57.4    107.0        0
+    flask             200     443      70.3    116.5        0
+    gunicorn -w 4     200       -         -        -        -
+    async -w 8        200     587      52.6    104.3        0
+
+Без медленных клиентов async и Flask с потоками идут вровень, а gunicorn
+медленнее из-за кодирования сессий в SQLite и четырёх процессов на одном ядре.
+С 200 молчащими соединениями Flask держит поток на каждое и теряет 15%
+пропускной способности, синхронные воркеры gunicorn все ждут молчащих клиентов,
+и замер не заканчивается за 200 с, а async их не замечает.
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import httplib
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import urlparse
+
+import loadtest
+from seabattle import simulate
+
+
+SERVERS = ('flask', 'gunicorn', 'async')
+
+
+def _request(user_id, message_id, text):
+    return {
+        'version': '1.0',
+        'session': {
+            'new': message_id == 0,
+            'message_id': message_id,
+            'session_id': 'bench-%s' % user_id,
+            'skill_id': 'bench',
+            'user_id': user_id,
+        },
+        'request': {
+            'command': text,
+            'original_utterance': text,
+            'type': 'SimpleUtterance',
+        },
+    }
+
+
+def _messages(rng, rasa_share):
+    yield 'новая игра'
+    cells = [(x, y) for x in xrange(1, 11) for y in xrange(1, 11)]
+    rng.shuffle(cells)
+    for x, y in cells:
+        template = 'ну я хожу %s %s' if rng.random() < rasa_share else 'я хожу %s %s'
+        yield template % (x, y)
+
+
+def _client(url, number, requests, rasa_share, latencies, errors, lock):
+    rng = random.Random(number)
+    connection = httplib.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+    user = 0
+    messages = iter([])
+    for message_id in xrange(requests):
+        text = next(messages, None)
+        if text is None:
+            user += 1
+            messages = _messages(rng, rasa_share)
+            text = next(messages)
+
+        body = json.dumps(_request('bench-%s-%s' % (number, user), message_id, text))
+        started = time.time()
+        try:
+            connection.request('POST', url.path or '/', body, {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            ok = response.status == 200
+        except (socket.error, httplib.HTTPException):
+            ok = False
+            connection.close()
+            connection = httplib.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+        elapsed = time.time() - started
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors.append(elapsed)
+
+
+def _serve(kind, port, workers, stub_ms, directory):
+    """Сервер kind на 127.0.0.1:port с заглушкой вместо rasa; работает в дочернем процессе"""
+    os.environ.setdefault('SEABATTLE_LOG_SAMPLE_RATE', '0')
+    if kind == 'gunicorn':
+        os.environ.setdefault('SEABATTLE_SESSION_STORE', 'sqlite://%s' % os.path.join(directory, 'sessions.db'))
+    loadtest.install_stub_nlu(stub_ms)
+    if kind == 'async':
+        from seabattle import async_api
+        async_api.serve('127.0.0.1', port, workers)
+    elif kind == 'gunicorn':
+        from gunicorn.app.base import BaseApplication
+        from seabattle import gunicorn_config
+
+        class Application(BaseApplication):
+            def load_config(self):
+                self.cfg.set('bind', '127.0.0.1:%s' % port)
+                self.cfg.set('workers', workers)
+                self.cfg.set('preload_app', gunicorn_config.preload_app)
+                self.cfg.set('post_fork', gunicorn_config.post_fork)
+                self.cfg.set('loglevel', 'warning')
+
+            def load(self):
+                from seabattle import api
+                return api.app
+
+        Application().run()
+    else:
+        import logging
+        from werkzeug.serving import make_server
+        from seabattle import api
+
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        make_server('127.0.0.1', port, api.app, threaded=True).serve_forever()
+
+
+def _free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def _wait_ready(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = httplib.HTTPConnection(url.hostname, url.port, timeout=5)
+            connection.request('GET', '/ready')
+            if connection.getresponse().status == 200:
+                return
+        except (socket.error, httplib.HTTPException):
+            pass
+        time.sleep(0.1)
+    raise RuntimeError('%s is not ready' % url.geturl())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузка на webhook навыка')
+    parser.add_argument('url', nargs='?', help='адрес запущенного webhook')
+    parser.add_argument('--serve', choices=SERVERS, help='поднять сервер с заглушкой вместо rasa')
+    parser.add_argument('--workers', type=int, default=8, help='воркеры gunicorn или потоки async')
+    parser.add_argument('--stub-nlu', type=float, default=0.0, metavar='MS', help='время ответа заглушки')
+    parser.add_argument('--rasa-share', type=float, default=0.0, help='доля ходов, которые не узнаёт грамматика')
+    parser.add_argument('-c', '--concurrency', type=int, default=32)
+    parser.add_argument('-n', '--requests', type=int, default=5000, help='всего запросов')
+    parser.add_argument('--idle', type=int, default=0, help='открытых соединений без запросов')
+    args = parser.parse_args()
+    if (args.url is None) == (args.serve is None):
+        parser.error('either url or --serve is required')
+
+    server = directory = None
+    if args.serve:
+        port = _free_port()
+        directory = tempfile.mkdtemp()
+        server = multiprocessing.Process(
+            target=_serve, args=(args.serve, port, args.workers, args.stub_nlu, directory))
+        server.start()
+        args.url = 'http://127.0.0.1:%s/' % port
+    url = urlparse.urlparse(args.url)
+    try:
+        if server is not None:
+            _wait_ready(url)
+        run(url, args)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+            shutil.rmtree(directory)
+
+
+def run(url, args):
+    idle = []
+    for _ in xrange(args.idle):
+        idle.append(socket.create_connection((url.hostname, url.port or 80)))
+
+    latencies, errors, lock = [], [], threading.Lock()
+    per_client = args.requests // args.concurrency
+    threads = [
+        threading.Thread(target=_client, args=(url, number, per_client, args.rasa_share, latencies, errors, lock))
+        for number in xrange(args.concurrency)
+    ]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+
+    for sock in idle:
+        sock.close()
+
+    print('%s requests in %.1f s: %.0f req/s, errors %s, idle connections %s' % (
+        len(latencies) + len(errors), elapsed, len(latencies) / elapsed, len(errors), args.idle))
+    if latencies:
+        print('latency p50 %.1f ms, p99 %.1f ms, max %.1f ms' % (
+            simulate.percentile(latencies, 0.5) * 1000,
+            simulate.percentile(latencies, 0.99) * 1000,
+            max(latencies) * 1000,
+        ))
+
+
+if __name__ == '__main__':
+    main()
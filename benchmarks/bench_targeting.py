@@ -0,0 +1,69 @@
+# coding: utf-8
+"""
+Сколько выстрелов нужно стратегии, чтобы потопить все корабли, и сколько стоит один выстрел.
+
+Поля берутся двух видов: из Game.generate_field (корабли жмутся к углам)
+и равномерно случайные (fieldgen с распределением uniform).
+
+Запуск: python benchmarks/bench_targeting.py [число партий] [модуль стратегии ...]
+"""
+
+from __future__ import unicode_literals, print_function
+
+import importlib
+import random
+import sys
+import time
+
+from seabattle import fieldgen, game as gm
+
+
+def play(player, field):
+    defender = gm.Game()
+    defender.start_new_game(field=list(field))
+    player.start_new_game()
+
+    shots = 0
+    spent = 0.0
+    while not player.is_victory():
+        started = time.time()
+        player.do_shot()
+        spent += time.time() - started
+        shots += 1
+        player.handle_enemy_reply(defender.handle_enemy_shot(player.last_shot_position))
+    return shots, spent
+
+
+def corner_field(seed):
+    g = gm.Game(seed)
+    g.start_new_game()
+    return list(g.field)
+
+
+def uniform_field(seed):
+    field = [gm.EMPTY] * 100
+    for ship in fieldgen.generate(10, gm.Game.default_ships, random.Random(seed), 'uniform'):
+        for index in ship:
+            field[index] = gm.SHIP
+    return field
+
+
+def main():
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    modules = sys.argv[2:] or ['seabattle.game', 'seabattle.density']
+
+    for kind, generate in [('corners', corner_field), ('uniform', uniform_field)]:
+        fields = [generate(seed) for seed in xrange(games)]
+
+        for name in modules:
+            module = importlib.import_module(name)
+            results = [play(module.Game(), field) for field in fields]
+            shots = sorted(r[0] for r in results)
+            per_shot = sum(r[1] for r in results) / sum(shots)
+            print('%-8s %-20s mean %.2f shots, median %d, max %d, %.1f us/shot' % (
+                kind, name, float(sum(shots)) / len(shots), shots[len(shots) // 2], shots[-1], per_shot * 1e6,
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,330 @@
+# coding: utf-8
+"""
+Нагрузочный тест webhook'а живыми партиями по протоколу Яндекс.Диалогов.
+
+Каждый виртуальный игрок играет настоящую партию своим полем и своей
+стратегией (seabattle.game): "новая игра", "начинай" или сразу свой ход,
+дальше отвечает на выстрелы навыка "мимо, я хожу X Y" / "ранил" / "убил" по
+своему полю, а после "Ура, победа!" или своей победы начинает новую партию.
+С вероятностью --noise реплика заменяется на вариант, какой выдаёт
+распознавание речи: числа словами, "трень" вместо трёх, лишние слова,
+знаки препинания. Если навык ответил "Не поняла", игрок повторяет реплику
+без шума.
+
+Куда слать запросы:
+    --url http://host:port/   запущенный webhook (api.py или async_api.py)
+    --serve                   поднять api.app в этом же процессе на werkzeug и слать по HTTP
+    без --url и --serve       api.app.test_client(), без сети
+
+--stub-nlu MS подменяет модель rasa заглушкой, которая отвечает за MS мс (по
+умолчанию 0) по ключевым словам. Так меряются игра и обвязка без модели, и
+тест работает без rasa_nlu и без сети. Заглушка работает только в процессе
+теста, то есть без --url.
+
+    PYTHONPATH=. python benchmarks/loadtest.py --stub-nlu 0 -c 8 -n 5000
+    PYTHONPATH=. python benchmarks/loadtest.py --url http://localhost:5000/ -c 32 -n 20000
+
+Отчёт: запросы в секунду и по каждому виду реплики - число, доля ошибок
+(не 200 или сбой соединения), доля ответов "Не поняла" (unclear) и задержка
+p50/p95/p99. Повторы после "Не поняла" считаются отдельно, как retry.
+
+В процессе теста лог ходов (events) выключен: SEABATTLE_LOG_SAMPLE_RATE=0,
+если не задан явно.
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import collections
+import httplib
+import json
+import logging
+import os
+import random
+import re
+import socket
+import threading
+import time
+import urlparse
+
+from seabattle import game as gm
+from seabattle import grammar, simulate
+
+
+SKILL_SHOT = re.compile(r'Я хожу (\d+), (\d+)', re.UNICODE)
+
+HIT_PHRASES = ['ранил', 'ранила', 'ты попала', 'попал']
+KILL_PHRASES = ['убил', 'убила', 'потопил корабль', 'корабль утонул']
+NOISY_HIT_PHRASES = ['ранила!', 'Ты попала.', 'ну ранил', 'как ты попала']
+NOISY_KILL_PHRASES = ['убил!', 'Убила.', 'побил', 'ну потопил корабль']
+NOISY_SHOT_TEMPLATES = ['я хожу в %s %s', 'ну я хожу %s %s', 'я ухожу на %s %s', 'я хожу %s, %s', 'так я хожу %s %s']
+NOISY_MISS_PREFIXES = ['мимо, ', 'Мимо! ', 'мимо. ', '']
+
+
+class StubDataRouter(object):
+    """
+    Заглушка DataRouter: ключевые слова вместо модели. Ходы разбирает
+    grammar.guess, короткие ответы - поиск слов в реплике.
+    """
+
+    KEYWORDS = [
+        ('newgame', ['нов']),
+        ('letsstart', ['начин', 'начни']),
+        ('kill', ['убил', 'потоп', 'утонул', 'побил']),
+        ('hit', ['ранил', 'попал']),
+        ('victory', ['побед']),
+        ('defeat', ['проигр', 'поражен']),
+    ]
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def extract(self, data):
+        return {'text': data['q']}
+
+    def parse(self, data):
+        if self.delay:
+            time.sleep(self.delay)
+        text = grammar.normalize(data['text'])
+        response = grammar.guess(text)
+        if response['intent']['name'] == 'miss':
+            return response
+        for intent, stems in self.KEYWORDS:
+            if any(stem in text for stem in stems):
+                return {'text': text, 'intent': {'name': intent, 'confidence': 0.9}, 'entities': []}
+        return response
+
+
+def install_stub_nlu(delay_ms):
+    """Подставляет заглушку вместо модели до импорта api"""
+    from seabattle import nlu, nlu_cache
+
+    nlu.router = nlu_cache.from_environ(StubDataRouter(delay_ms / 1000.0), nlu.MODEL_DIR)
+    nlu._ready.set()
+
+
+class Player(object):
+    """Виртуальный игрок: по ответу навыка решает, что сказать дальше"""
+
+    def __init__(self, number, rng, noise):
+        self.number = number
+        self.rng = rng
+        self.noise = noise
+        self.games = 0
+        self.message_id = 0
+        self.user_id = None
+        self.game = None
+        self.last = None
+
+    def _new_game(self):
+        self.games += 1
+        self.message_id = 0
+        self.user_id = 'load-%s-%s' % (self.number, self.games)
+        self.game = gm.Game(seed=self.rng.randrange(2 ** 32))
+        self.game.start_new_game(numbers=True)
+        return 'newgame', 'новая игра', 'новая игра'
+
+    def _number(self, value, noisy):
+        if not noisy or self.rng.random() < 0.5:
+            return '%s' % value
+        if value == 3 and self.rng.random() < 0.3:
+            return 'трень'
+        return gm.BaseGame.str_numbers[value - 1]
+
+    def _say(self, intent, clean, noisy):
+        text = self.rng.choice(clean)
+        if self.rng.random() < self.noise:
+            return intent, self.rng.choice(noisy), text
+        return intent, text, text
+
+    def _shoot(self, after_miss):
+        self.game.do_shot()
+        x, y = self.game.last_shot_position
+        clean = ('мимо я хожу %s %s' if after_miss else 'я хожу %s %s') % (x, y)
+        if not self.rng.random() < self.noise:
+            return 'shot', clean, clean
+        template = self.rng.choice(NOISY_SHOT_TEMPLATES)
+        if after_miss:
+            template = self.rng.choice(NOISY_MISS_PREFIXES) + template
+        return 'shot', template % (self._number(x, True), self._number(y, True)), clean
+
+    def _answer_shot(self, position):
+        result = self.game.handle_enemy_shot(position)
+        if result == gm.Messages.MISS:
+            return self._shoot(after_miss=True)
+        if result == gm.Messages.HIT:
+            return self._say('hit', HIT_PHRASES, NOISY_HIT_PHRASES)
+        return self._say('kill', KILL_PHRASES, NOISY_KILL_PHRASES)
+
+    def _next(self, text):
+        if text is None or text.startswith('Пожалуйста') or 'Ура, победа' in text or 'Я проиграла' in text:
+            return self._new_game()
+        if 'Не поняла' in text:
+            # повторяем то же самое, но уже без шума
+            return 'retry', self.last[2], self.last[2]
+        if 'новая игра' in text:
+            if self.rng.random() < 0.5:
+                return self._say('letsstart', ['начинай', 'начинай ходить'], ['Начинай!', 'ну начинай'])
+            return self._shoot(after_miss=False)
+        if 'Ты попала' in text or 'Корабль утонул' in text:
+            self.game.handle_enemy_reply(gm.Messages.HIT if 'Ты попала' in text else gm.Messages.KILL)
+            if self.game.is_victory():
+                return self._say('victory', ['ура победа', 'победа'], ['Ура! Победа!'])
+            return self._shoot(after_miss=False)
+
+        match = SKILL_SHOT.search(text)
+        if match is None:
+            return self._new_game()
+        if text.startswith('Мимо'):
+            self.game.handle_enemy_reply(gm.Messages.MISS)
+        return self._answer_shot((int(match.group(1)), int(match.group(2))))
+
+    def next_message(self, text):
+        """(вид реплики, реплика) в ответ на text навыка; text None - начало партии"""
+        self.last = self._next(text)
+        return self.last[:2]
+
+    def request(self, text):
+        self.message_id += 1
+        return {
+            'version': '1.0',
+            'session': {
+                'new': self.message_id == 1,
+                'message_id': self.message_id,
+                'session_id': self.user_id,
+                'skill_id': 'loadtest',
+                'user_id': self.user_id,
+            },
+            'request': {
+                'command': text,
+                'original_utterance': text,
+                'type': 'SimpleUtterance',
+            },
+        }
+
+
+class HttpTransport(object):
+    def __init__(self, url):
+        self.url = urlparse.urlparse(url)
+        self.connection = None
+
+    def post(self, body):
+        """(код ответа, тело) или (None, None) при сбое соединения"""
+        if self.connection is None:
+            self.connection = httplib.HTTPConnection(self.url.hostname, self.url.port or 80, timeout=60)
+        try:
+            self.connection.request('POST', self.url.path or '/', body, {'Content-Type': 'application/json'})
+            response = self.connection.getresponse()
+            return response.status, response.read()
+        except (socket.error, httplib.HTTPException):
+            self.connection.close()
+            self.connection = None
+            return None, None
+
+
+class InProcessTransport(object):
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def post(self, body):
+        response = self.client.post('/', data=body, content_type='application/json')
+        return response.status_code, response.get_data()
+
+
+def _client(number, args, make_transport, record):
+    rng = random.Random(args.seed + number)
+    player = Player(number, rng, args.noise)
+    transport = make_transport()
+    text = None
+    for _ in xrange(args.requests // args.concurrency):
+        intent, message = player.next_message(text)
+        body = json.dumps(player.request(message))
+        started = time.time()
+        status, data = transport.post(body)
+        elapsed = time.time() - started
+
+        text = None
+        if status == 200:
+            text = json.loads(data)['response']['text']
+        record(intent, elapsed, status == 200, text is not None and 'Не поняла' in text)
+
+
+def _serve(app):
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name='loadtest-server')
+    thread.daemon = True
+    thread.start()
+    return 'http://127.0.0.1:%s/' % server.server_port
+
+
+def report(stats, elapsed):
+    total = sum(len(entry['latencies']) for entry in stats.values())
+    print('%s requests in %.1f s: %.0f req/s' % (total, elapsed, total / elapsed))
+    print('%-10s %7s %8s %8s %9s %9s %9s' % ('intent', 'count', 'errors', 'unclear', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for intent, entry in sorted(stats.items()):
+        latencies = entry['latencies']
+        print('%-10s %7s %7.2f%% %7.2f%% %9.2f %9.2f %9.2f' % (
+            intent, len(latencies),
+            100.0 * entry['errors'] / len(latencies),
+            100.0 * entry['misunderstood'] / len(latencies),
+            simulate.percentile(latencies, 0.5) * 1000,
+            simulate.percentile(latencies, 0.95) * 1000,
+            simulate.percentile(latencies, 0.99) * 1000,
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест webhook навыка')
+    parser.add_argument('--url', help='адрес запущенного webhook')
+    parser.add_argument('--serve', action='store_true', help='поднять api.app в процессе и слать по HTTP')
+    parser.add_argument('--stub-nlu', type=float, metavar='MS', help='заглушка вместо rasa, отвечает за MS мс')
+    parser.add_argument('-c', '--concurrency', type=int, default=8)
+    parser.add_argument('-n', '--requests', type=int, default=5000, help='всего запросов')
+    parser.add_argument('--noise', type=float, default=0.2, help='доля реплик с шумом распознавания')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.url:
+        if args.stub_nlu is not None:
+            parser.error('--stub-nlu works only in-process, without --url')
+        url = args.url
+    else:
+        # лог каждого хода в процессе теста только мешает читать отчёт
+        os.environ.setdefault('SEABATTLE_LOG_SAMPLE_RATE', '0')
+        if args.stub_nlu is not None:
+            install_stub_nlu(args.stub_nlu)
+        from seabattle import api
+        url = _serve(api.app) if args.serve else None
+
+    if url is not None:
+        make_transport = lambda: HttpTransport(url)  # noqa: E731
+    else:
+        make_transport = lambda: InProcessTransport(api.app)  # noqa: E731
+
+    stats = collections.defaultdict(lambda: {'latencies': [], 'errors': 0, 'misunderstood': 0})
+    lock = threading.Lock()
+
+    def record(intent, elapsed, ok, misunderstood):
+        with lock:
+            entry = stats[intent]
+            entry['latencies'].append(elapsed)
+            entry['errors'] += not ok
+            entry['misunderstood'] += misunderstood
+
+    threads = [
+        threading.Thread(target=_client, args=(number, args, make_transport, record))
+        for number in xrange(args.concurrency)
+    ]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report(stats, time.time() - started)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,45 +4,58 @@ from __future__ import unicode_literals
 
 import json
 import logging
-import sys
+import time
 
-from flask import Flask, request
+from flask import Flask, Response, request
 
-from seabattle import dialog_manager as dm
+from seabattle import budget
+from seabattle import events
+from seabattle import metrics
+from seabattle import nlu
+from seabattle import priors
+from seabattle import protocol
 from seabattle import session
 
 
-logging.basicConfig(level=logging.DEBUG)
+events.configure()
+# пул игр здесь не создаём: с preload_app это мастер gunicorn, и его поток и игры
+# не достались бы воркерам. Воркер создаёт пул в post_fork, без gunicorn - первая "новая игра"
+priors.get_priors()
+nlu.start()
 
 app = Flask(__name__)
 log = logging.getLogger(__name__)
 
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Готов ли процесс принимать запросы: модель загружена и прогрета"""
+    if nlu.is_ready():
+        return json.dumps({'ready': True})
+    return json.dumps({'ready': False}), 503
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Метрики процесса для Prometheus"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
 @app.route('/', methods=['POST'])
 def main():
-    log.info('Request: %r', request.json)
-
-    response = {
-        'version': request.json['version'],
-        'session': request.json['session'],
-    }
+    started = time.time()
     json_body = request.json
+    log.debug('Request: %r', json_body)
 
-    user_id = json_body['session']['user_id']
-    session_obj = session.get(user_id)
-    dm_obj = dm.DialogManager(session_obj)
-
-    message = json_body['request']['command'].strip()
-    if not message:
-        message = json_body['request']['original_utterance']
+    user_id, message = protocol.parse_request(json_body)
+    with session.user_lock(user_id):
+        dm_obj, dmresponse = protocol.handle_turn(session.get(user_id), message, budget.Deadline(started=started))
 
-    dmresponse = dm_obj.handle_message(message)
-    response['response'] = {
-        'text': dmresponse.text,
-        'end_session': dmresponse.end_session,
-    }
-    if dmresponse.tts is not None:
-        response['response']['tts'] = dmresponse.tts
+    handled = time.time()
+    response = protocol.build_response(json_body, dmresponse)
+    body = json.dumps(response)
+    response_ms = round((time.time() - handled) * 1000, 3)
 
-    log.info('Response: %r', response)
-    return json.dumps(response)
+    protocol.emit_turn(json_body, dm_obj, user_id, started, response_ms=response_ms)
+    log.debug('Response: %r', response)
+    return body
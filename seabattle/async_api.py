@@ -0,0 +1,170 @@
+# coding: utf-8
+"""
+Webhook для Яндекс.Диалогов на Twisted/Klein (как сервер самого rasa_nlu).
+
+    python -m seabattle.async_api --port 5000 --workers 8
+
+Соединения и разбор JSON живут в реакторе, поэтому один процесс держит тысячи
+открытых соединений с медленными клиентами. Чтение сессии (с
+SqliteSessionStore это запрос к базе), разбор реплики (rasa) и ход игры уходят
+в ограниченный пул потоков: TensorFlow и numpy отпускают GIL, так что потоки
+действительно работают параллельно.
+
+Запросы одного пользователя выстраиваются в очередь ещё в реакторе: следующий
+ход не уйдёт в пул, пока не закончится предыдущий. Запросы разных
+пользователей идут параллельно.
+
+Бюджет хода (budget.Deadline) отсчитывается от получения запроса, так что
+время в очереди к пулу тоже из него вычитается.
+"""
+
+from __future__ import unicode_literals
+
+import argparse
+import json
+import logging
+import time
+
+from klein import Klein
+from twisted.internet import defer, reactor, threads
+from twisted.python.threadpool import ThreadPool
+from twisted.web.server import Site
+
+from seabattle import budget
+from seabattle import events
+from seabattle import metrics
+from seabattle import nlu
+from seabattle import pool
+from seabattle import priors
+from seabattle import protocol
+from seabattle import session
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+
+
+class Server(object):
+    app = Klein()
+
+    def __init__(self, workers=DEFAULT_WORKERS):
+        self.threadpool = ThreadPool(minthreads=1, maxthreads=workers, name='seabattle-turns')
+        self.stats = {
+            'in_flight': 0,
+            'waiting_for_user': 0,
+        }
+        # user_id -> Deferred, который сработает после последнего поставленного хода
+        self._tails = {}
+
+    def start(self):
+        self.threadpool.start()
+        reactor.addSystemEventTrigger('during', 'shutdown', self.threadpool.stop)
+
+    @app.route('/ready', methods=['GET'])
+    def ready(self, request):
+        request.setHeader('Content-Type', 'application/json')
+        if nlu.is_ready():
+            return json.dumps({'ready': True})
+        request.setResponseCode(503)
+        return json.dumps({'ready': False})
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint(self, request):
+        """Метрики процесса для Prometheus, вместе с очередью ходов сервера"""
+        request.setHeader('Content-Type', metrics.CONTENT_TYPE)
+        return metrics.render([
+            ('seabattle_server_in_flight', 'gauge', self.stats['in_flight']),
+            ('seabattle_server_waiting_for_user_total', 'counter', self.stats['waiting_for_user']),
+            ('seabattle_server_users_queued', 'gauge', len(self._tails)),
+        ])
+
+    @app.route('/', methods=['POST'])
+    @defer.inlineCallbacks
+    def main(self, request):
+        started = time.time()
+        json_body = json.loads(request.content.read().decode('utf-8'))
+        log.debug('Request: %r', json_body)
+
+        user_id, message = protocol.parse_request(json_body)
+        self.stats['in_flight'] += 1
+        try:
+            dm_obj, dmresponse, queue_ms = yield self._in_order(
+                user_id, self._turn, user_id, message, budget.Deadline(started=started))
+        finally:
+            self.stats['in_flight'] -= 1
+
+        handled = time.time()
+        response = protocol.build_response(json_body, dmresponse)
+        request.setHeader('Content-Type', 'application/json')
+        body = json.dumps(response)
+        response_ms = round((time.time() - handled) * 1000, 3)
+
+        protocol.emit_turn(json_body, dm_obj, user_id, started, queue_ms=queue_ms, response_ms=response_ms)
+        log.debug('Response: %r', response)
+        defer.returnValue(body)
+
+    def _in_order(self, user_id, func, *args):
+        """Вызывает func после того, как закончились все ранее поставленные ходы пользователя"""
+        previous = self._tails.get(user_id)
+        finished = self._tails[user_id] = defer.Deferred()
+
+        if previous is None:
+            result = defer.maybeDeferred(func, *args)
+        else:
+            self.stats['waiting_for_user'] += 1
+            result = defer.Deferred()
+            result.addCallback(lambda _: func(*args))
+            previous.addCallback(result.callback)
+
+        def release(value):
+            if self._tails.get(user_id) is finished:
+                del self._tails[user_id]
+            finished.callback(None)
+            return value
+
+        return result.addBoth(release)
+
+    def _turn(self, user_id, message, deadline):
+        dispatched = time.time()
+        return threads.deferToThreadPool(
+            reactor, self.threadpool, _handle, user_id, message, deadline, dispatched)
+
+
+def _handle(user_id, message, deadline, dispatched):
+    queue_ms = round((time.time() - dispatched) * 1000, 3)
+    # ходы пользователя уже упорядочены реактором; замок защищает от других
+    # потоков и процессов, которые работают с теми же сессиями. Сессию читаем
+    # тоже здесь: с SqliteSessionStore это чтение из базы, реактор его ждать не должен
+    with session.user_lock(user_id):
+        dm_obj, dmresponse = protocol.handle_turn(session.get(user_id), message, deadline)
+    return dm_obj, dmresponse, queue_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Асинхронный webhook навыка')
+    parser.add_argument('--host', default='::')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help='потоки для разбора реплик и ходов игры')
+    parser.add_argument('--backlog', type=int, default=1024)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.backlog)
+
+
+def serve(host='::', port=5000, workers=DEFAULT_WORKERS, backlog=1024):
+    """Загружает модель и обслуживает запросы, пока реактор не остановят"""
+    events.configure()
+    pool.get_pool()
+    priors.get_priors()
+    nlu.start()
+
+    server = Server(workers)
+    server.start()
+    reactor.listenTCP(port, Site(server.app.resource()), backlog=backlog, interface=host)
+    log.info('Listening on [%s]:%s with %s workers', host, port, workers)
+    reactor.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+from seabattle import game
+from seabattle.game import EMPTY, SHIP, BLOCKED, HIT, MISS, Messages
+
+
+STATES = (EMPTY, SHIP, BLOCKED, HIT, MISS)
+
+_masks_cache = {}
+
+
+class Masks(object):
+    """Неизменяемые маски строк и столбцов для поля заданного размера"""
+
+    def __init__(self, size):
+        self.size = size
+        self.full = (1 << size ** 2) - 1
+        self.rows = [((1 << size) - 1) << (y * size) for y in xrange(size)]
+        self.cols = [sum(1 << (y * size + x) for y in xrange(size)) for x in xrange(size)]
+        self.not_first_col = self.full & ~self.cols[0] if size else 0
+        self.not_last_col = self.full & ~self.cols[-1] if size else 0
+
+    def dilate(self, mask):
+        """Расширяет маску на все 8 соседних клеток"""
+        line = mask | ((mask << 1) & self.not_first_col) | ((mask >> 1) & self.not_last_col)
+        return (line | (line << self.size) | (line >> self.size)) & self.full
+
+
+def get_masks(size):
+    masks = _masks_cache.get(size)
+    if masks is None:
+        masks = _masks_cache[size] = Masks(size)
+    return masks
+
+
+def iter_bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _run(bit, occupied, step):
+    """Непрерывный отрезок занятых клеток вдоль линии, содержащий bit"""
+    run = cell = bit
+    while True:
+        cell <<= step
+        if not cell & occupied:
+            break
+        run |= cell
+    cell = bit
+    while True:
+        cell >>= step
+        if not cell & occupied:
+            break
+        run |= cell
+    return run
+
+
+class BitBoard(object):
+    """
+    Поле в виде битовых масок, по одной на каждое состояние клетки.
+
+    Ведёт себя как список состояний (индексация, срезы, сравнение со списком),
+    поэтому код, написанный для списков, продолжает работать.
+    """
+
+    __hash__ = None
+
+    def __init__(self, size, cells=None):
+        self.size = size
+        self.masks = get_masks(size)
+        self.states = [0] * len(STATES)
+        if cells is None:
+            self.states[EMPTY] = self.masks.full
+        else:
+            for index, state in enumerate(cells):
+                self.states[state] |= 1 << index
+        self._ships = None
+
+    def __len__(self):
+        return self.size ** 2
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._get(i) for i in xrange(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('BitBoard index out of range: %s' % index)
+        return self._get(index)
+
+    def __setitem__(self, index, state):
+        self.set(index, state)
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self._get(index)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'BitBoard(%s, %r)' % (self.size, list(self))
+
+    def _get(self, index):
+        bit = 1 << index
+        for state in STATES:
+            if self.states[state] & bit:
+                return state
+
+    def set(self, index, state):
+        self.fill(1 << index, state)
+
+    def fill(self, mask, state):
+        """Переводит все клетки маски в состояние state"""
+        occupied = self.states[SHIP] | self.states[HIT]
+        for other in STATES:
+            if other != state:
+                self.states[other] &= ~mask
+        self.states[state] |= mask
+
+        # подбитие палубы не меняет границ кораблей, остальные изменения сбрасывают кэш
+        if occupied != self.states[SHIP] | self.states[HIT]:
+            self._ships = None
+
+    def ship_mask(self, index):
+        """Маска корабля (целые и подбитые палубы), которому принадлежит клетка"""
+        if self._ships is None:
+            self._ships = self._index_ships()
+        return self._ships.get(index, 0)
+
+    def _index_ships(self):
+        ships = {}
+        occupied = self.states[SHIP] | self.states[HIT]
+        for index in iter_bits(occupied):
+            if index in ships:
+                continue
+            bit = 1 << index
+            ship = (
+                _run(bit, occupied & self.masks.rows[index // self.size], 1) |
+                _run(bit, occupied & self.masks.cols[index % self.size], self.size)
+            )
+            for cell in iter_bits(ship):
+                ships[cell] = ship
+        return ships
+
+    def is_dead_ship(self, index):
+        return not self.ship_mask(index) & self.states[SHIP]
+
+    def flood(self, index, state):
+        """Маска 8-связной области клеток состояния state, содержащей index"""
+        area = 1 << index
+        allowed = self.states[state]
+        while True:
+            grown = (self.masks.dilate(area) & allowed) | area
+            if grown == area:
+                return area
+            area = grown
+
+
+class Game(game.Game):
+    """Та же стратегия, что и в game.Game, но поля хранятся в битовых масках"""
+
+    @property
+    def field(self):
+        return self._field
+
+    @field.setter
+    def field(self, value):
+        self._field = value if isinstance(value, BitBoard) else BitBoard(self.size, value)
+
+    @property
+    def enemy_field(self):
+        return self._enemy_field
+
+    @enemy_field.setter
+    def enemy_field(self, value):
+        self._enemy_field = value if isinstance(value, BitBoard) else BitBoard(self.size, value)
+
+    def resolve_enemy_shot(self, index):
+        board = self._field
+        states = board.states
+        bit = 1 << index
+
+        if states[SHIP] & bit:
+            # SHIP -> HIT не меняет границ кораблей, поэтому минуем fill и его сброс кэша
+            states[SHIP] ^= bit
+            states[HIT] |= bit
+
+            if not board.ship_mask(index) & states[SHIP]:
+                self.ships_count -= 1
+                return Messages.KILL
+            else:
+                return Messages.HIT
+        elif states[HIT] & bit:
+            return Messages.KILL if not board.ship_mask(index) & states[SHIP] else Messages.HIT
+        else:
+            return Messages.MISS
+
+    def is_dead_ship(self, last_index):
+        return self.field.is_dead_ship(last_index)
+
+    def mark_killed_ship_bounds(self, position):
+        enemy_field = self.enemy_field
+        ship = enemy_field.flood(self.calc_index(position), SHIP)
+        halo = enemy_field.masks.dilate(ship) & ~enemy_field.states[SHIP]
+        enemy_field.fill(halo, MISS)
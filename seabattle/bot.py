@@ -8,20 +8,23 @@ import os
 from telegram import ext as telegram_ext
 
 from seabattle import dialog_manager as dm
+from seabattle import events
+from seabattle import nlu
 from seabattle import session
 
 
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.DEBUG
-)
+events.configure()
+nlu.start()
 logger = logging.getLogger(__name__)
 
 
 def bot_handler(bot, update):
-    session_obj = session.get(update.message.chat_id)
-    dm_obj = dm.DialogManager(session_obj)
-    dmresponse = dm_obj.handle_message(update.message.text)
+    with session.user_lock(update.message.chat_id):
+        session_obj = session.get(update.message.chat_id)
+        dm_obj = dm.DialogManager(session_obj)
+        dmresponse = dm_obj.handle_message(update.message.text)
+        session.save(session_obj)
+    events.emit('turn', dict(dm_obj.event, user_id=update.message.chat_id))
     bot.send_message(chat_id=update.message.chat_id, text=dmresponse.text)
 
 
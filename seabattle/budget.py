@@ -0,0 +1,182 @@
+# coding: utf-8
+"""
+Бюджет времени на ход.
+
+Алиса ждёт ответа webhook'а ограниченное время: опоздавший ответ отбрасывается,
+и пользователь слышит ошибку. Поэтому в начале запроса заводится Deadline, и он
+передаётся через DialogManager в разбор реплики и в выбор выстрела. Каждая
+стадия получает свою долю бюджета (Deadline.stage) и, если время вышло,
+отвечает тем, что успела, а не работает до конца:
+
+    разбор rasa     идёт в потоке Workers, ждём его не дольше своей доли;
+                    не дождались - грубый разбор grammar.guess или "не поняла"
+    выбор выстрела  density.Game считает карту плотности по длинам кораблей и
+                    при исчерпании бюджета стреляет по уже посчитанной части
+
+Вызов, который простоял в очереди Workers до своего дедлайна, не выполняется:
+его результат уже никто не ждёт, а очередь за ним только растёт.
+
+Промахи дедлайна и деградации считаются в stats (metrics()).
+
+Настройки берутся из окружения:
+    SEABATTLE_TURN_BUDGET_MS  бюджет на ход от получения запроса, по умолчанию 1500 мс
+    SEABATTLE_NLU_SHARE       доля бюджета на разбор реплики, по умолчанию 0.6
+    SEABATTLE_NLU_THREADS     потоки для разбора с дедлайном, по умолчанию 4
+"""
+
+from __future__ import unicode_literals
+
+import errno
+import os
+import Queue
+import select
+import threading
+import time
+
+
+DEFAULT_BUDGET_MS = 1500
+DEFAULT_NLU_SHARE = 0.6
+DEFAULT_THREADS = 4
+
+BUDGET = float(os.environ.get('SEABATTLE_TURN_BUDGET_MS', DEFAULT_BUDGET_MS)) / 1000
+NLU_SHARE = float(os.environ.get('SEABATTLE_NLU_SHARE', DEFAULT_NLU_SHARE))
+
+stats = {
+    'turns': 0,
+    'missed': 0,
+    'nlu_timeouts': 0,
+    'nlu_guessed': 0,
+    'shots_cut': 0,
+    'calls_dropped': 0,
+}
+_stats_lock = threading.Lock()
+
+_workers = None
+_workers_pid = None
+_workers_lock = threading.Lock()
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def count(key):
+    with _stats_lock:
+        stats[key] += 1
+
+
+def metrics():
+    with _stats_lock:
+        return dict(stats)
+
+
+class Deadline(object):
+    """Момент, к которому ход должен быть готов: started + budget секунд"""
+
+    def __init__(self, budget=None, started=None, clock=time.time):
+        self.budget = BUDGET if budget is None else budget
+        self.clock = clock
+        self.started = clock() if started is None else started
+        self.at = self.started + self.budget
+
+    def remaining(self):
+        return max(0.0, self.at - self.clock())
+
+    def expired(self):
+        return self.clock() >= self.at
+
+    def stage(self, share):
+        """Дедлайн стадии, которой отведена доля share бюджета от начала хода"""
+        return Deadline(self.budget * share, self.started, self.clock)
+
+
+class _Call(object):
+    """
+    Вызов в очереди Workers.
+
+    В Python 2 Event.wait и Condition.wait с таймаутом опрашивают флаг в цикле
+    со сном, поэтому готовность вызова передаётся через pipe: вызывающий ждёт
+    его в select, который спит до записи или таймаута. Читающий конец
+    закрывает вызывающий, пишущий - поток, выполнивший вызов.
+    """
+
+    def __init__(self, deadline, func, args):
+        self.deadline = deadline
+        self.func = func
+        self.args = args
+        self.ready, self.notify = os.pipe()
+        self.result = None
+        self.error = None
+
+    def finish(self):
+        try:
+            os.write(self.notify, b'.')
+        except OSError:
+            # вызывающий уже не дождался и закрыл свой конец
+            pass
+        finally:
+            os.close(self.notify)
+
+    def wait(self):
+        """Дождаться вызова не дольше дедлайна; True, если он готов"""
+        try:
+            while True:
+                try:
+                    ready, _, _ = select.select([self.ready], [], [], self.deadline.remaining())
+                    return bool(ready)
+                except select.error as e:
+                    if e.args[0] != errno.EINTR:
+                        raise
+        finally:
+            os.close(self.ready)
+
+
+class Workers(object):
+    """
+    Потоки для стадий с дедлайном. call ждёт результата не дольше дедлайна;
+    опоздавший вызов доработает в своём потоке, но его результат никто не ждёт.
+    Вызов, чей дедлайн истёк ещё в очереди, поток пропускает.
+    """
+
+    def __init__(self, count=DEFAULT_THREADS, name='seabattle-budget'):
+        self.queue = Queue.Queue()
+        self.threads = []
+        for number in xrange(count):
+            thread = threading.Thread(target=self._work_forever, name='%s-%s' % (name, number))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def _work_forever(self):
+        while True:
+            call = self.queue.get()
+            if call.deadline.expired():
+                count('calls_dropped')
+                call.error = DeadlineExceeded()
+            else:
+                try:
+                    call.result = call.func(*call.args)
+                except Exception as e:
+                    call.error = e
+            call.finish()
+
+    def call(self, deadline, func, *args):
+        """func(*args) или DeadlineExceeded, если он не успел к deadline"""
+        call = _Call(deadline, func, args)
+        self.queue.put(call)
+        if not call.wait():
+            raise DeadlineExceeded()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+def get_workers():
+    """Общие на процесс потоки; после форка создаются заново, как и пул игр"""
+    global _workers, _workers_pid
+    if _workers is None or _workers_pid != os.getpid():
+        with _workers_lock:
+            if _workers is None or _workers_pid != os.getpid():
+                _workers = Workers(int(os.environ.get('SEABATTLE_NLU_THREADS', DEFAULT_THREADS)))
+                _workers_pid = os.getpid()
+    return _workers
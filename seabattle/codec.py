@@ -0,0 +1,313 @@
+# coding: utf-8
+"""
+Компактное бинарное представление игры.
+
+Формат (версия 4, little-endian):
+
+    заголовок   'SB', версия, тип игры (KINDS)
+    BaseGame    размер поля, seed, numbers, счётчики кораблей, длины кораблей,
+                своё поле и поле соперника по байту на клетку, последние выстрелы
+    random      сколько 32-битных слов генератор self.rng выдал после засева
+                seed и сохранённое значение gauss; до версии 4 здесь всё
+                состояние Mersenne Twister (625 слов, 2.5 КБ)
+    Game        базовая точка, режим стрельбы, раненый корабль, оставшиеся
+                корабли соперника, ещё не выбранные клетки карт стрельбы
+                (maps) битовыми масками и кандидаты текущей карты (targets) в
+                порядке RandomSet; в версии 1 кандидатов нет, их соберут заново
+    журнал      ходы партии (BaseGame.journal) и время выбора своих выстрелов;
+                до версии 3 журнала нет, такая партия не записывается в records
+    density     неизвестные клетки битовой маской и живые расстановки по длинам
+                (np.packbits); карта плотности heat по ним пересчитывается
+
+Позиция (x, y) хранится как индекс клетки + 1, 0 означает None.
+
+Сами карты стрельбы общие для всех партий с той же базовой точкой (см.
+Game.maps) и после decode берутся оттуда же.
+"""
+
+from __future__ import unicode_literals
+
+import array
+import random
+import struct
+
+import numpy as np
+
+from seabattle import bitboard, density, game, placements, randomset
+
+
+MAGIC = b'SB'
+VERSION = 4
+# версии, которые читает decode
+READABLE = (1, 2, 3, 4)
+NO_TARGETS = 0xFF
+NO_JOURNAL = 0xFFFF
+
+# тип игры в заголовке -> класс; новые стратегии добавляются в конец
+KINDS = [game.Game, bitboard.Game, density.Game]
+
+_HEADER = struct.Struct(str('<2sBB'))
+_BASE = struct.Struct(str('<BIBBBBHH'))
+_RNG = struct.Struct(str('<IBd'))
+_RNG_STATE = struct.Struct(str('<B625IBd'))
+# слов в состоянии Mersenne Twister: генератор перемешивает их все разом, когда
+# выданы все предыдущие
+_MT_WORDS = 624
+# дальше encode не ищет: партия за всю игру вынимает из генератора не больше
+# пары сотен слов, то есть меньше одного перемешивания
+MAX_RNG_TWISTS = 64
+# по стольким первым словам rng_words узнаёт уже посчитанное перемешивание
+_TWIST_MARK = 4
+_GAME = struct.Struct(str('<HBBHBBBB'))
+
+_NUMBERS = [None, False, True]
+_MESSAGES = [game.MISS, game.Messages.MISS, game.Messages.HIT, game.Messages.KILL]
+
+
+class CodecError(Exception):
+    pass
+
+
+def _position(game_obj, position):
+    return game_obj.calc_index(position) + 1 if position is not None else 0
+
+
+def _from_position(game_obj, value):
+    return game_obj.calc_position(value - 1) if value else None
+
+
+def _mask_bytes(size, indexes):
+    bits = np.zeros(size ** 2, dtype=bool)
+    bits[indexes] = True
+    return np.packbits(bits).tostring()
+
+
+def _field_bytes(field):
+    if not isinstance(field, bitboard.BitBoard):
+        return bytes(bytearray(field))
+    # у битового поля обходим только занятые клетки каждого состояния
+    cells = bytearray(len(field))
+    for state, mask in enumerate(field.states):
+        if state != game.EMPTY:
+            for index in bitboard.iter_bits(mask):
+                cells[index] = state
+    return bytes(cells)
+
+
+def _mask_length(size):
+    return (size ** 2 + 7) // 8
+
+
+def _twists(key, seed):
+    """Сколько раз генератор перемешал слова после random.Random(seed)"""
+    replay = random.Random(seed)
+    if replay.getstate()[1] == key:
+        return 0
+    for twists in xrange(1, MAX_RNG_TWISTS + 1):
+        replay.getrandbits(32 * _MT_WORDS)
+        if replay.getstate()[1][:-1] == key[:-1]:
+            return twists
+    raise CodecError('Generator state is not reachable from the seed')
+
+
+def rng_words(rng, seed):
+    """
+    Сколько 32-битных слов выдал rng после random.Random(seed). Позиция в
+    текущем наборе слов хранится в самом состоянии, а число перемешиваний
+    находится повторным засевом и запоминается в rng до следующего
+    перемешивания: между ходами оно почти никогда не меняется.
+    """
+    key = rng.getstate()[1]
+    known = getattr(rng, '_codec_twists', None)
+    if known is None or known[1] != key[:_TWIST_MARK]:
+        known = rng._codec_twists = (_twists(key, seed), key[:_TWIST_MARK])
+    return _MT_WORDS * (known[0] - 1) + key[-1] if known[0] else 0
+
+
+def _seeded_rng(seed, words, gauss):
+    rng = random.Random(seed)
+    if words:
+        # getrandbits(32 * n) вынимает из генератора ровно n слов
+        rng.getrandbits(32 * words)
+    rng.gauss_next = gauss
+    key = rng.getstate()[1]
+    rng._codec_twists = ((words - 1) // _MT_WORDS + 1 if words else 0, key[:_TWIST_MARK])
+    return rng
+
+
+def _unpack_bits(data, count):
+    return np.unpackbits(np.frombuffer(data, dtype=np.uint8))[:count].astype(bool)
+
+
+def encode(game_obj):
+    """Игра -> bytes"""
+    try:
+        kind = KINDS.index(type(game_obj))
+    except ValueError:
+        raise CodecError('Unsupported game class: %s' % type(game_obj).__name__)
+
+    size = game_obj.size
+    chunks = [
+        _HEADER.pack(MAGIC, VERSION, kind),
+        _BASE.pack(
+            size,
+            game_obj.seed,
+            _NUMBERS.index(game_obj.numbers),
+            game_obj.ships_count,
+            game_obj.enemy_ships_count,
+            len(game_obj.ships),
+            _position(game_obj, game_obj.last_shot_position),
+            _position(game_obj, game_obj.last_enemy_shot_position),
+        ),
+        bytes(bytearray(game_obj.ships)),
+        _field_bytes(game_obj.field),
+        _field_bytes(game_obj.enemy_field),
+    ]
+
+    gauss = game_obj.rng.gauss_next
+    chunks.append(_RNG.pack(rng_words(game_obj.rng, game_obj.seed), gauss is not None, gauss or 0.0))
+
+    chunks.append(_GAME.pack(
+        _position(game_obj, game_obj._base_point),
+        _MESSAGES.index(game_obj.last_shout_message),
+        game_obj.wounded_ship,
+        _position(game_obj, game_obj.last_hit),
+        game_obj.state,
+        game_obj.hits,
+        len(game_obj.enemy_ships),
+        len(game_obj.ship_under_fire),
+    ))
+    for length, count in sorted(game_obj.enemy_ships.items()):
+        chunks.append(struct.pack(str('<Bb'), length, count))
+    for point in game_obj.ship_under_fire:
+        chunks.append(struct.pack(str('<H'), _position(game_obj, point)))
+    chunks.append(struct.pack(str('<B'), len(game_obj.maps)))
+    for cells, consumed in zip(game_obj.maps, game_obj.consumed):
+        chunks.append(_mask_bytes(size, [index for index in cells if not consumed >> index & 1]))
+    if game_obj.targets is None:
+        chunks.append(struct.pack(str('<BH'), NO_TARGETS, 0))
+    else:
+        chunks.append(struct.pack(str('<BH'), game_obj.targets_state, len(game_obj.targets)))
+        chunks.append(struct.pack(str('<%sH' % len(game_obj.targets)), *game_obj.targets))
+    for words in [game_obj.journal, game_obj.shot_timings]:
+        if words is None:
+            chunks.append(struct.pack(str('<H'), NO_JOURNAL))
+        else:
+            chunks.append(struct.pack(str('<H%sH' % len(words)), len(words), *words))
+
+    if isinstance(game_obj, density.Game):
+        chunks.append(np.packbits(game_obj.unknown).tostring())
+        chunks.append(struct.pack(str('<B'), len(game_obj.alive)))
+        for length, alive in sorted(game_obj.alive.items()):
+            chunks.append(struct.pack(str('<B'), length))
+            chunks.append(np.packbits(alive).tostring())
+
+    return b''.join(chunks)
+
+
+class _Reader(object):
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def take(self, count):
+        chunk = self.data[self.offset:self.offset + count]
+        if len(chunk) != count:
+            raise CodecError('Truncated game state')
+        self.offset += count
+        return chunk
+
+    def unpack(self, fmt):
+        if isinstance(fmt, struct.Struct):
+            return fmt.unpack(self.take(fmt.size))
+        return struct.unpack(str(fmt), self.take(struct.calcsize(str(fmt))))
+
+
+def decode(data):
+    """bytes -> игра того же класса и в том же состоянии"""
+    reader = _Reader(data)
+    magic, version, kind = reader.unpack(_HEADER)
+    if magic != MAGIC:
+        raise CodecError('Not a game state')
+    if version not in READABLE:
+        raise CodecError('Unsupported game state version: %s' % version)
+    if kind >= len(KINDS):
+        raise CodecError('Unknown game kind: %s' % kind)
+
+    size, seed, numbers, ships_count, enemy_ships_count, ships, last_shot, last_enemy_shot = reader.unpack(_BASE)
+    # __init__ не только засевает генератор, но и заводит атрибуты новой партии;
+    # все они выставляются ниже
+    game_obj = KINDS[kind].__new__(KINDS[kind])
+    game_obj.seed = seed
+    game_obj.size = size
+    game_obj.numbers = _NUMBERS[numbers]
+    game_obj.ships_count = ships_count
+    game_obj.enemy_ships_count = enemy_ships_count
+    game_obj.ships = list(bytearray(reader.take(ships)))
+    game_obj.field = list(bytearray(reader.take(size ** 2)))
+    game_obj.enemy_field = list(bytearray(reader.take(size ** 2)))
+    game_obj.last_shot_position = _from_position(game_obj, last_shot)
+    game_obj.last_enemy_shot_position = _from_position(game_obj, last_enemy_shot)
+
+    if version >= 4:
+        words, has_gauss, gauss = reader.unpack(_RNG)
+        game_obj.rng = _seeded_rng(seed, words, gauss if has_gauss else None)
+    else:
+        rng = reader.unpack(_RNG_STATE)
+        game_obj.rng = random.Random.__new__(random.Random)
+        game_obj.rng.setstate((rng[0], tuple(rng[1:626]), rng[627] if rng[626] else None))
+
+    base_point, message, wounded, last_hit, state, hits, enemy_ships, under_fire = reader.unpack(_GAME)
+    game_obj._base_point = _from_position(game_obj, base_point)
+    game_obj._base_diagonally = None
+    game_obj._base_axis = None
+    game_obj.last_shout_message = _MESSAGES[message]
+    game_obj.wounded_ship = bool(wounded)
+    game_obj.last_hit = _from_position(game_obj, last_hit)
+    game_obj.state = state
+    game_obj.hits = hits
+    game_obj.enemy_ships = dict(reader.unpack('<Bb') for _ in xrange(enemy_ships))
+    game_obj.ship_under_fire = [
+        _from_position(game_obj, reader.unpack('<H')[0]) for _ in xrange(under_fire)
+    ]
+    maps, = reader.unpack('<B')
+    if maps != len(game_obj.maps):
+        raise CodecError('Shot maps do not match the base point')
+    game_obj.consumed = []
+    for cells in game_obj.maps:
+        left = _unpack_bits(reader.take(_mask_length(size)), size ** 2)
+        consumed = 0
+        for index in cells:
+            if not left[index]:
+                consumed |= 1 << index
+        game_obj.consumed.append(consumed)
+    game_obj.targets = game_obj.targets_state = None
+    if version >= 2:
+        state, count = reader.unpack('<BH')
+        if state != NO_TARGETS:
+            game_obj.targets_state = state
+            game_obj.targets = randomset.RandomSet(size ** 2, reader.unpack('<%sH' % count))
+    game_obj.journal = game_obj.shot_timings = None
+    if version >= 3:
+        journal = []
+        for _ in xrange(2):
+            count, = reader.unpack('<H')
+            journal.append(array.array(str('H'), reader.unpack('<%sH' % count)) if count != NO_JOURNAL else None)
+        game_obj.journal, game_obj.shot_timings = journal
+
+    if isinstance(game_obj, density.Game):
+        table = placements.get_table(size)
+        game_obj.unknown = _unpack_bits(reader.take(_mask_length(size)), size ** 2)
+        game_obj.alive = {}
+        game_obj.heat = {}
+        lengths, = reader.unpack('<B')
+        for _ in xrange(lengths):
+            length, = reader.unpack('<B')
+            cover = table.cover(length)
+            alive = _unpack_bits(reader.take((len(cover) + 7) // 8), len(cover))
+            game_obj.alive[length] = alive
+            game_obj.heat[length] = game_obj.placement_heat(length, alive)
+
+    if reader.offset != len(data):
+        raise CodecError('Trailing bytes after game state')
+    return game_obj
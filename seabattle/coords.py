@@ -0,0 +1,141 @@
+# coding: utf-8
+"""
+Разбор координат хода соперника ("7 10", "восемь четыре", "д 5", "k2").
+
+Раньше Game.convert_to_position на каждый ход перебирал регулярные выражения
+и искал слова линейно в str_numbers. PositionParser один раз строит таблицу
+всех допустимых написаний половины координаты: цифры, числительные, буквы
+(кириллица и латиница, как её превращает translit) и поправки STT из
+letters_mapping. Разбор реплики - это разбиение на слова и два поиска в словаре.
+Чисел вне таблицы ("0", "15") не бывает: такая координата не разбирается.
+
+Числительное, которого нет в таблице, ищется с точностью до одной опечатки
+(пропущенная, лишняя, заменённая или переставленная буква: "читыре",
+"восем", "шесьт"). Для этого в таблице заранее лежат все варианты слов без
+одной буквы. Короткие слова ("два", "три") опечаток не прощают: на таком
+расстоянии от них слишком много посторонних слов.
+
+Реплики повторяются (у Алисы в основном ходят цифрами), поэтому результат
+разбора, в том числе неудачного, запоминается целиком. Память ограничена
+MEMO_SIZE репликами и при переполнении сбрасывается.
+"""
+
+from __future__ import unicode_literals
+
+import re
+import string
+
+from transliterate import translit
+
+
+MEMO_SIZE = 4096
+# самое короткое числительное, в котором исправляем опечатку
+FUZZY_MIN_LENGTH = 4
+
+_GLUED = re.compile(r'^([a-zа-я]+)(\d+)$', re.UNICODE)  # a1, д10
+_PUNCTUATION = re.compile(r'[^\w\s]+', re.UNICODE)
+
+
+def _deletions(word):
+    return set(word[:i] + word[i + 1:] for i in xrange(len(word)))
+
+
+class PositionParser(object):
+    """Таблица написаний координат и разбор реплики по ней"""
+
+    def __init__(self, letters, numbers, mapping, memo_size=MEMO_SIZE):
+        self.memo_size = memo_size
+        self.stats = {
+            'parsed': 0,
+            'failed': 0,
+            'fuzzy': 0,
+            'memo_hits': 0,
+        }
+        self._memo = {}
+
+        # написание -> значение; буквы годятся только для первой половины
+        self.numbers = {}
+        for value, word in enumerate(numbers, 1):
+            self.numbers[word] = value
+            self.numbers['%d' % value] = value
+            self.numbers['%02d' % value] = value
+        self.letters = {}
+        for value, letter in enumerate(letters, 1):
+            self.letters[letter] = value
+        for latin in list(string.ascii_lowercase) + ['zh']:
+            letter = translit(latin, 'ru')
+            if letter in self.letters:
+                self.letters.setdefault(latin, self.letters[letter])
+
+        # особые случаи неправильного распознавания STT
+        for word, target in mapping.items():
+            if target in self.numbers:
+                self.numbers[word] = self.numbers[target]
+            elif target in self.letters:
+                self.letters[word] = self.letters[target]
+
+        # вариант слова без одной буквы -> значения; два варианта совпадают,
+        # если слова отличаются не больше чем одной правкой
+        self._fuzzy = {}
+        for word, value in self.numbers.items():
+            if len(word) >= FUZZY_MIN_LENGTH and not word.isdigit():
+                for variant in _deletions(word) | {word}:
+                    self._fuzzy.setdefault(variant, set()).add(value)
+
+    def number(self, bit):
+        value = self.numbers.get(bit)
+        if value is not None:
+            return value
+        if len(bit) < FUZZY_MIN_LENGTH - 1:
+            return None
+        values = set()
+        for variant in _deletions(bit) | {bit}:
+            values |= self._fuzzy.get(variant, set())
+        if len(values) == 1:
+            self.stats['fuzzy'] += 1
+            return values.pop()
+        return None
+
+    def letter(self, bit):
+        value = self.letters.get(bit)
+        if value is not None:
+            return value
+        return self.number(bit)
+
+    def parse(self, text):
+        """(x, y) из реплики; ValueError, если разобрать нельзя"""
+        result = self._memo.get(text)
+        if result is None:
+            result = self._parse(text)
+            if len(self._memo) >= self.memo_size:
+                self._memo.clear()
+            self._memo[text] = result
+        else:
+            self.stats['memo_hits'] += 1
+
+        if isinstance(result, tuple):
+            self.stats['parsed'] += 1
+            return result
+        self.stats['failed'] += 1
+        raise ValueError(result)
+
+    def _parse(self, text):
+        """Позиция или текст ошибки: ошибки тоже запоминаются"""
+        position = _PUNCTUATION.sub(' ', text.lower().replace('ё', 'е'))
+        bits = position.split()
+        if len(bits) == 1:
+            match = _GLUED.match(bits[0])
+            bits = list(match.groups()) if match is not None else bits
+        if len(bits) != 2:
+            return 'Can\'t parse entire position: %s' % position.strip()
+
+        x = self.letter(bits[0])
+        if x is None:
+            return 'Can\'t parse X point: %s' % bits[0]
+        y = self.number(bits[1])
+        if y is None:
+            return 'Can\'t parse Y point: %s' % bits[1]
+        return x, y
+
+    def metrics(self):
+        return dict(self.stats, memo=len(self._memo))
@@ -0,0 +1,246 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import random
+
+import numpy as np
+
+from seabattle import budget, fieldgen, game, placements
+from seabattle.game import EMPTY, SHIP, Messages
+
+
+# сколько полей генерирует weights, чтобы узнать частоту каждой расстановки
+WEIGHT_SAMPLES = 500
+WEIGHT_SEED = 1
+# во сколько раз равномерная примесь весомее выборки: соперник может ставить корабли и не так
+WEIGHT_UNIFORM = 2
+
+# (размер поля, длины кораблей, распределение) -> {длина: веса расстановок}
+_weights = {}
+
+
+def _symmetries(size):
+    """Перестановки клеток для восьми поворотов и отражений поля"""
+    result = []
+    for transform in xrange(8):
+        permutation = []
+        for index in xrange(size ** 2):
+            x, y = index % size, index // size
+            if transform & 1:
+                x = size - 1 - x
+            if transform & 2:
+                y = size - 1 - y
+            if transform & 4:
+                x, y = y, x
+            permutation.append(y * size + x)
+        result.append(permutation)
+    return result
+
+
+def weights(size, ships, distribution):
+    """
+    Веса расстановок по длинам: как часто fieldgen с распределением distribution
+    ставит корабль этой длины именно так, плюс равномерная примесь.
+
+    Считаются один раз на процесс по WEIGHT_SAMPLES полям из фиксированного
+    seed, так что у всех процессов веса одинаковые. Распределения fieldgen
+    симметричны, поэтому каждое поле засчитывается во всех восьми поворотах и
+    отражениях. Веса целые: карта, уточнённая вычитанием, в точности совпадает
+    с посчитанной заново (например, в codec.decode).
+    """
+    key = (size, tuple(sorted(ships)), distribution)
+    result = _weights.get(key)
+    if result is None:
+        table = placements.get_table(size)
+        symmetries = _symmetries(size)
+        rng = random.Random(WEIGHT_SEED)
+        counts = {}
+        rows = {}
+        for length in set(ships):
+            counts[length] = np.zeros(len(table.cover(length)), dtype=np.int64)
+            rows[length] = dict((tuple(cells), row) for row, cells in enumerate(table.cells(length).tolist()))
+        for _ in xrange(WEIGHT_SAMPLES):
+            for ship in fieldgen.generate(size, ships, rng, distribution):
+                for permutation in symmetries:
+                    counts[len(ship)][rows[len(ship)][tuple(sorted(permutation[index] for index in ship))]] += 1
+        result = {}
+        for length, count in counts.items():
+            result[length] = count + WEIGHT_UNIFORM * count.sum() // len(count) + 1
+            result[length].flags.writeable = False
+        _weights[key] = result
+    return result
+
+
+class Game(game.Game):
+    """
+    Стрельба по карте плотности: в каждую клетку пишем, сколькими способами
+    в неё можно поставить оставшиеся корабли, и бьём в самую «горячую».
+
+    Способы не равноценны: расстановка весит столько, как часто её выбирает
+    генерация поля соперника (weights с ENEMY_DISTRIBUTION). Без этого карта
+    тянет выстрелы в середину поля, а поля corners прячут корабли по углам.
+
+    Выигрыш в основном от того, что распределение соперника угадано
+    (benchmarks/bench_targeting.py, 2000 полей): на полях corners, под которые
+    подобраны веса, 59.3 выстрела до победы против 61.4 у game.Game, а на
+    равномерных полях (uniform) только 56.6 против 57.8.
+
+    Карта не пересчитывается целиком, а уточняется после каждого ответа соперника:
+    из неё вычитаются только расстановки, которые закрыл этот ответ.
+
+    Карта для выстрела складывается по длинам кораблей, от длинных к коротким.
+    Если дедлайн хода истёк, сложение останавливается, и выстрел выбирается по
+    уже посчитанной части карты.
+
+    Клетки из prior_order (статистика соперника) бьются раньше карты, как в
+    game.Game.
+    """
+
+    # каким распределением fieldgen, по нашему мнению, расставляет корабли соперник
+    ENEMY_DISTRIBUTION = game.Game.FIELD_DISTRIBUTION
+    # веса этой партии, берутся из weights при первом обращении; codec их не хранит
+    _weights = None
+
+    def __init__(self, seed=None):
+        super(Game, self).__init__(seed)
+        self.alive = {}
+        self.heat = {}
+        self.unknown = None
+
+    def start_new_game(self, size=10, field=None, ships=None, numbers=None):
+        super(Game, self).start_new_game(size, field, ships, numbers)
+        self._weights = None
+        self.alive = {}
+        self.heat = {}
+        for length in set(self.ships):
+            cover = placements.get_table(self.size).cover(length)
+            self.alive[length] = np.ones(len(cover), dtype=bool)
+            self.heat[length] = self.placement_heat(length, self.alive[length])
+        self.unknown = np.array(self.enemy_field) == EMPTY
+        self.exclude_cells(np.flatnonzero(np.array(self.enemy_field) != EMPTY))
+
+    @property
+    def weights(self):
+        if self._weights is None:
+            self._weights = weights(self.size, self.ships, self.ENEMY_DISTRIBUTION)
+        return self._weights
+
+    def placement_heat(self, length, rows):
+        """Вклад расстановок длины length из rows (маска) в карту по клеткам"""
+        cover = placements.get_table(self.size).cover(length)
+        return self.weights[length][rows].dot(cover[rows])
+
+    def exclude_cells(self, cells):
+        """Убирает из карты расстановки, которые задевают клетки cells"""
+        if not len(cells):
+            return
+        for length, alive in self.alive.items():
+            cover = placements.get_table(self.size).cover(length)
+            closed = alive & cover[:, cells].any(axis=1)
+            if closed.any():
+                alive &= ~closed
+                self.heat[length] -= self.placement_heat(length, closed)
+
+    def total_heat(self, deadline=None):
+        total = np.zeros(self.size ** 2, dtype=np.int64)
+        counted = False
+        for length in sorted(self.heat, reverse=True):
+            count = self.enemy_ships.get(length, 0)
+            if count < 1:
+                continue
+            if counted and _cut(deadline):
+                break
+            total += count * self.heat[length]
+            counted = True
+        return total
+
+    def target_heat(self, deadline=None):
+        """
+        Карта для добивания: только расстановки, покрывающие все подбитые палубы.
+
+        Стреляем лишь по соседям подбитых палуб: попадание туда гарантированно
+        приходится в тот же корабль, ведь корабли не касаются друг друга.
+        """
+        wounded = [self.calc_index(point) for point in self.ship_under_fire]
+        total = np.zeros(self.size ** 2, dtype=np.int64)
+        counted = False
+        for length in sorted(self.alive, reverse=True):
+            count = self.enemy_ships.get(length, 0)
+            if count < 1 or length <= len(wounded):
+                continue
+            cover = placements.get_table(self.size).cover(length)
+            candidates = self.alive[length] & cover[:, wounded].all(axis=1)
+            if not candidates.any():
+                continue
+            if counted and _cut(deadline):
+                break
+            total += count * self.placement_heat(length, candidates)
+            counted = True
+
+        neighbours = np.zeros(self.size ** 2, dtype=bool)
+        for index in wounded:
+            neighbours[list(self.geometry.sides[index])] = True
+        total[~neighbours] = 0
+        return total
+
+    def choose_shot_position(self, deadline=None):
+        if deadline is not None and deadline.expired():
+            # время вышло ещё до выбора: самый дешёвый выстрел по картам
+            budget.count('shots_cut')
+            return super(Game, self).choose_shot_position()
+
+        if self.wounded_ship:
+            heat = self.target_heat(deadline)
+        else:
+            candidate = self.prior_candidate()
+            if candidate is not None:
+                return self.geometry.positions[candidate]
+            heat = self.total_heat(deadline)
+        heat[~self.unknown] = 0
+
+        best = heat.max()
+        if best <= 0:
+            # ответы соперника противоречат картам, стреляем по старой стратегии
+            return super(Game, self).choose_shot_position()
+
+        index = self.rng.choice(np.flatnonzero(heat == best))
+        return self.calc_position(int(index))
+
+    def handle_enemy_reply(self, message):
+        position = self.last_shot_position
+        super(Game, self).handle_enemy_reply(message)
+        if position is None:
+            return
+
+        index = self.calc_index(position)
+        self.unknown[index] = False
+
+        if message == Messages.MISS:
+            self.exclude_cells([index])
+        elif message == Messages.HIT:
+            # корабли не касаются углами, значит по диагонали от палубы вода
+            diagonal = list(self.geometry.diagonals[index])
+            self.unknown[diagonal] = False
+            self.exclude_cells(diagonal)
+        elif message == Messages.KILL:
+            ship = self.killed_ship_cells(index)
+            halo = sorted(ship.union(self.geometry.halo(ship)))
+            self.unknown[halo] = False
+            self.exclude_cells(halo)
+
+    def killed_ship_cells(self, index):
+        return self.geometry.flood(self.enemy_field, index, SHIP)
+
+
+def _cut(deadline):
+    """Пора остановить подсчёт карты и стрелять по тому, что есть"""
+    if deadline is None or not deadline.expired():
+        return False
+    budget.count('shots_cut')
+    return True
+
+
+# веса для поля по умолчанию считаются при импорте (около 0.4 с), а не в ходе
+# партии или в codec.decode; с preload_app gunicorn это делается в мастере до форка
+weights(10, game.Game.default_ships, Game.ENEMY_DISTRIBUTION)
@@ -3,16 +3,19 @@
 from __future__ import unicode_literals
 
 import collections
-import json
 import logging
+import time
 
-from rasa_nlu.data_router import DataRouter
-
-from seabattle import game
+from seabattle import budget
+from seabattle import events
+from seabattle import grammar
+from seabattle import nlu
+from seabattle import pool
+from seabattle import priors
+from seabattle import records
 
 
 log = logging.getLogger(__name__)
-router = DataRouter('mldata/')
 MESSAGE_TEMPLATES = {
     'miss': 'Мимо. Я хожу %(shot)s',
     'hit': 'Ты попала',
@@ -54,6 +57,8 @@ class DialogManager(object):
         self.game = session_obj['game']
         self.opponent = session_obj['opponent']
         self.last = session_obj['last']
+        self.deadline = None
+        self.event = {}
 
     def _get_dmresponse(self, key, text, tts=None, end_session=False, with_opponent=False):
         if with_opponent and not text.lower().startswith(self.opponent.lower()):
@@ -62,7 +67,9 @@ class DialogManager(object):
                 tts = '%s - - %s' % (self.opponent, tts)
         return DMResponse(key, text, tts, end_session)
 
-    def _get_shot_miss_dmresponse(self, key, shot, with_opponent=False):
+    def _get_shot_miss_dmresponse(self, key, shot, with_opponent=False, repeated=False):
+        # повтор прошлого выстрела - не новый выстрел, метрики его не считают
+        self.event['repeated_shot' if repeated else 'shot'] = shot
         response_dict = {
             'shot': shot,
             'tts_shot': _shot_to_tts(shot),
@@ -83,10 +90,8 @@ class DialogManager(object):
         )
 
     def _handle_newgame(self, message, entities):
-        self.game = game.Game()
-        self.game.reset_last_shot()
+        self.game = pool.get_pool().get()
         self.session['game'] = self.game
-        self.game.start_new_game(numbers=True)
         if entities:
             self.opponent = _get_entity(entities, 'opponent_entity')
         else:
@@ -104,7 +109,7 @@ class DialogManager(object):
         if self.game is None:
             return self._get_dmresponse_by_key('need_init')
         self.game.reset_last_shot()
-        shot = self.game.do_shot()
+        shot = self.game.do_shot(self.deadline)
         return self._get_shot_miss_dmresponse('shot', shot, with_opponent=True)
 
     def _handle_miss(self, message, entities):
@@ -115,14 +120,16 @@ class DialogManager(object):
         if not enemy_shot:
             return self._get_dmresponse_by_key('dontunderstand')
 
+        self.event['enemy_shot'] = enemy_shot
         self.game.handle_enemy_reply('miss')
         try:
             enemy_position = self.game.convert_to_position(enemy_shot)
             answer = self.game.handle_enemy_shot(enemy_position)
         except ValueError:
             return self._get_dmresponse_by_key('dontunderstand')
+        self.event['result'] = answer
         if answer == 'miss':
-            shot = self.game.do_shot()
+            shot = self.game.do_shot(self.deadline)
             return self._get_shot_miss_dmresponse('miss', shot)
         return self._get_dmresponse(
             answer,
@@ -134,7 +141,7 @@ class DialogManager(object):
             return self._get_dmresponse_by_key('need_init')
 
         self.game.handle_enemy_reply('hit')
-        shot = self.game.do_shot()
+        shot = self.game.do_shot(self.deadline)
         return self._get_shot_miss_dmresponse('shot', shot)
 
     def _handle_kill(self, message, entities):
@@ -142,7 +149,7 @@ class DialogManager(object):
             return self._get_dmresponse_by_key('need_init')
 
         self.game.handle_enemy_reply('kill')
-        shot = self.game.do_shot()
+        shot = self.game.do_shot(self.deadline)
         if self.game.is_victory():
             return self._get_dmresponse_by_key('victory')
         else:
@@ -150,45 +157,105 @@ class DialogManager(object):
 
     def _handle_dontunderstand(self, message, entities):
         if self.game is None:
+            if self.last is not None and self.last.key in ['victory', 'kill']:
+                # партия кончилась прошлым ходом и уже забыта (_game_over): повторяем, чем кончилась
+                return self._get_dmresponse(self.last.key, self.last.text, with_opponent=True)
             return self._get_dmresponse_by_key('need_init')
 
         if self.last.key in ['miss', 'shot']:
             shot = self.game.repeat()
-            return self._get_shot_miss_dmresponse(self.last.key, shot, with_opponent=True)
+            return self._get_shot_miss_dmresponse(self.last.key, shot, with_opponent=True, repeated=True)
         return self._get_dmresponse(self.last.key, self.last.text, with_opponent=True)
 
     def _handle_victory(self, message, entities):
-        self.session['game'] = self.game = None
+        self._game_over()
         return self._get_dmresponse_by_key('defeat', True)
 
     def _handle_defeat(self, message, entities):
-        self.session['game'] = self.game = None
+        self._game_over()
         return self._get_dmresponse_by_key('victory', True)
 
+    def _game_over(self):
+        """Пишет в лог, что мы узнали о расстановке соперника, сохраняет запись партии и забывает её"""
+        if self.game is not None:
+            # итоги партий нужны priors целиком, выборка логов их не прореживает
+            events.emit('game', priors.record(self.game, self.opponent), sampled=False)
+            records.append(self.game, self.opponent)
+        self.session['game'] = self.game = None
+
     def _update_session(self, dmresponse):
         self.session['last'] = self.last = dmresponse
 
-    def handle_message(self, message):
-        data = router.extract({'q': message})
-        router_response = router.parse(data)
-        log.info('Router response %s', json.dumps(router_response, indent=2))
+    def _parse(self, message):
+        router_response = grammar.parse(message)
+        if router_response is not None:
+            return router_response
+        if self.deadline is None:
+            return nlu.parse(message)
 
-        if router_response['intent']['confidence'] < 0.8:
-            dmresponse = self._get_dmresponse_by_key('dontunderstand')
-            return dmresponse
+        try:
+            return nlu.parse(message, self.deadline.stage(budget.NLU_SHARE))
+        except budget.DeadlineExceeded:
+            budget.count('nlu_timeouts')
+            router_response = grammar.guess(message)
+            if router_response['source'] == 'guess':
+                budget.count('nlu_guessed')
+            return router_response
+
+    def handle_message(self, message, deadline=None):
+        """
+        Обрабатывает реплику соперника.
+
+        deadline (budget.Deadline) - к какому моменту нужен ответ. Если rasa
+        не успевает за свою долю бюджета, реплика разбирается grammar.guess,
+        а выстрел выбирается по тому, что стратегия успела посчитать.
+
+        После вызова в self.event лежит описание хода для events.emit:
+        интент, уверенность, выстрелы, результат и тайминги стадий.
+        """
+        started = time.time()
+        self.deadline = deadline
+        router_response = self._parse(message)
+        parsed = time.time()
+        log.debug('Router response %s', events.LazyJson(router_response))
 
         intent_name = router_response['intent']['name']
-        entities = router_response['entities']
-        handler_method = getattr(self, '_handle_' + intent_name)
-        dmresponse = handler_method(message, entities)
-        if dmresponse.key != 'dontunderstand':
-            # сохраняем только последний осмысленный ответ в сессии не затыкались после нескольких повтори
-            self._update_session(dmresponse)
-
-        if self.session.get('game') is not None:
-            log.info('My field:')
-            self.session['game'].print_field()
-            log.info('Enemy field:')
-            self.session['game'].print_enemy_field()
+        confidence = router_response['intent']['confidence']
+        self.event = {
+            'intent': intent_name,
+            'confidence': confidence,
+            'nlu': router_response.get('source', 'rasa'),
+        }
+
+        if confidence < 0.8:
+            dmresponse = self._get_dmresponse_by_key('dontunderstand')
+        else:
+            entities = router_response['entities']
+            if self.game is not None:
+                self.game.prior_order = priors.order(self.opponent, self.game.size)
+            handler_method = getattr(self, '_handle_' + intent_name)
+            dmresponse = handler_method(message, entities)
+            if dmresponse.key != 'dontunderstand':
+                # сохраняем только последний осмысленный ответ в сессии не затыкались после нескольких повтори
+                self._update_session(dmresponse)
+            if self.game is not None and self.game.is_end_game():
+                # доигранная партия больше не нужна, не держим её в памяти до конца сессии
+                self._game_over()
+
+        self.event['response'] = dmresponse.key
+        self.event['timings'] = {
+            'nlu_ms': round((parsed - started) * 1000, 3),
+            'handler_ms': round((time.time() - parsed) * 1000, 3),
+        }
+        if deadline is not None:
+            budget.count('turns')
+            self.event['deadline_missed'] = deadline.expired()
+            if self.event['deadline_missed']:
+                budget.count('missed')
+
+        game_obj = self.session.get('game')
+        if game_obj is not None and log.isEnabledFor(logging.DEBUG):
+            log.debug('My field:%s', events.LazyBoard(game_obj, game_obj.field))
+            log.debug('Enemy field:%s', events.LazyBoard(game_obj, game_obj.enemy_field))
 
         return dmresponse
@@ -0,0 +1,163 @@
+# coding: utf-8
+"""
+Структурированный лог ходов.
+
+Каждый ход диалога описывается словарём (интент, уверенность, выстрелы,
+результат, тайминги) и уходит в логгер seabattle.events. Все обработчики
+логов после configure() работают в фоновом потоке: в потоке запроса запись
+только кладётся в очередь, а форматирование, json.dumps и рисование полей
+происходят в потоке QueueListener.
+
+Настройки берутся из окружения:
+    SEABATTLE_LOG_LEVEL        уровень логов, по умолчанию INFO
+    SEABATTLE_LOG_SAMPLE_RATE  доля ходов, которые попадают в лог, от 0 до 1;
+                               итоги партий (событие game) пишутся всегда
+"""
+
+from __future__ import unicode_literals
+
+import atexit
+import json
+import logging
+import os
+import Queue
+import random
+import threading
+
+
+log = logging.getLogger(__name__)
+
+stats = {
+    'emitted': 0,
+    'sampled_out': 0,
+    'dropped': 0,
+}
+
+_sample_rate = 1.0
+_listener = None
+
+
+class LazyBoard(object):
+    """Снимок поля, который превращается в картинку только при форматировании записи"""
+
+    def __init__(self, game, field):
+        self.game = game
+        self.field = list(field)
+
+    def __unicode__(self):
+        return self.game.render_field(self.field)
+
+    def __str__(self):
+        return unicode(self).encode('utf-8')
+
+
+class LazyJson(object):
+    """Откладывает json.dumps до форматирования записи"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def __unicode__(self):
+        return json.dumps(self.value, indent=2, ensure_ascii=False)
+
+    def __str__(self):
+        return unicode(self).encode('utf-8')
+
+
+class QueueHandler(logging.Handler):
+    """Кладёт записи в очередь без форматирования; при переполнении теряет их"""
+
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Queue.Full:
+            stats['dropped'] += 1
+
+
+class QueueListener(object):
+    """Фоновый поток, который разбирает очередь и отдаёт записи настоящим обработчикам"""
+
+    _stop = object()
+
+    def __init__(self, queue, *handlers):
+        self.queue = queue
+        self.handlers = handlers
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._monitor, name='seabattle-log')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self.queue.put(self._stop)
+        self._thread.join()
+        self._thread = None
+
+    def _monitor(self):
+        while True:
+            record = self.queue.get()
+            if record is self._stop:
+                return
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+
+class EventFormatter(logging.Formatter):
+    """Записи событий пишет одной json строкой, остальные - как обычный Formatter"""
+
+    def format(self, record):
+        event = getattr(record, 'event', None)
+        if event is None:
+            return super(EventFormatter, self).format(record)
+        return json.dumps(dict(event, event=record.getMessage(), ts=record.created),
+                          ensure_ascii=False, sort_keys=True)
+
+
+def emit(name, event, sampled=True):
+    """Пишет событие в лог с учётом доли выборки; sampled=False - пишет всегда"""
+    if sampled and _sample_rate < 1 and random.random() >= _sample_rate:
+        stats['sampled_out'] += 1
+        return
+    stats['emitted'] += 1
+    log.info(name, extra={'event': event})
+
+
+def configure(level=None, sample_rate=None, queue_size=10000, handler=None):
+    """Переводит все логи процесса на фоновый поток"""
+    global _listener, _sample_rate
+
+    if level is None:
+        level = os.environ.get('SEABATTLE_LOG_LEVEL', 'INFO')
+    if sample_rate is None:
+        sample_rate = float(os.environ.get('SEABATTLE_LOG_SAMPLE_RATE', 1.0))
+    _sample_rate = sample_rate
+
+    if handler is None:
+        handler = logging.StreamHandler()
+        handler.setFormatter(EventFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    if _listener is not None:
+        _listener.stop()
+
+    queue = Queue.Queue(queue_size)
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(queue)]
+    root.setLevel(level)
+
+    _listener = QueueListener(queue, handler)
+    _listener.start()
+    return _listener
+
+
+@atexit.register
+def _flush():
+    if _listener is not None:
+        _listener.stop()
@@ -0,0 +1,143 @@
+# coding: utf-8
+"""
+Генерация поля перебором с возвратом по таблице расстановок.
+
+Корабли ставятся от длинных к коротким. На каждом шаге перебираются только
+расстановки из placements, которые не задевают уже поставленные корабли и
+клетки вокруг них. Число проверенных расстановок ограничено бюджетом, поэтому
+время генерации ограничено сверху и не зависит от удачи.
+
+Распределения:
+    uniform - все допустимые поля примерно равновероятны;
+    corners - длинные корабли жмутся к углам и краям поля, а также к уже
+              поставленным кораблям у края, как в исходной жадной генерации.
+"""
+
+from __future__ import unicode_literals
+
+import itertools
+
+from seabattle import placements
+
+
+DISTRIBUTIONS = ('uniform', 'corners')
+DEFAULT_BUDGET = 5000
+CORNER_LIMIT = 2
+
+_borders = {}
+
+
+class FieldGenerationError(Exception):
+    pass
+
+
+def _border(size):
+    border = _borders.get(size)
+    if border is None:
+        border = 0
+        for index in xrange(size ** 2):
+            x, y = index % size, index // size
+            if x in (0, size - 1) or y in (0, size - 1):
+                border |= 1 << index
+        _borders[size] = border
+    return border
+
+
+def _nooks(size, free):
+    """Свободные клетки у края, у которых не больше двух свободных соседей по стороне"""
+    full = (1 << size ** 2) - 1
+    left_column = sum(1 << (y * size) for y in xrange(size))
+    right_column = left_column << (size - 1)
+
+    up = free >> size
+    down = (free << size) & full
+    left = (free << 1) & ~left_column & full
+    right = (free >> 1) & ~right_column
+    crowded = (up & down & left) | (up & down & right) | (up & left & right) | (down & left & right)
+    return free & _border(size) & ~crowded
+
+
+def _shuffled(items, rng):
+    """Ленивое перемешивание: обычно нужна одна-две первые расстановки, а не все"""
+    for i in xrange(len(items)):
+        j = rng.randrange(i, len(items))
+        items[i], items[j] = items[j], items[i]
+        yield items[i]
+
+
+def _candidates(size, length, forbidden, rng, distribution):
+    free = [pair for pair in placements.get_table(size).masks(length) if not pair[0] & forbidden]
+    if distribution == 'corners' and length >= CORNER_LIMIT:
+        nooks = _nooks(size, ((1 << size ** 2) - 1) & ~forbidden)
+        groups = [[], []]
+        for pair in free:
+            groups[not pair[0] & nooks].append(pair)
+        return itertools.chain(_shuffled(groups[0], rng), _shuffled(groups[1], rng))
+    return _shuffled(free, rng)
+
+
+def _search(size, ships, rng, distribution, budget):
+    """Перебор с возвратом; возвращает маски кораблей или None, если бюджет исчерпан"""
+    steps = 0
+    forbidden = [0]
+    chosen = []
+    stack = [_candidates(size, ships[0], 0, rng, distribution)]
+
+    while stack:
+        for ship, halo in stack[-1]:
+            steps += 1
+            if steps > budget:
+                return None
+            chosen.append(ship)
+            forbidden.append(forbidden[-1] | ship | halo)
+            break
+        else:
+            stack.pop()
+            if chosen:
+                chosen.pop()
+                forbidden.pop()
+            continue
+
+        if len(chosen) == len(ships):
+            return chosen
+        stack.append(_candidates(size, ships[len(chosen)], forbidden[-1], rng, distribution))
+
+    raise FieldGenerationError('Ships %s do not fit into %sx%s field' % (ships, size, size))
+
+
+def generate(size, ships, rng, distribution='uniform', budget=DEFAULT_BUDGET):
+    """
+    Возвращает корабли длин ships в виде списков индексов клеток.
+
+    Если за budget проверок случайный перебор не справился, делается ещё один
+    перебор без перемешивания, тоже не дольше budget шагов.
+    """
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError('Unknown field distribution: %s' % distribution)
+
+    ships = sorted(ships, reverse=True)
+    if not ships:
+        return []
+
+    chosen = _search(size, ships, rng, distribution, budget)
+    if chosen is None:
+        chosen = _search(size, ships, _Unshuffled(), 'uniform', budget)
+    if chosen is None:
+        raise FieldGenerationError('Field generation exceeded budget of %s steps' % budget)
+
+    result = []
+    for ship in chosen:
+        cells = []
+        while ship:
+            low = ship & -ship
+            cells.append(low.bit_length() - 1)
+            ship ^= low
+        result.append(cells)
+    return result
+
+
+class _Unshuffled(object):
+    """Генератор без случайности для детерминированного перебора"""
+
+    def randrange(self, start, stop):
+        return start
@@ -2,11 +2,15 @@
 
 from __future__ import unicode_literals
 
+import array
 import random
-import re
 import logging
+import time
 
-from transliterate import translit
+from seabattle import coords
+from seabattle import fieldgen
+from seabattle import geometry
+from seabattle import randomset
 
 EMPTY = 0
 SHIP = 1
@@ -14,8 +18,14 @@ BLOCKED = 2
 HIT = 3
 MISS = 4
 
+# сколько ходов помнит журнал партии (BaseGame.journal), дальше ходы не пишутся
+JOURNAL_LIMIT = 400
+
 log = logging.getLogger(__name__)
 
+# (размер поля, базовая точка) -> карты стрельбы Game, общие для всех партий
+_shared_maps = {}
+
 
 class Messages:
     HIT = 'hit'
@@ -23,12 +33,35 @@ class Messages:
     MISS = 'miss'
 
 
-class BaseGame(object):
-    position_patterns = [re.compile('^([a-zа-я]+)(\d+)$', re.UNICODE),  # a1
-                         re.compile('^([a-zа-я]+)\s+(\w+)$', re.UNICODE),  # a 1; a один
-                         re.compile('^(\w+)\s+(\w+)$', re.UNICODE),  # a 1; a один; 7 10
-                         ]
+class Moves:
+    """
+    Записи журнала партии: вызовы, которые меняют её состояние, в том порядке,
+    в котором их делали. Запись - одно 16-битное слово:
+    вид << 12 | ответ (REPLIES) << 8 | индекс клетки.
+    """
+    SHOT = 0
+    REPLY = 1
+    ENEMY_SHOT = 2
+    RESET = 3
+
+    REPLIES = [None, Messages.MISS, Messages.HIT, Messages.KILL]
+    CODES = dict((message, code) for code, message in enumerate(REPLIES))
+
+    @classmethod
+    def pack(cls, kind, index=0, message=None):
+        return kind << 12 | cls.CODES.get(message, 0) << 8 | index
+
+    @classmethod
+    def unpack(cls, move):
+        return move >> 12, move & 0xFF, cls.REPLIES[move >> 8 & 0xF]
+
+
+# слова ENEMY_SHOT по нашему ответу без индекса клетки: handle_enemy_shot на
+# каждом ходу соперника только прибавляет индекс, а не собирает слово заново
+Moves.ENEMY_SHOTS = dict((message, Moves.pack(Moves.ENEMY_SHOT, 0, message)) for message in Moves.REPLIES)
+
 
+class BaseGame(object):
     str_letters = ['а', 'б', 'в', 'г', 'д', 'е', 'ж', 'з', 'и', 'к']
     str_numbers = ['один', 'два', 'три', 'четыре', 'пять', 'шесть', 'семь', 'восемь', 'девять', 'десять']
 
@@ -39,9 +72,16 @@ class BaseGame(object):
         'трень': '3',
     }
 
+    # общая на процесс таблица написаний координат; своя нужна только при других str_*
+    position_parser = coords.PositionParser(str_letters, str_numbers, letters_mapping)
+
     default_ships = [4, 3, 3, 2, 2, 2, 1, 1, 1, 1]
 
-    def __init__(self):
+    def __init__(self, seed=None):
+        # у каждой игры свой генератор, чтобы любую партию можно было повторить по seed
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.rng = random.Random(self.seed)
+
         self.size = 0
         self.ships = None
         self.field = []
@@ -54,6 +94,13 @@ class BaseGame(object):
         self.last_enemy_shot_position = None
         self.numbers = None
 
+        # журнал ходов (Moves) и время выбора каждого своего выстрела в единицах
+        # по 10 мкс; по ним records сохраняет и переигрывает партию.
+        # codec.decode ставит None партиям, сохранённым до журнала (версии 1 и 2):
+        # их начало потеряно, дописывать и записывать в records нечего
+        self.journal = array.array(str('H'))
+        self.shot_timings = array.array(str('H'))
+
     def start_new_game(self, size=10, field=None, ships=None, numbers=None):
         assert(size <= 10)
         assert(len(field) == size ** 2 if field is not None else True)
@@ -77,14 +124,18 @@ class BaseGame(object):
 
         self.last_shot_position = None
         self.last_enemy_shot_position = None
+        self.journal = array.array(str('H'))
+        self.shot_timings = array.array(str('H'))
 
     def generate_field(self):
         raise NotImplementedError()
 
     def print_field(self, field=None):
+        log.info('%s', self.render_field(field))
+
+    def render_field(self, field=None):
         if not self.size:
-            log.info('Empty field')
-            return
+            return 'Empty field'
 
         if field is None:
             field = self.field
@@ -96,14 +147,20 @@ class BaseGame(object):
         for y in range(self.size):
             lines.append('|%s|' % ''.join(str(mapping[x]) for x in field[y * self.size: (y + 1) * self.size]))
         lines.append('-' * (self.size + 2))
-        log.info('\n'.join(lines))
+        return '\n'.join(lines)
 
     def print_enemy_field(self):
         self.print_field(self.enemy_field)
 
     def handle_enemy_shot(self, position):
         index = self.calc_index(position)
+        answer = self.resolve_enemy_shot(index)
+        journal = self.journal
+        if journal is not None and len(journal) < JOURNAL_LIMIT:
+            journal.append(Moves.ENEMY_SHOTS[answer] | index)
+        return answer
 
+    def resolve_enemy_shot(self, index):
         if self.field[index] == SHIP:
             self.field[index] = HIT
 
@@ -117,6 +174,11 @@ class BaseGame(object):
         else:
             return Messages.MISS
 
+    def record_move(self, kind, index=0, message=None):
+        journal = self.journal
+        if journal is not None and len(journal) < JOURNAL_LIMIT:
+            journal.append(Moves.pack(kind, index, message))
+
     def is_dead_ship(self, last_index):
         x, y = self.calc_position(last_index)
         x -= 1
@@ -149,16 +211,19 @@ class BaseGame(object):
     def is_defeat(self):
         return self.ships_count < 1
 
-    def do_shot(self):
+    def do_shot(self, deadline=None):
         raise NotImplementedError()
 
     def repeat(self):
         return self.convert_from_position(self.last_shot_position, numbers=True)
 
     def reset_last_shot(self):
+        if self.last_shot_position is not None:
+            self.record_move(Moves.RESET)
         self.last_shot_position = None
 
     def handle_enemy_reply(self, message):
+        self.record_move(Moves.REPLY, message=message)
         if self.last_shot_position is None:
             return
 
@@ -173,13 +238,19 @@ class BaseGame(object):
         elif message == Messages.MISS:
             self.enemy_field[index] = MISS
 
+    @property
+    def geometry(self):
+        """Соседи клеток и прочие таблицы для поля текущего размера"""
+        return geometry.get_geometry(self.size)
+
     def calc_index(self, position):
         x, y = position
+        size = self.size
 
-        if x > self.size or y > self.size:
+        if not (0 < x <= size and 0 < y <= size):
             raise ValueError('Wrong position: %s %s' % (x, y))
 
-        return (y - 1) * self.size + x - 1
+        return (y - 1) * size + x - 1
 
     def calc_position(self, index):
         y = index / self.size + 1
@@ -188,54 +259,7 @@ class BaseGame(object):
         return x, y
 
     def convert_to_position(self, position):
-        position = position.lower()
-        for pattern in self.position_patterns:
-            match = pattern.match(position)
-
-            if match is not None:
-                break
-        else:
-            raise ValueError('Can\'t parse entire position: %s' % position)
-
-        bits = match.groups()
-
-        def _try_letter(bit):
-            # проверяем особые случаи неправильного распознования STT
-            bit = self.letters_mapping.get(bit, bit)
-
-            # преобразуем в кириллицу
-            bit = translit(bit, 'ru')
-
-            try:
-                return self.str_letters.index(bit) + 1
-            except ValueError:
-                raise
-
-        def _try_number(bit):
-            # проверяем особые случаи неправильного распознования STT
-            bit = self.letters_mapping.get(bit, bit)
-
-            if bit.isdigit():
-                return int(bit)
-            else:
-                try:
-                    return self.str_numbers.index(bit) + 1
-                except ValueError:
-                    raise
-
-        x = bits[0].strip()
-        try:
-            x = _try_number(x)
-        except ValueError:
-            raise ValueError('Can\'t parse X point: %s' % x)
-
-        y = bits[1].strip()
-        try:
-            y = _try_number(y)
-        except ValueError:
-            raise ValueError('Can\'t parse Y point: %s' % y)
-
-        return x, y
+        return self.position_parser.parse(position)
 
     def convert_from_position(self, position, numbers=None):
         numbers = numbers if numbers is not None else self.numbers
@@ -261,8 +285,12 @@ class States:
 class Game(BaseGame):
     """Реализация игры с ипользованием обычного random"""
 
-    def __init__(self):
-        super(Game, self).__init__()
+    # клетки, где этот соперник чаще всего ставит корабли (priors.order); задаёт
+    # DialogManager на каждый ход, codec их не хранит
+    prior_order = None
+
+    def __init__(self, seed=None):
+        super(Game, self).__init__(seed)
         self._base_point = None
         self._base_diagonally = None
         self._base_axis = None
@@ -270,15 +298,18 @@ class Game(BaseGame):
         self.wounded_ship = False
         self.last_hit = None
         self.state = States.BORDER4
-        self.maps = []
+        # по карте - битовая маска клеток, уже выбранных из неё для выстрела
+        self.consumed = []
+        # ещё не выбранные пустые клетки карты targets_state, строятся при переходе на карту
+        self.targets = None
+        self.targets_state = None
         self.enemy_ships = {}
         self.hits = 0
         self.ship_under_fire = []
-        self.place_points = None
 
     def start_new_game(self, size=10, field=None, ships=None, numbers=None):
         super(Game, self).start_new_game(size, field, ships, numbers)
-        self.maps = self.build_maps()
+        self.consumed = [0] * len(self.maps)
         for ship in self.ships:
             if ship not in self.enemy_ships:
                 self.enemy_ships[ship] = 0
@@ -288,11 +319,30 @@ class Game(BaseGame):
     def base_point(self):
         if self._base_point is None:
             self._base_point = (
-                random.randint(1, self.size),
-                random.randint(1, self.size),
+                self.rng.randint(1, self.size),
+                self.rng.randint(1, self.size),
             )
         return self._base_point
 
+    @property
+    def maps(self):
+        """
+        Карты стрельбы (индексы клеток по States) для базовой точки партии.
+
+        Они зависят только от размера поля и базовой точки, поэтому строятся
+        один раз на процесс и не меняются; что из карты уже выбрано, партия
+        помнит в self.consumed.
+        """
+        if not self.size:
+            return ()
+        key = (self.size, self.base_point)
+        maps = _shared_maps.get(key)
+        if maps is None:
+            maps = _shared_maps[key] = tuple(
+                tuple(sorted(self.calc_index(point) for point in points)) for points in self.build_maps()
+            )
+        return maps
+
     @property
     def base_diagonally(self):
         if self._base_diagonally is None:
@@ -386,206 +436,110 @@ class Game(BaseGame):
             self.build_napalm(),
         ]
 
+    FIELD_DISTRIBUTION = 'corners'
+
     def generate_field(self):
         """Метод генерации поля"""
-        self.field = [0] * self.size ** 2
-
-        for length in self.ships:
-            self.place_ship_greedily(length)
-
-        for i in range(len(self.field)):
-            if self.field[i] == BLOCKED:
-                self.field[i] = EMPTY
-
-    CORNER_LIMIT = 2
-
-    def ensure_place_points(self):
-        if self.place_points is None:
-            self.place_points = {
-                (1, self.size): {(0, 1), (1, 0), (0, -1), (-1, 0)},
-                (self.size, 1): {(0, 1), (1, 0), (0, -1), (-1, 0)},
-                (1, 1): {(0, 1), (1, 0), (0, -1), (-1, 0)},
-                (self.size, self.size): {(0, 1), (1, 0), (0, -1), (-1, 0)},
-            }
-
-    def place_ship_greedily(self, length):
-        if length >= self.CORNER_LIMIT:
-            self.ensure_place_points()
-            if len(self.place_points) == 0:
-                raise Exception('CIRCLE FIELD!')
-            point = random.choice(self.place_points.keys())
-            directions = self.place_points.pop(point)
-            while len(directions):
-                direction = random.sample(directions, 1)[0]
-                directions.discard(direction)
-                ship = [
-                    (
-                        (point[0] + direction[0] * i),
-                        (point[1] + direction[1] * i),
-                    )
-                    for i in range(length)
-                ]
-                if not all(
-                        map(
-                            lambda cell: self.is_in_field(cell) and self.field[self.calc_index(cell)] == EMPTY,
-                            ship
-                        )
-                ):
-                    continue
-                self.set_ship(ship)
-                self.expand_corners(ship)
-                break
-            else:
-                self.place_ship_greedily(length)
-        else:
-            self.place_ship(length)
-
-    def expand_corners(self, ship):
-        directions = {(0, 1), (1, 0), (0, -1), (-1, 0)}
-        allowed_directions = {
-            (ship[1][0] - ship[0][0], ship[1][1] - ship[0][1]),
-            (ship[0][0] - ship[1][0], ship[0][1] - ship[1][1]),
-        }
-        for element in ship:
-            for direction in directions:
-                candidate = (element[0] + 2 * direction[0], element[1] + 2 * direction[1])
-                if not self.is_in_field(candidate) or self.field[self.calc_index(candidate)] != EMPTY or not (
-                    candidate[0] == 1 or candidate[1] == 1 or candidate[0] == self.size or candidate[1] == self.size
-                ):
-                    continue
-                allowed_positions = 0
-                for try_direction in directions:
-                    check_point = (candidate[0] + try_direction[0], candidate[1] + try_direction[1])
-                    if not self.is_in_field(check_point):
-                        continue
-                    if self.field[self.calc_index(check_point)] == EMPTY:
-                        allowed_positions += 1
-                    if allowed_positions > 2:
-                        break
-                if allowed_positions == 2:
-                    place_directions = allowed_directions.copy()
-                    for direction in directions:
-                        if not self.is_in_field((candidate[0] + direction[0], candidate[1] + direction[1])):
-                            normal = (direction[1], direction[0])
-                            place_directions.add(normal)
-                            place_directions.add((-normal[0], -normal[1]))
-                    self.place_points[candidate] = place_directions
-
-    def is_in_field(self, point):
-        return 1 <= point[0] <= self.size and 1 <= point[1] <= self.size
-
-    def set_ship(self, ship):
-        for element in ship:
-            for i in xrange(-1, 2):
-                for j in xrange(-1, 2):
-                    candidate = ((element[0] + i), (element[1] + j))
-                    if not self.is_in_field(candidate):
-                        continue
-                    new_point = self.calc_index(candidate)
-                    if i == 0 and j == 0:
-                        self.field[new_point] = SHIP
-                    if candidate in ship:
-                        continue
-                    self.field[new_point] = BLOCKED
-
-    def place_ship(self, length):
-        def _try_to_place():
-            x = random.randint(1, self.size)
-            y = random.randint(1, self.size)
-            direction = random.choice([1, self.size])
-
-            index = self.calc_index((x, y))
-            values = self.field[index:None if direction == self.size else index + self.size - index % self.size:direction][:length]
-
-            if len(values) < length or any(values):
-                return False
-
-            for i in range(length):
-                current_index = index + direction * i
-
-                for j in [0, 1, -1]:
-                    if (j != 0
-                            and current_index % self.size in (0, self.size - 1)
-                            and (current_index + j) % self.size in (0, self.size - 1)):
-                        continue
+        self.field = [EMPTY] * self.size ** 2
 
-                    for k in [0, self.size, -self.size]:
-                        neighbour_index = current_index + k + j
+        for ship in fieldgen.generate(self.size, self.ships, self.rng, self.FIELD_DISTRIBUTION):
+            for index in ship:
+                self.field[index] = SHIP
 
-                        if (neighbour_index < 0
-                                or neighbour_index >= len(self.field)
-                                or self.field[neighbour_index] == SHIP):
-                            continue
-
-                        self.field[neighbour_index] = BLOCKED
-
-                self.field[current_index] = SHIP
-
-            return True
-
-        while not _try_to_place():
-            pass
-
-    def do_shot(self):
+    def do_shot(self, deadline=None):
         """
         Метод выбора координаты выстрела.
+
+        deadline (budget.Deadline) - к какому моменту нужен ответ; стратегия,
+        которой не хватило времени, стреляет по лучшему, что успела найти.
         """
-        self.last_shot_position = self.choose_shot_position()
+        started = time.time()
+        self.last_shot_position = self.choose_shot_position(deadline)
+        journal = self.journal
+        if journal is not None and len(journal) < JOURNAL_LIMIT:
+            journal.append(Moves.pack(Moves.SHOT, self.calc_index(self.last_shot_position)))
+            self.shot_timings.append(min(int((time.time() - started) * 100000), 0xFFFF))
         return self.convert_from_position(self.last_shot_position)
 
     def hunt_for_wounded(self):
+        geometry = self.geometry
         if len(self.ship_under_fire) == 1:
-            variants = set(filter(
-                lambda point: 1 <= point[0] <= self.size and 1 <= point[1] <= self.size,
-                [
-                    (self.last_hit[0], self.last_hit[1] - 1),
-                    (self.last_hit[0], self.last_hit[1] + 1),
-                    (self.last_hit[0] - 1, self.last_hit[1]),
-                    (self.last_hit[0] + 1, self.last_hit[1]),
-                ],
-            ))
+            around = geometry.sides
+        elif self.ship_under_fire[0][0] == self.ship_under_fire[1][0]:
+            around = geometry.vertical
         else:
-            if self.ship_under_fire[0][0] == self.ship_under_fire[1][0]:
-                variants = set([(point[0], point[1] - 1) for point in self.ship_under_fire]).union(
-                    [(point[0], point[1] + 1) for point in self.ship_under_fire]
-                )
-            else:
-                variants = set([(point[0] - 1, point[1]) for point in
-                                self.ship_under_fire]).union(
-                    [(point[0] + 1, point[1]) for point in self.ship_under_fire]
-                )
-            variants = set(filter(
-                lambda point: 1 <= point[0] <= self.size and 1 <= point[1] <= self.size,
-                variants
-            ))
+            around = geometry.horizontal
+        variants = set()
+        for point in self.ship_under_fire:
+            variants.update(around[self.calc_index(point)])
+        variants = randomset.RandomSet(self.size ** 2, sorted(variants))
         while len(variants):
-            candidate = random.sample(variants, 1)[0]
-            variants.discard(candidate)
-            if self.enemy_field[self.calc_index(candidate)] == EMPTY:
+            candidate = variants.pop_random(self.rng)
+            if self.enemy_field[candidate] == EMPTY:
                 break
         else:
             raise Exception('SHOULD BE KILLED ALREADY!')
-        return candidate
+        return geometry.positions[candidate]
 
     def expand_state(self):
+        state = self.state
         self.state += 1
         self.recheck_state()
-        if self.state >= len(self.maps):
+        # recheck_state возвращает в NAPALM, пока остались однопалубники: тогда карты кончились
+        if self.state <= state or self.state >= len(self.maps):
             raise Exception('MAP IS DEVASTATED ALREADY!')
 
+    def prior_candidate(self):
+        """Первая ещё не открытая клетка из prior_order или None"""
+        for index in self.prior_order or ():
+            if self.enemy_field[index] == EMPTY:
+                return index
+        return None
+
     def hunt_for_new(self):
-        map = self.maps[self.state]
-        while len(map):
-            candidate = random.sample(map, 1)[0]
-            map.discard(candidate)
-            if self.enemy_field[self.calc_index(candidate)] == EMPTY:
-                break
-        else:
-            self.expand_state()
-            return self.hunt_for_new()
-        return candidate
+        candidate = self.prior_candidate()
+        if candidate is not None:
+            if self.targets is not None:
+                self.targets.discard(candidate)
+            return self.geometry.positions[candidate]
+        while True:
+            if self.targets is None or self.targets_state != self.state:
+                consumed = self.consumed[self.state]
+                self.targets_state = self.state
+                self.targets = randomset.RandomSet(self.size ** 2, [
+                    index for index in self.maps[self.state]
+                    if not consumed >> index & 1 and self.enemy_field[index] == EMPTY
+                ])
+            while len(self.targets):
+                candidate = self.targets.pop_random(self.rng)
+                if self.enemy_field[candidate] == EMPTY:
+                    self.consumed[self.state] |= 1 << candidate
+                    return self.geometry.positions[candidate]
+            if not self.release_unanswered():
+                self.expand_state()
+
+    def release_unanswered(self):
+        """
+        Возвращает в кандидаты клетки карты, которые выбрали, но так и не узнали.
 
-    def choose_shot_position(self):
+        Клетка помечается в consumed сразу при выборе; если на выстрел не
+        ответили (его сбросили, переспросили или партия кончилась), она осталась
+        пустой. Проверять это на каждом выстреле дорого, поэтому такие клетки
+        добираются, когда карта кончилась. Возвращает, нашлись ли они.
+        """
+        left = [index for index in self.maps[self.state] if self.enemy_field[index] == EMPTY]
+        for index in left:
+            self.consumed[self.state] &= ~(1 << index)
+        self.targets.add_all(left)
+        return bool(left)
+
+    def invalidate_targets(self):
+        """Убирает из кандидатов карты клетки, которые уже открыты, например обводкой убитого корабля"""
+        if self.targets is not None:
+            self.targets.discard_all([index for index in self.targets if self.enemy_field[index] != EMPTY])
+
+    def choose_shot_position(self, deadline=None):
+        # случайный выбор по картам быстрый, дедлайн ему не нужен
         if self.wounded_ship:
             return self.hunt_for_wounded()
         return self.hunt_for_new()
@@ -600,6 +554,7 @@ class Game(BaseGame):
             self.ship_under_fire.append(self.last_hit)
         elif message == Messages.KILL:
             self.mark_killed_ship_bounds(self.last_shot_position)
+            self.invalidate_targets()
             self.wounded_ship = False
             self.enemy_ships[self.hits + 1] -= 1
             self.recheck_state()
@@ -615,20 +570,6 @@ class Game(BaseGame):
             return
 
     def mark_killed_ship_bounds(self, position):
-        def mark_point((x, y)):
-            for i in [-1, 0, 1]:
-                for j in [-1, 0, 1]:
-                    if i == 0 and j == 0:
-                        continue
-                    new_position = (x + i, y + j)
-                    if new_position[0] <= 0 or new_position[1] <= 0 or new_position[0] > self.size or new_position[1] > self.size:
-                        continue
-                    index_to_mark = self.calc_index(new_position)
-                    if self.enemy_field[index_to_mark] == SHIP and new_position not in marked_positions:
-                        marked_positions.add(new_position)
-                        mark_point(new_position)
-                    elif self.enemy_field[index_to_mark] != SHIP:
-                        self.enemy_field[index_to_mark] = MISS
-
-        marked_positions = {position}
-        mark_point(position)
+        ship = self.geometry.flood(self.enemy_field, self.calc_index(position), SHIP)
+        for index in self.geometry.halo(ship):
+            self.enemy_field[index] = MISS
@@ -0,0 +1,70 @@
+# coding: utf-8
+"""
+Геометрия поля заданного размера: соседи клеток, строки, столбцы и области.
+
+Стратегии то и дело спрашивают "какие клетки вокруг этой" и каждый раз
+перебирали сдвиги [-1, 0, 1] с проверкой границ. Geometry считает всё это один
+раз на размер поля, дальше остаются только поиски в кортежах по индексу
+клетки (индекс - как в Game.calc_index, от 0, по строкам).
+
+Соседи по стороне идут в порядке: сверху, снизу, слева, справа.
+"""
+
+from __future__ import unicode_literals
+
+
+_geometries = {}
+
+SIDES = [(0, -1), (0, 1), (-1, 0), (1, 0)]
+DIAGONALS = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+
+class Geometry(object):
+    """Таблицы соседства клеток поля size x size"""
+
+    def __init__(self, size):
+        self.size = size
+        cells = xrange(size ** 2)
+        # позиция (x, y) от 1, как у Game.calc_position
+        self.positions = tuple((index % size + 1, index // size + 1) for index in cells)
+        self.rows = tuple(tuple(xrange(y * size, (y + 1) * size)) for y in xrange(size))
+        self.columns = tuple(tuple(xrange(x, size ** 2, size)) for x in xrange(size))
+
+        self.vertical = tuple(self._shifted(index, SIDES[:2]) for index in cells)
+        self.horizontal = tuple(self._shifted(index, SIDES[2:]) for index in cells)
+        self.sides = tuple(self.vertical[index] + self.horizontal[index] for index in cells)
+        self.diagonals = tuple(self._shifted(index, DIAGONALS) for index in cells)
+        self.neighbours = tuple(self.sides[index] + self.diagonals[index] for index in cells)
+
+    def _shifted(self, index, shifts):
+        x, y = index % self.size, index // self.size
+        return tuple(
+            (y + j) * self.size + x + i for i, j in shifts
+            if 0 <= x + i < self.size and 0 <= y + j < self.size
+        )
+
+    def halo(self, cells):
+        """Клетки вокруг области cells (по сторонам и углам), без неё самой"""
+        halo = set()
+        for index in cells:
+            halo.update(self.neighbours[index])
+        halo.difference_update(cells)
+        return sorted(halo)
+
+    def flood(self, field, index, state):
+        """Индексы 8-связной области клеток field в состоянии state, содержащей index"""
+        area = {index}
+        stack = [index]
+        while stack:
+            for neighbour in self.neighbours[stack.pop()]:
+                if neighbour not in area and field[neighbour] == state:
+                    area.add(neighbour)
+                    stack.append(neighbour)
+        return area
+
+
+def get_geometry(size):
+    geometry = _geometries.get(size)
+    if geometry is None:
+        geometry = _geometries[size] = Geometry(size)
+    return geometry
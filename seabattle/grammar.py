@@ -0,0 +1,114 @@
+# coding: utf-8
+"""
+Быстрый разбор частых реплик без rasa.
+
+Большая часть реплик в игре - это ход соперника ("я хожу 2 10", "мимо, я хожу
+в семь девять") и короткие ответы на наш ход ("ранил", "убил"). Их понимает
+простая грамматика: ход - это регулярное выражение с координатами из чисел,
+которые умеет Game.convert_to_position, а короткие ответы - точные фразы без
+сущностей из config/intents_config.json. Всё, что грамматика не узнала
+наверняка, разбирает rasa.
+
+parse возвращает словарь в формате DataRouter.parse или None. guess - более
+смелый разбор на случай, когда rasa не успела к дедлайну хода (см. budget).
+"""
+
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+import re
+
+from seabattle import game
+
+
+INTENTS_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              'config', 'intents_config.json')
+
+# интенты, для которых сущности не нужны, и их можно узнавать по фразе целиком
+PHRASE_INTENTS = ('newgame', 'letsstart', 'hit', 'kill', 'dontunderstand', 'victory', 'defeat')
+
+_NUMBER_WORDS = list(game.BaseGame.str_numbers) + [
+    word for word, value in game.BaseGame.letters_mapping.items() if value.isdigit()
+]
+# только координаты поля 1..10: реплики с "0" или "11" разбирает rasa
+_COORD = r'(?:10|[1-9]|%s)' % '|'.join(sorted(_NUMBER_WORDS, key=len, reverse=True))
+SHOT_PATTERN = re.compile(
+    r'^(?:мимо )?я у?хожу (?:в |на )?(?P<coords>%s %s)$' % (_COORD, _COORD),
+    re.UNICODE,
+)
+# пара координат в любом месте реплики, для guess
+_COORDS = re.compile(r'(?:^| )(?P<coords>%s %s)(?= |$)' % (_COORD, _COORD), re.UNICODE)
+_COORD_WORD = re.compile(r'^%s$' % _COORD, re.UNICODE)
+
+_PUNCTUATION = re.compile(r'[^\w\s]+', re.UNICODE)
+_SPACES = re.compile(r'\s+', re.UNICODE)
+
+
+def normalize(text):
+    """Нижний регистр, ё как е, без знаков препинания и лишних пробелов"""
+    text = text.lower().replace('ё', 'е')
+    text = _PUNCTUATION.sub(' ', text)
+    return _SPACES.sub(' ', text).strip()
+
+
+def load_phrases(path=INTENTS_CONFIG):
+    """Фразы без сущностей из обучающей выборки rasa: {нормализованная фраза: интент}"""
+    with io.open(path, encoding='utf-8') as f:
+        examples = json.load(f)['rasa_nlu_data']['common_examples']
+
+    phrases = {}
+    for example in examples:
+        if example['intent'] in PHRASE_INTENTS and not example['entities']:
+            phrases[normalize(example['text'])] = example['intent']
+    return phrases
+
+
+PHRASES = load_phrases()
+
+
+def _response(text, intent, entities=(), confidence=1.0, source='grammar'):
+    return {
+        'text': text,
+        'intent': {'name': intent, 'confidence': confidence},
+        'entities': list(entities),
+        'source': source,
+    }
+
+
+def _shot_entity(match):
+    return {
+        'entity': 'hit_entity',
+        'value': match.group('coords'),
+        'start': match.start('coords'),
+        'end': match.end('coords'),
+    }
+
+
+def parse(message):
+    """Разбор реплики грамматикой; None, если реплику надо отдать rasa"""
+    text = normalize(message)
+
+    intent = PHRASES.get(text)
+    if intent is not None:
+        return _response(text, intent)
+
+    match = SHOT_PATTERN.match(text)
+    if match is not None:
+        return _response(text, 'miss', [_shot_entity(match)])
+
+    return None
+
+
+def guess(message):
+    """
+    Грубый разбор, когда ждать rasa уже некогда: реплика, в которой ровно две
+    координаты и они стоят рядом, считается ходом соперника. Иначе "не поняла"
+    с нулевой уверенностью, и DialogManager попросит повторить ход.
+    """
+    text = normalize(message)
+    match = _COORDS.search(text)
+    if match is not None and sum(1 for word in text.split() if _COORD_WORD.match(word)) == 2:
+        return _response(text, 'miss', [_shot_entity(match)], confidence=0.8, source='guess')
+    return _response(text, 'dontunderstand', confidence=0.0, source='timeout')
@@ -0,0 +1,36 @@
+# coding: utf-8
+"""
+Настройки gunicorn для webhook'а.
+
+    gunicorn -c seabattle/gunicorn_config.py seabattle.api:app
+
+Приложение импортируется в мастере (preload_app), поэтому модель rasa
+загружается один раз до форка. Каждый воркер после форка создаёт свой пул игр,
+прогревает модель и только потом начинает принимать запросы.
+
+Несколько воркеров (SEABATTLE_WORKERS) работают только с общими сессиями,
+SEABATTLE_SESSION_STORE=sqlite://...: сессии в памяти и замки пользователей
+у каждого процесса свои, и повтор запроса, попавший в другой воркер, не нашёл
+бы игру. С сессиями в памяти воркер всегда один.
+"""
+
+from __future__ import unicode_literals
+
+import os
+
+from seabattle import nlu
+from seabattle import pool
+from seabattle import session
+
+
+bind = os.environ.get('SEABATTLE_BIND', '[::]:5000')
+workers = int(os.environ.get('SEABATTLE_WORKERS', 4)) if session.store.shared else 1
+preload_app = True
+
+nlu.defer_warmup = True
+
+
+def post_fork(server, worker):
+    # пул игр свой у каждого воркера: его поток начинает наполнять очередь, пока греется модель
+    pool.get_pool()
+    nlu.post_fork()
@@ -0,0 +1,212 @@
+# coding: utf-8
+"""
+Метрики процесса в текстовом формате Prometheus (GET /metrics).
+
+Каждый ход (protocol.emit_turn) попадает в гистограммы и счётчики:
+    seabattle_request_seconds{intent}         время всего запроса
+    seabattle_stage_seconds{stage,intent}     стадии хода: nlu, handler, response
+    seabattle_nlu_confidence{source}          уверенность разбора: grammar, cache, rasa, guess, timeout
+    seabattle_responses_total{response}       ответы навыка, в том числе dontunderstand
+    seabattle_shots_total, seabattle_enemy_shots_total{result}
+
+Выстрелом считается только новый выстрел навыка: повтор прошлого в ответ на
+"не поняла" (repeated_shot в событии хода) в seabattle_shots_total не попадает.
+
+Остальное снимается в момент запроса /metrics из счётчиков модулей: сессии
+(seabattle_session_*), пул игр (seabattle_pool_*), кэш и пачки разборов
+(seabattle_nlu_cache_*, seabattle_nlu_batch_*), бюджет хода (seabattle_budget_*),
+лог ходов (seabattle_events_*) и разбор координат (seabattle_coords_*).
+
+Наблюдение - это поиск корзины bisect и несколько сложений под одним замком,
+так что метрики можно не выключать. Метрики свои у каждого процесса: при
+нескольких воркерах gunicorn каждый отдаёт свои, и Prometheus складывает их
+по меткам экземпляра.
+"""
+
+from __future__ import unicode_literals
+
+import bisect
+import threading
+
+from seabattle import budget
+from seabattle import game
+from seabattle import events
+from seabattle import nlu
+from seabattle import nlu_batch
+from seabattle import nlu_cache
+from seabattle import pool
+from seabattle import priors
+from seabattle import records
+from seabattle import session
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 1.5, 2.5, 5.0)
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+CONFIDENCE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99, 1.0)
+
+STAGES = ('nlu', 'handler', 'response')
+
+_lock = threading.Lock()
+
+
+def _escape(value):
+    return ('%s' % value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value)) for name, value in pairs)
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, (int, long)):
+        return '%d' % value
+    return repr(float(value))
+
+
+class Counter(object):
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, values=(), amount=1):
+        with _lock:
+            self._values[values] = self._values.get(values, 0) + amount
+
+    def samples(self):
+        with _lock:
+            items = sorted(self._values.items())
+        return [(self.name, _labels(self.labels, values), value) for values, value in items]
+
+
+class Histogram(object):
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets) + (float('inf'),)
+        # метки -> [число наблюдений по корзинам (не накопительно)..., сумма]
+        self._values = {}
+
+    def observe(self, value, values=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            counts = self._values.get(values)
+            if counts is None:
+                counts = self._values[values] = [0] * len(self.buckets) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with _lock:
+            items = sorted((values, list(counts)) for values, counts in self._values.items())
+        result = []
+        for values, counts in items:
+            total = 0
+            for bound, count in zip(self.buckets, counts):
+                total += count
+                result.append((self.name + '_bucket', _labels(self.labels, values, [('le', _number(bound))]), total))
+            result.append((self.name + '_sum', _labels(self.labels, values), counts[-1]))
+            result.append((self.name + '_count', _labels(self.labels, values), total))
+        return result
+
+
+request_seconds = Histogram('seabattle_request_seconds', 'Webhook request latency', REQUEST_BUCKETS, ('intent',))
+stage_seconds = Histogram('seabattle_stage_seconds', 'Turn stage latency', STAGE_BUCKETS, ('stage', 'intent'))
+nlu_confidence = Histogram('seabattle_nlu_confidence', 'Intent confidence by parser', CONFIDENCE_BUCKETS,
+                           ('source',))
+responses = Counter('seabattle_responses_total', 'Skill responses by kind', ('response',))
+shots = Counter('seabattle_shots_total', 'Shots made by the skill')
+enemy_shots = Counter('seabattle_enemy_shots_total', 'Opponent shots by result', ('result',))
+
+REGISTRY = [request_seconds, stage_seconds, nlu_confidence, responses, shots, enemy_shots]
+
+
+def observe_turn(event):
+    """Учитывает ход по событию DialogManager.event с таймингами запроса"""
+    intent = event.get('intent') or 'unknown'
+    timings = event.get('timings', {})
+    if 'request_ms' in timings:
+        request_seconds.observe(timings['request_ms'] / 1000.0, (intent,))
+    for stage in STAGES:
+        value = timings.get(stage + '_ms')
+        if value is not None:
+            stage_seconds.observe(value / 1000.0, (stage, intent))
+    if event.get('confidence') is not None:
+        nlu_confidence.observe(event['confidence'], (event.get('nlu', 'rasa'),))
+    if 'response' in event:
+        responses.inc((event['response'],))
+    if 'shot' in event:
+        shots.inc()
+    if 'result' in event:
+        enemy_shots.inc((event['result'],))
+
+
+def _snapshot(prefix, source):
+    """Метрики модуля или объекта со stats (и metrics()): stats - счётчики, остальное - значения"""
+    values = source.metrics() if hasattr(source, 'metrics') else dict(source.stats)
+    counters = set(getattr(source, 'stats', ()))
+    result = []
+    for key, value in sorted(values.items()):
+        if value is None or isinstance(value, bool):
+            continue
+        if key in counters:
+            result.append(('%s_%s_total' % (prefix, key), 'counter', value))
+        else:
+            result.append(('%s_%s' % (prefix, key), 'gauge', value))
+    return result
+
+
+def _sources():
+    yield 'seabattle_session', session.store
+    # /metrics не должен создавать пул и запускать его поток
+    if pool.get_pool(create=False) is not None:
+        yield 'seabattle_pool', pool.get_pool(create=False)
+    yield 'seabattle_budget', budget
+    yield 'seabattle_events', events
+    yield 'seabattle_coords', game.BaseGame.position_parser
+    if priors.get_priors() is not None:
+        yield 'seabattle_priors', priors.get_priors()
+    if records.get_writer() is not None:
+        yield 'seabattle_records', records.get_writer()
+    # до загрузки модели nlu.router ещё нет, а кэш и пачки можно отключить
+    router = nlu.router
+    if isinstance(router, nlu_cache.CachedRouter):
+        yield 'seabattle_nlu_cache', router
+        router = router.router
+    if isinstance(router, nlu_batch.BatchingRouter):
+        yield 'seabattle_nlu_batch', router
+
+
+def render(extra=()):
+    """
+    Все метрики процесса в текстовом формате Prometheus.
+
+    extra - дополнительные значения сервера: (имя, 'counter' или 'gauge', значение).
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.append('# HELP %s %s' % (metric.name, metric.help))
+        lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+        for name, labels, value in metric.samples():
+            lines.append('%s%s %s' % (name, labels, _number(value)))
+
+    snapshot = []
+    for prefix, source in _sources():
+        snapshot.extend(_snapshot(prefix, source))
+    for name, kind, value in snapshot + list(extra):
+        lines.append('# TYPE %s %s' % (name, kind))
+        lines.append('%s %s' % (name, _number(value)))
+    return '\n'.join(lines) + '\n'
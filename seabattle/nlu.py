@@ -0,0 +1,143 @@
+# coding: utf-8
+"""
+Жизненный цикл модели rasa.
+
+Модель загружается явно (load), а не при импорте dialog_manager. Затем через
+неё прогоняется набор фраз для прогрева (warmup): первый вывод TensorFlow после
+загрузки заметно медленнее последующих, и платить за него должен не первый
+пользователь после выкладки. Пока прогрев не закончен, is_ready() возвращает
+False, и на этом построен /ready в api.py.
+
+При запуске через gunicorn с preload_app (seabattle/gunicorn_config.py) модель
+загружается один раз в мастер-процессе до форка, и воркеры делят её страницы
+памяти copy-on-write. Прогрев при этом делается уже в каждом воркере в post_fork:
+до форка модель только читается с диска, а разборы идут уже в воркерах.
+
+parse с дедлайном (budget.Deadline) разбирает реплику в потоке budget.Workers и
+ждёт не дольше дедлайна. Опоздавший разбор всё равно попадёт в кэш, и когда
+Алиса повторит реплику, ответ будет быстрым.
+
+Промахи кэша разбираются пачками (nlu_batch): cache -> batch -> DataRouter.
+
+Настройки берутся из окружения:
+    SEABATTLE_NLU_WARMUP  файл с фразами для прогрева, по одной на строку;
+                          по умолчанию - фразы из config/intents_config.json
+"""
+
+from __future__ import unicode_literals
+
+import io
+import json
+import logging
+import os
+import threading
+import time
+
+from seabattle import budget
+from seabattle import events
+from seabattle import grammar
+from seabattle import nlu_batch
+from seabattle import nlu_cache
+
+
+log = logging.getLogger(__name__)
+
+MODEL_DIR = 'mldata/'
+
+router = None
+defer_warmup = False
+
+_ready = threading.Event()
+_load_lock = threading.Lock()
+
+
+def _load_interpreters(data_router):
+    """
+    Сам DataRouter создаёт интерпретатор только при первом parse. Здесь то же,
+    что делает Project.parse (rasa_nlu 0.12), но без разбора фразы.
+    """
+    for project in data_router.project_store.values():
+        model_name = project._latest_project_model()
+        if not project._models.get(model_name):
+            project._models[model_name] = project._interpreter_for_model(model_name)
+
+
+def load(path=MODEL_DIR):
+    """Загружает модель один раз на процесс (или один раз до форка)"""
+    global router
+    with _load_lock:
+        if router is None:
+            # rasa импортируется только здесь: с подставленным router (нагрузочный
+            # тест с заглушкой) webhook работает и без установленной rasa_nlu
+            from rasa_nlu.data_router import DataRouter
+
+            started = time.time()
+            data_router = DataRouter(path)
+            _load_interpreters(data_router)
+            router = nlu_cache.from_environ(nlu_batch.from_environ(data_router), path)
+            log.info('NLU model loaded in %.1f s', time.time() - started)
+    return router
+
+
+def warmup_texts():
+    path = os.environ.get('SEABATTLE_NLU_WARMUP')
+    if path:
+        with io.open(path, encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+
+    with io.open(grammar.INTENTS_CONFIG, encoding='utf-8') as f:
+        examples = json.load(f)['rasa_nlu_data']['common_examples']
+    return [example['text'] for example in examples]
+
+
+def warmup(texts=None):
+    """Прогоняет фразы через модель и кэш и помечает процесс готовым"""
+    started = time.time()
+    texts = warmup_texts() if texts is None else texts
+    load().warm(texts)
+    _ready.set()
+    log.info('NLU warmup: %s phrases in %.1f s', len(texts), time.time() - started)
+
+
+def start():
+    """Загрузка и, если прогрев не отложен до форка, прогрев"""
+    load()
+    if not defer_warmup:
+        warmup()
+
+
+def post_fork():
+    """
+    Вызывается в воркере сразу после форка.
+
+    Потоки родителя в воркер не переходят, поэтому логирование перезапускается
+    со своим фоновым потоком, а замок кэша создаётся заново. После этого воркер
+    прогревает модель.
+    """
+    _ready.clear()
+    events.configure()
+    if router is not None:
+        router.reset_after_fork()
+    warmup()
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def get_router():
+    if router is None:
+        start()
+    return router
+
+
+def parse(message, deadline=None):
+    """Разбор реплики моделью; с deadline - budget.DeadlineExceeded, если не успели"""
+    router_obj = get_router()
+    if deadline is None:
+        return router_obj.parse(message)
+
+    response = router_obj.lookup(message)
+    if response is None:
+        response = budget.get_workers().call(deadline, router_obj.parse_uncached, message)
+    return response
@@ -0,0 +1,249 @@
+# coding: utf-8
+"""
+Разбор реплик rasa пачками.
+
+Один DataRouter.parse - это один документ spaCy и один запуск сессии
+TensorFlow (intent_classifier_tensorflow_embedding) на реплику. В пик реплики
+разных пользователей приходят с разницей в миллисекунды, и их выгоднее
+разобрать вместе: spaCy получает их через nlp.pipe, классификаторы - одной
+матрицей признаков.
+
+BatchingRouter встаёт между nlu_cache.CachedRouter и DataRouter и повторяет
+интерфейс DataRouter (extract/parse). parse кладёт реплику в очередь и ждёт;
+фоновый поток берёт из очереди первую реплику, ждёт остальные не дольше
+window секунд или до max_batch штук и разбирает их одним вызовом parse_many.
+
+Реплики разбираются в потоках, которые ждут rasa (budget.Workers или потоки
+webhook'а), поэтому пачка не бывает больше числа таких потоков: при
+SEABATTLE_NLU_BATCH_SIZE больше SEABATTLE_NLU_THREADS стоит поднять и его.
+
+Настройки берутся из окружения:
+    SEABATTLE_NLU_BATCH_SIZE       наибольший размер пачки, по умолчанию 16; 1 отключает пачки
+    SEABATTLE_NLU_BATCH_WINDOW_MS  сколько ждать реплики для пачки, по умолчанию 2 мс
+"""
+
+from __future__ import unicode_literals
+
+import functools
+import os
+import Queue
+import threading
+import time
+
+import numpy as np
+
+
+DEFAULT_SIZE = 16
+DEFAULT_WINDOW_MS = 2
+DEFAULT_PROJECT = 'default'
+
+
+class _Pending(object):
+    def __init__(self, data):
+        self.data = data
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class BatchingRouter(object):
+    """DataRouter, который копит реплики из разных потоков и разбирает их пачкой"""
+
+    def __init__(self, router, window=DEFAULT_WINDOW_MS / 1000.0, max_batch=DEFAULT_SIZE, parse_many=None):
+        self.router = router
+        self.window = window
+        self.max_batch = max_batch
+        self._parse_many = parse_many or functools.partial(parse_many_rasa, router)
+        self.stats = {
+            'batches': 0,
+            'texts': 0,
+            'largest': 0,
+        }
+        self._queue = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def extract(self, data):
+        return self.router.extract(data)
+
+    def parse(self, data):
+        pending = _Pending(data)
+        self._get_queue().put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.response
+
+    def parse_many(self, datas):
+        """Разбор списка запросов пачками в текущем потоке (прогрев кэша)"""
+        responses = []
+        for start in xrange(0, len(datas), self.max_batch):
+            responses.extend(self._run(datas[start:start + self.max_batch]))
+        return responses
+
+    def _get_queue(self):
+        # поток сборщика после форка в воркере не существует, как и поток пула игр
+        if self._queue is None or self._pid != os.getpid():
+            with self._lock:
+                if self._queue is None or self._pid != os.getpid():
+                    self._queue = Queue.Queue()
+                    self._pid = os.getpid()
+                    thread = threading.Thread(target=self._collect_forever, args=(self._queue,),
+                                              name='seabattle-nlu-batch')
+                    thread.daemon = True
+                    thread.start()
+        return self._queue
+
+    def _collect(self, queue):
+        batch = [queue.get()]
+        until = time.time() + self.window
+        while len(batch) < self.max_batch:
+            remaining = until - time.time()
+            try:
+                batch.append(queue.get(timeout=remaining) if remaining > 0 else queue.get_nowait())
+            except Queue.Empty:
+                break
+        return batch
+
+    def _collect_forever(self, queue):
+        while True:
+            batch = self._collect(queue)
+            try:
+                responses = self._run([pending.data for pending in batch])
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+                    pending.done.set()
+                continue
+            for pending, response in zip(batch, responses):
+                pending.response = response
+                pending.done.set()
+
+    def _run(self, datas):
+        responses = self._parse_many(datas)
+        self.stats['batches'] += 1
+        self.stats['texts'] += len(datas)
+        self.stats['largest'] = max(self.stats['largest'], len(datas))
+        return responses
+
+    def metrics(self):
+        return dict(
+            self.stats,
+            window_ms=self.window * 1000,
+            max_batch=self.max_batch,
+            mean=float(self.stats['texts']) / self.stats['batches'] if self.stats['batches'] else None,
+        )
+
+
+def _interpreter(data_router, datas):
+    """Интерпретатор, общий для всех запросов пачки, или None"""
+    projects = set(data.get('project') or DEFAULT_PROJECT for data in datas)
+    if len(projects) != 1 or any(data.get('model') for data in datas):
+        return None
+    project = data_router.project_store.get(projects.pop())
+    if project is None:
+        return None
+    # как nlu._load_interpreters: последняя модель проекта, уже загруженная
+    return project._models.get(project._latest_project_model())
+
+
+def parse_many_rasa(data_router, datas):
+    """
+    То же, что [data_router.parse(data) for data in datas], но компоненты
+    конвейера, для которых это выгодно, обрабатывают сразу всю пачку.
+    Остальные компоненты по-прежнему вызываются на каждую реплику.
+    """
+    interpreter = _interpreter(data_router, datas)
+    if interpreter is None or not all(data['text'] for data in datas):
+        return [data_router.parse(data) for data in datas]
+
+    # rasa_nlu нужна только здесь, а nlu_batch должен импортироваться и без неё
+    from rasa_nlu.training_data import Message
+
+    messages = [
+        Message(data['text'], interpreter.default_output_attributes(), time=data.get('time'))
+        for data in datas
+    ]
+    for component in interpreter.pipeline:
+        batched = _BATCHED.get(component.name)
+        if batched is None or not batched(component, messages):
+            for message in messages:
+                component.process(message, **interpreter.context)
+
+    responses = []
+    for message in messages:
+        output = interpreter.default_output_attributes()
+        output.update(message.as_dict(only_output_properties=True))
+        responses.append(data_router.format_response(output))
+    return responses
+
+
+def _spacy_docs(component, messages):
+    texts = [message.text for message in messages]
+    if not component.component_config.get('case_sensitive'):
+        texts = [text.lower() for text in texts]
+    for message, doc in zip(messages, component.nlp.pipe(texts)):
+        message.set('spacy_doc', doc)
+    return True
+
+
+def _set_intents(messages, names, confidences):
+    from rasa_nlu.classifiers import INTENT_RANKING_LENGTH
+
+    for message, row_names, row_confidences in zip(messages, names, confidences):
+        ranking = list(zip(row_names, row_confidences))[:INTENT_RANKING_LENGTH]
+        if ranking:
+            intent = {'name': ranking[0][0], 'confidence': ranking[0][1]}
+        else:
+            intent = {'name': None, 'confidence': 0.0}
+        message.set('intent', intent, add_to_output=True)
+        message.set('intent_ranking', [{'name': name, 'confidence': score} for name, score in ranking],
+                    add_to_output=True)
+
+
+def _sklearn_intents(component, messages):
+    if not component.clf:
+        return False
+    probabilities = component.predict_prob(np.stack([message.get('text_features') for message in messages]))
+    # SklearnIntentClassifier.predict сортирует только одну строку, здесь - каждую
+    order = np.fliplr(np.argsort(probabilities, axis=1))
+    _set_intents(
+        messages,
+        [component.transform_labels_num2str(row) for row in order],
+        [probabilities[i, row] for i, row in enumerate(order)],
+    )
+    return True
+
+
+def _embedding_intents(component, messages):
+    if component.session is None:
+        return False
+    features = np.stack([message.get('text_features') for message in messages])
+    similarities = component.session.run(component.similarity_op, feed_dict={
+        component.embedding_placeholder: features,
+        component.intent_placeholder: component._create_all_Y(len(messages)),
+    })
+    names, confidences = [], []
+    for row in similarities:
+        order = row.argsort()[::-1]
+        names.append([component.inv_intent_dict[index] for index in order])
+        confidences.append(row[order].tolist())
+    _set_intents(messages, names, confidences)
+    return True
+
+
+# компоненты конвейера (config/nlu_config.yml), которые умеют обработать пачку
+_BATCHED = {
+    'nlp_spacy': _spacy_docs,
+    'intent_classifier_sklearn': _sklearn_intents,
+    'intent_classifier_tensorflow_embedding': _embedding_intents,
+}
+
+
+def from_environ(router):
+    """BatchingRouter с настройками из окружения или сам router, если пачки отключены"""
+    max_batch = int(os.environ.get('SEABATTLE_NLU_BATCH_SIZE', DEFAULT_SIZE))
+    if max_batch <= 1:
+        return router
+    window = float(os.environ.get('SEABATTLE_NLU_BATCH_WINDOW_MS', DEFAULT_WINDOW_MS)) / 1000
+    return BatchingRouter(router, window, max_batch)
@@ -0,0 +1,148 @@
+# coding: utf-8
+"""
+LRU кэш разборов rasa.
+
+Игроки повторяют одни и те же фразы, поэтому ответ DataRouter кэшируется по
+нормализованной реплике (grammar.normalize). Ключ кэша включает версию модели:
+список обученных моделей в mldata/. После переобучения версия меняется и кэш
+очищается. Версия перечитывается не чаще раза в check_interval секунд.
+
+Настройки берутся из окружения:
+    SEABATTLE_NLU_CACHE_SIZE  число фраз в кэше, по умолчанию 1024; 0 отключает кэш
+
+Кэш прогревается фразами из nlu.warmup.
+"""
+
+from __future__ import unicode_literals
+
+import collections
+import copy
+import os
+import threading
+import time
+
+from seabattle import grammar
+
+
+DEFAULT_SIZE = 1024
+
+
+def model_version(path):
+    """Имена моделей в директории rasa: project/model_..., отсортированные"""
+    models = []
+    if not os.path.isdir(path):
+        return tuple(models)
+    for project in sorted(os.listdir(path)):
+        project_path = os.path.join(path, project)
+        if project.startswith('.') or not os.path.isdir(project_path):
+            continue
+        for model in sorted(os.listdir(project_path)):
+            if os.path.isdir(os.path.join(project_path, model)):
+                models.append('%s/%s' % (project, model))
+    return tuple(models)
+
+
+class CachedRouter(object):
+    """Обёртка над DataRouter: parse(text) с LRU кэшем по нормализованной фразе"""
+
+    def __init__(self, router, path, maxsize=DEFAULT_SIZE, check_interval=5.0, clock=time.time):
+        self.router = router
+        self.path = path
+        self.maxsize = maxsize
+        self.check_interval = check_interval
+        self.clock = clock
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0,
+        }
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._version = model_version(path)
+        self._checked = clock()
+
+    def _check_version(self):
+        now = self.clock()
+        if now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        version = model_version(self.path)
+        if version != self._version:
+            self._version = version
+            self._cache.clear()
+            self.stats['invalidations'] += 1
+
+    def parse(self, text):
+        response = self.lookup(text)
+        if response is None:
+            response = self.parse_uncached(text)
+        return response
+
+    def lookup(self, text):
+        """Разбор из кэша или None; промахом не считается"""
+        key = grammar.normalize(text)
+        with self._lock:
+            self._check_version()
+            response = self._cache.pop(key, None)
+            if response is None:
+                return None
+            self._cache[key] = response
+            self.stats['hits'] += 1
+        return dict(copy.deepcopy(response), source='cache')
+
+    def parse_uncached(self, text):
+        """Разбор моделью; результат кладётся в кэш"""
+        key = grammar.normalize(text)
+        with self._lock:
+            self.stats['misses'] += 1
+            version = self._version
+
+        response = self.router.parse(self.router.extract({'q': text}))
+        self._store(key, response, version)
+        return response
+
+    def _store(self, key, response, version):
+        with self._lock:
+            # разбор, сделанный старой моделью, в кэш после переобучения не кладём
+            if not self.maxsize or version != self._version:
+                return
+            self._cache[key] = copy.deepcopy(response)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def warm(self, texts):
+        """Разбирает фразы заранее, чтобы первые запросы с ними попали в кэш"""
+        keys = collections.OrderedDict()
+        for text in texts:
+            key = grammar.normalize(text)
+            if key not in self._cache and key not in keys:
+                keys[key] = self.router.extract({'q': text})
+
+        parse_many = getattr(self.router, 'parse_many', None)
+        if parse_many is not None:
+            # nlu_batch.BatchingRouter разбирает их пачками
+            responses = parse_many(list(keys.values()))
+        else:
+            responses = [self.router.parse(data) for data in keys.values()]
+        for key, response in zip(keys, responses):
+            self._store(key, response, self._version)
+
+    def reset_after_fork(self):
+        # замок мог остаться захваченным потоком родителя, которого в воркере нет
+        self._lock = threading.Lock()
+
+    def metrics(self):
+        requests = self.stats['hits'] + self.stats['misses']
+        return dict(
+            self.stats,
+            size=len(self._cache),
+            maxsize=self.maxsize,
+            hit_rate=float(self.stats['hits']) / requests if requests else None,
+        )
+
+
+def from_environ(router, path):
+    """CachedRouter с размером из окружения"""
+    return CachedRouter(router, path, int(os.environ.get('SEABATTLE_NLU_CACHE_SIZE', DEFAULT_SIZE)))
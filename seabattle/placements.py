@@ -0,0 +1,142 @@
+# coding: utf-8
+"""
+Таблица всех допустимых расстановок кораблей для поля заданного размера.
+
+Для каждой длины корабля хранятся клетки, которые он занимает (cover), и клетки
+вокруг него, которые после установки становятся недоступны (halo). Таблица
+строится один раз на процесс и дальше только читается: ей пользуются и генерация
+поля, и стратегии стрельбы.
+
+Если задана переменная окружения SEABATTLE_PLACEMENTS_DIR, таблица хранится в
+этой директории в виде .npy файла и открывается через mmap, так что процессы,
+запущенные после форка, делят одни и те же страницы памяти.
+"""
+
+from __future__ import unicode_literals
+
+import os
+
+import numpy as np
+
+
+DEFAULT_SIZE = 10
+
+_tables = {}
+
+
+def _placement_cells(size, length):
+    cells = []
+    for y in xrange(size):
+        for x in xrange(size - length + 1):
+            cells.append([y * size + x + i for i in xrange(length)])
+    if length > 1:
+        for x in xrange(size):
+            for y in xrange(size - length + 1):
+                cells.append([(y + i) * size + x for i in xrange(length)])
+    return cells
+
+
+def _halo(size, cells):
+    halo = set()
+    for index in cells:
+        x, y = index % size, index // size
+        for i in [-1, 0, 1]:
+            for j in [-1, 0, 1]:
+                if 0 <= x + i < size and 0 <= y + j < size:
+                    halo.add((y + j) * size + x + i)
+    return sorted(halo.difference(cells))
+
+
+class PlacementTable(object):
+    """Расстановки кораблей длиной от 1 до size, сгруппированные по длине"""
+
+    def __init__(self, size, data):
+        self.size = size
+        # data[0] - занятые кораблём клетки, data[1] - клетки вокруг корабля
+        self.data = data
+        self.offsets = {}
+        start = 0
+        for length in xrange(1, size + 1):
+            count = len(_placement_cells(size, length)) if size else 0
+            self.offsets[length] = (start, start + count)
+            start += count
+        self._cells = {}
+        self._masks = {}
+
+    @classmethod
+    def build(cls, size):
+        rows = []
+        for length in xrange(1, size + 1):
+            rows.extend(_placement_cells(size, length))
+
+        data = np.zeros((2, len(rows), size ** 2), dtype=bool)
+        for row, cells in enumerate(rows):
+            data[0, row, cells] = True
+            data[1, row, _halo(size, cells)] = True
+        data.flags.writeable = False
+        return cls(size, data)
+
+    @classmethod
+    def load(cls, path, size):
+        data = np.load(path, mmap_mode='r')
+        return cls(size, data)
+
+    def save(self, path):
+        np.save(path, np.asarray(self.data))
+
+    def cover(self, length):
+        """Матрица (расстановки x клетки) занятых кораблём клеток"""
+        start, end = self.offsets[length]
+        return self.data[0, start:end]
+
+    def halo(self, length):
+        """Матрица (расстановки x клетки) клеток вокруг корабля"""
+        start, end = self.offsets[length]
+        return self.data[1, start:end]
+
+    def cells(self, length):
+        """Индексы клеток каждой расстановки, массив (расстановки x length)"""
+        cells = self._cells.get(length)
+        if cells is None:
+            cells = np.nonzero(self.cover(length))[1].reshape(-1, length)
+            cells.flags.writeable = False
+            self._cells[length] = cells
+        return cells
+
+    def masks(self, length):
+        """Пары битовых масок (корабль, клетки вокруг) для каждой расстановки"""
+        masks = self._masks.get(length)
+        if masks is None:
+            masks = self._masks[length] = [
+                (_to_mask(cover), _to_mask(halo))
+                for cover, halo in zip(self.cover(length), self.halo(length))
+            ]
+        return masks
+
+
+def _to_mask(row):
+    mask = 0
+    for index in np.flatnonzero(row):
+        mask |= 1 << int(index)
+    return mask
+
+
+def get_table(size):
+    table = _tables.get(size)
+    if table is None:
+        directory = os.environ.get('SEABATTLE_PLACEMENTS_DIR')
+        if directory:
+            path = os.path.join(directory, 'placements-%s.npy' % size)
+            if not os.path.exists(path):
+                # пишем во временный файл, чтобы параллельные процессы не прочли его недописанным
+                temporary = '%s.%s.npy' % (path[:-len('.npy')], os.getpid())
+                PlacementTable.build(size).save(temporary)
+                os.rename(temporary, path)
+            table = PlacementTable.load(path, size)
+        else:
+            table = PlacementTable.build(size)
+        _tables[size] = table
+    return table
+
+
+get_table(DEFAULT_SIZE)
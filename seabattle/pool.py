@@ -0,0 +1,134 @@
+# coding: utf-8
+"""
+Пул заранее подготовленных игр.
+
+Новая игра - это генерация поля и карт стрельбы (Game.start_new_game). Чтобы
+не делать это внутри запроса "новая игра", фоновый поток держит в очереди
+готовые игры: когда их становится меньше нижней отметки, поток доливает очередь
+до верхней. Запрос забирает игру из очереди за O(1) и создаёт её сам, только
+если очередь пуста.
+
+Настройки берутся из окружения:
+    SEABATTLE_GAME_POOL_SIZE  верхняя отметка, по умолчанию 32; 0 отключает пул
+    SEABATTLE_GAME_POOL_LOW   нижняя отметка, по умолчанию половина верхней
+"""
+
+from __future__ import unicode_literals
+
+import logging
+import os
+import Queue
+import threading
+
+from seabattle import game
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_SIZE = 32
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def new_game(game_cls=game.Game):
+    """Игра в том виде, в котором её ждёт DialogManager после "новая игра" """
+    game_obj = game_cls()
+    game_obj.reset_last_shot()
+    game_obj.start_new_game(numbers=True)
+    return game_obj
+
+
+class GamePool(object):
+    """Очередь готовых игр, которую фоновый поток держит между low и high"""
+
+    def __init__(self, high=DEFAULT_SIZE, low=None, factory=new_game, start=True):
+        self.high = high
+        self.low = low if low is not None else high // 2
+        self.factory = factory
+        self.queue = Queue.Queue(high) if high else None
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'generated': 0,
+            'refills': 0,
+        }
+        self._wakeup = threading.Event()
+        self._thread = None
+        if start and high:
+            self.start()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._refill_forever, name='seabattle-pool')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def size(self):
+        return self.queue.qsize() if self.queue is not None else 0
+
+    def get(self):
+        """Готовая игра из пула или, если пул пуст, новая"""
+        try:
+            if self.queue is None:
+                raise Queue.Empty()
+            game_obj = self.queue.get_nowait()
+        except Queue.Empty:
+            self.stats['misses'] += 1
+            game_obj = self.factory()
+        else:
+            self.stats['hits'] += 1
+
+        if self.size() < self.low:
+            self._wakeup.set()
+        return game_obj
+
+    def fill(self):
+        """Доливает пул до верхней отметки в текущем потоке"""
+        self.stats['refills'] += 1
+        while self.size() < self.high:
+            try:
+                self.queue.put_nowait(self.factory())
+            except Queue.Full:
+                break
+            self.stats['generated'] += 1
+
+    def _refill_forever(self):
+        while True:
+            try:
+                self.fill()
+            except Exception:
+                log.exception('Game pool refill failed')
+            self._wakeup.wait()
+            self._wakeup.clear()
+
+    def metrics(self):
+        requests = self.stats['hits'] + self.stats['misses']
+        return dict(
+            self.stats,
+            size=self.size(),
+            high=self.high,
+            low=self.low,
+            hit_rate=float(self.stats['hits']) / requests if requests else None,
+        )
+
+
+def get_pool(create=True):
+    """
+    Общий на процесс пул; создаётся при первом обращении.
+
+    После форка поток пополнения в дочернем процессе не существует, поэтому
+    пул, созданный в другом процессе, пересоздаётся. С create=False пул не
+    создаётся: если в этом процессе его ещё нет, возвращается None.
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        if not create:
+            return None
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                high = int(os.environ.get('SEABATTLE_GAME_POOL_SIZE', DEFAULT_SIZE))
+                low = os.environ.get('SEABATTLE_GAME_POOL_LOW')
+                _pool = GamePool(high, int(low) if low is not None else None)
+                _pool_pid = os.getpid()
+    return _pool
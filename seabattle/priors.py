@@ -0,0 +1,249 @@
+# coding: utf-8
+"""
+Статистика расстановок соперников: где каждый соперник ("алиса", "яндекс")
+чаще всего ставит корабли.
+
+В конце каждой партии DialogManager пишет в лог событие game с именем
+соперника и полем соперника, каким мы его узнали (game.enemy_field). Выигранная
+партия открывает все корабли, проигранная - только найденные. Задача
+агрегации читает такие логи построчно и для каждого соперника считает, сколько
+раз клетка оказалась кораблём (ships) и сколько раз её содержимое стало
+известно (seen):
+
+    python -m seabattle.priors logs/seabattle-*.log.gz --output priors-10.npy
+
+Память агрегации не зависит от длины логов: на соперника - два массива по
+клетке, а соперников не больше --max-opponents (при переполнении забывается
+тот, у кого меньше всего партий).
+
+Результат - один .npy файл со структурированным массивом, по строке на
+соперника. Процесс навыка открывает его через mmap (как placements), так что
+воркеры gunicorn делят одни страницы. В файле для каждого соперника уже лежат
+вероятность корабля в клетке (prior) и самые горячие клетки по убыванию
+(order), поэтому на ход остаётся только поиск соперника в словаре.
+Game.hunt_for_new сначала стреляет по этим клеткам, а потом - по своим картам.
+
+Настройки берутся из окружения:
+    SEABATTLE_PRIORS  путь к файлу статистики; без него статистика не используется
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import codecs
+import gzip
+import io
+import json
+import os
+import threading
+
+import numpy as np
+
+from seabattle import game
+
+
+NAME_LENGTH = 32
+DEFAULT_MAX_OPPONENTS = 10000
+# меньше партий - статистике соперника не верим
+MIN_GAMES = 20
+# сколько воображаемых партий средней плотности подмешиваем в каждую клетку
+STRENGTH = 5.0
+# клетка попадает в order, если корабль в ней вероятнее среднего хотя бы в LIFT раз
+LIFT = 1.25
+
+_priors = None
+_priors_lock = threading.Lock()
+
+
+def normalize(opponent):
+    return (opponent or '').strip().lower().replace('ё', 'е')[:NAME_LENGTH]
+
+
+def record(game_obj, opponent):
+    """Событие game для лога: что мы узнали о расстановке соперника"""
+    return {
+        'opponent': normalize(opponent),
+        'size': game_obj.size,
+        'victory': game_obj.is_victory(),
+        'enemy_field': ''.join('%d' % state for state in game_obj.enemy_field),
+    }
+
+
+def dtype(size):
+    cells = size ** 2
+    return np.dtype([
+        (str('opponent'), 'U%s' % NAME_LENGTH),
+        (str('games'), '<u4'),
+        (str('ships'), '<u4', (cells,)),
+        (str('seen'), '<u4', (cells,)),
+        (str('prior'), '<f4', (cells,)),
+        (str('order'), '<i2', (cells,)),
+        (str('top'), '<u2'),
+    ])
+
+
+class Aggregator(object):
+    """Счётчики клеток по соперникам в ограниченной памяти"""
+
+    def __init__(self, size=10, max_opponents=DEFAULT_MAX_OPPONENTS):
+        self.size = size
+        self.max_opponents = max_opponents
+        self.stats = {
+            'games': 0,
+            'skipped': 0,
+            'evicted': 0,
+        }
+        # соперник -> [партии, ships, seen]
+        self._opponents = {}
+
+    def add(self, event):
+        field = event.get('enemy_field', '')
+        if event.get('size') != self.size or len(field) != self.size ** 2:
+            self.stats['skipped'] += 1
+            return
+        opponent = normalize(event.get('opponent'))
+        counters = self._opponents.get(opponent)
+        if counters is None:
+            if len(self._opponents) >= self.max_opponents:
+                del self._opponents[min(self._opponents, key=lambda name: self._opponents[name][0])]
+                self.stats['evicted'] += 1
+            cells = self.size ** 2
+            counters = self._opponents[opponent] = [0, np.zeros(cells, np.uint32), np.zeros(cells, np.uint32)]
+
+        states = np.frombuffer(field.encode('ascii'), dtype=np.uint8) - ord('0')
+        counters[0] += 1
+        counters[1] += states == game.SHIP
+        counters[2] += (states == game.SHIP) | (states == game.MISS)
+        self.stats['games'] += 1
+
+    def read(self, lines):
+        """События game из строк лога (json на строку, остальные строки пропускаются)"""
+        for line in lines:
+            line = line.strip()
+            if not line.startswith('{'):
+                continue
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if event.get('event') == 'game':
+                self.add(event)
+
+    def table(self):
+        rows = np.zeros(len(self._opponents), dtype=dtype(self.size))
+        for row, name in zip(rows, sorted(self._opponents)):
+            games, ships, seen = self._opponents[name]
+            row['opponent'] = name
+            row['games'] = games
+            row['ships'] = ships
+            row['seen'] = seen
+            density = float(ships.sum()) / seen.sum() if seen.sum() else 0.0
+            prior = (ships + STRENGTH * density) / (seen + STRENGTH)
+            row['prior'] = prior
+            order = np.argsort(-prior, kind='mergesort')
+            row['order'] = order
+            if games >= MIN_GAMES and density:
+                row['top'] = min(int((prior > density * LIFT).sum()), self.size ** 2 // 4)
+        return rows
+
+    def save(self, path):
+        # как placements: пишем во временный файл, чтобы процессы не прочли его недописанным
+        temporary = '%s.%s.npy' % (path[:-len('.npy')] if path.endswith('.npy') else path, os.getpid())
+        np.save(temporary, self.table())
+        os.rename(temporary, path)
+
+
+class Priors(object):
+    """Статистика соперников, открытая через mmap"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.size = int(round(rows.dtype['prior'].shape[0] ** 0.5))
+        self._index = dict((name, row) for row, name in enumerate(rows['opponent']))
+        # соперник из файла -> клетки для первых выстрелов; кортеж int, а не срез mmap.
+        # Незнакомые имена не запоминаем: их может быть сколько угодно
+        self._orders = {}
+        self.stats = {
+            'lookups': 0,
+            'known': 0,
+        }
+
+    @classmethod
+    def load(cls, path):
+        return cls(np.load(path, mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def metrics(self):
+        return dict(self.stats, opponents=len(self.rows))
+
+    def prior(self, opponent):
+        """Вероятность корабля по клеткам для соперника или None"""
+        row = self._index.get(normalize(opponent))
+        return self.rows['prior'][row] if row is not None else None
+
+    def order(self, opponent, size):
+        """Самые вероятные клетки соперника по убыванию или None, если статистики мало"""
+        self.stats['lookups'] += 1
+        if size != self.size:
+            return None
+        opponent = normalize(opponent)
+        order = self._orders.get(opponent, False)
+        if order is False:
+            row = self._index.get(opponent)
+            if row is None:
+                return None
+            order = None
+            if self.rows['top'][row]:
+                order = tuple(self.rows['order'][row][:self.rows['top'][row]].tolist())
+            self._orders[opponent] = order
+        if order is not None:
+            self.stats['known'] += 1
+        return order
+
+
+def get_priors():
+    """Статистика из SEABATTLE_PRIORS или None"""
+    global _priors
+    if _priors is None:
+        with _priors_lock:
+            if _priors is None:
+                path = os.environ.get('SEABATTLE_PRIORS')
+                _priors = Priors.load(path) if path else False
+    return _priors or None
+
+
+def order(opponent, size):
+    priors = get_priors()
+    return priors.order(opponent, size) if priors is not None else None
+
+
+def _open(path):
+    if path.endswith('.gz'):
+        return codecs.getreader('utf-8')(gzip.open(path))
+    return io.open(path, encoding='utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Статистика расстановок соперников по логам партий')
+    parser.add_argument('logs', nargs='+', help='логи событий, можно .gz')
+    parser.add_argument('--output', required=True, help='файл .npy для SEABATTLE_PRIORS')
+    parser.add_argument('--size', type=int, default=10)
+    parser.add_argument('--max-opponents', type=int, default=DEFAULT_MAX_OPPONENTS)
+    args = parser.parse_args()
+
+    aggregator = Aggregator(args.size, args.max_opponents)
+    for path in args.logs:
+        with _open(path) as lines:
+            aggregator.read(lines)
+    aggregator.save(args.output)
+
+    table = aggregator.table()
+    print('games: %(games)s, skipped: %(skipped)s, evicted opponents: %(evicted)s' % aggregator.stats)
+    for row in sorted(table, key=lambda row: -row['games'])[:20]:
+        print('%-32s games %6s  top cells %s' % (row['opponent'], row['games'], row['top']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# coding: utf-8
+"""
+Протокол Яндекс.Диалогов, общий для Flask (api.py) и Klein (async_api.py) серверов.
+"""
+
+from __future__ import unicode_literals
+
+import time
+
+from seabattle import dialog_manager as dm
+from seabattle import events
+from seabattle import metrics
+from seabattle import session
+
+
+def parse_request(json_body):
+    """user_id и текст реплики из запроса"""
+    user_id = json_body['session']['user_id']
+    message = json_body['request']['command'].strip()
+    if not message:
+        message = json_body['request']['original_utterance']
+    return user_id, message
+
+
+def handle_turn(session_obj, message, deadline=None):
+    """Ход диалога: разбор реплики, игра и сохранение сессии. Вызывать под замком пользователя"""
+    dm_obj = dm.DialogManager(session_obj)
+    dmresponse = dm_obj.handle_message(message, deadline)
+    session.save(session_obj)
+    return dm_obj, dmresponse
+
+
+def build_response(json_body, dmresponse):
+    response = {
+        'version': json_body['version'],
+        'session': json_body['session'],
+        'response': {
+            'text': dmresponse.text,
+            'end_session': dmresponse.end_session,
+        },
+    }
+    if dmresponse.tts is not None:
+        response['response']['tts'] = dmresponse.tts
+    return response
+
+
+def emit_turn(json_body, dm_obj, user_id, started, **timings):
+    event = dict(dm_obj.event, user_id=user_id, message_id=json_body['session'].get('message_id'))
+    event['timings'].update(timings)
+    event['timings']['request_ms'] = round((time.time() - started) * 1000, 3)
+    # метрики считают каждый ход, лог ходов может быть прорежен
+    metrics.observe_turn(event)
+    events.emit('turn', event)
@@ -0,0 +1,68 @@
+# coding: utf-8
+"""
+Множество индексов клеток со случайным выбором и удалением за O(1).
+
+random.sample(set, 1) и random.choice(list(...)) каждый раз копируют всё
+множество в список, так что выбор выстрела стоил O(n) от числа клеток. Здесь
+элементы лежат в массиве, а для каждого индекса помнится его место в массиве:
+удаление переносит последний элемент на место удалённого, выбор - один
+randrange генератора партии, так что партия по-прежнему повторяется по seed.
+
+Порядок элементов в массиве зависит от истории удалений, поэтому codec
+сохраняет его как есть (RandomSet.items), а не восстанавливает заново.
+"""
+
+from __future__ import unicode_literals
+
+import array
+
+
+class RandomSet(object):
+    """Множество целых от 0 до capacity - 1"""
+
+    def __init__(self, capacity, items=()):
+        self.items = array.array(str('i'))
+        # место элемента в items или -1
+        self.positions = array.array(str('i'), [-1]) * capacity
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return self.positions[item] >= 0
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def add(self, item):
+        if self.positions[item] < 0:
+            self.positions[item] = len(self.items)
+            self.items.append(item)
+
+    def add_all(self, items):
+        for item in items:
+            self.add(item)
+
+    def discard(self, item):
+        position = self.positions[item]
+        if position < 0:
+            return
+        last = self.items.pop()
+        if last != item:
+            self.items[position] = last
+            self.positions[last] = position
+        self.positions[item] = -1
+
+    def discard_all(self, items):
+        for item in items:
+            self.discard(item)
+
+    def pop_random(self, rng):
+        """Удаляет и возвращает случайный элемент; IndexError, если множество пусто"""
+        if not self.items:
+            raise IndexError('pop from empty RandomSet')
+        item = self.items[rng.randrange(len(self.items))]
+        self.discard(item)
+        return item
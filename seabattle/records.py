@@ -0,0 +1,397 @@
+# coding: utf-8
+"""
+Записи доигранных партий: append-only файлы записей фиксированной длины.
+
+Каждая партия ведёт журнал своих ходов (BaseGame.journal, виды ходов - в
+game.Moves): свои выстрелы, ответы соперника на них, выстрелы соперника и сброс
+последнего выстрела, плюс время выбора каждого своего выстрела. В конце партии
+webhook (DialogManager) и simulate.py дописывают одну запись в сегмент:
+
+    заголовок  'SBREC', версия формата, длина записи (HEADER, 16 байт)
+    записи     RECORD: seed, класс игры (codec.KINDS), размер поля, исход,
+               соперник, длины кораблей, своё поле в начале партии битами,
+               клетки priors, журнал ходов и время выстрелов
+
+Запись пишется одним os.write в файл, открытый с O_APPEND, поэтому записи из
+потоков одного процесса не перемешиваются. Каждый процесс пишет в свой
+сегмент, при SEGMENT_RECORDS записях начинается следующий.
+
+Читаются сегменты через np.memmap: Segment.records - структурированный
+массив по всем записям файла, так что сводки по миллионам партий считаются
+векторно, без разбора текстовых логов. Недописанная запись в конце файла
+пропускается.
+
+replay() переигрывает запись через класс игры: поле заново генерируется из
+seed, ответы соперника подаются в том же порядке, и выбранные выстрелы должны
+совпасть с записанными. Не совпадают они, если код стратегии изменился или
+ход в webhook'е был урезан дедлайном; с этого хода переигровка больше не
+выбирает выстрелы сама, а только повторяет ходы партии.
+
+    python -m seabattle.records records/ --check
+    python -m seabattle.records records/games-20181020-101500-4242-0.rec --replay 17
+
+Настройки берутся из окружения:
+    SEABATTLE_RECORDS  директория сегментов; без неё webhook партии не записывает
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import collections
+import glob
+import logging
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from seabattle import codec
+from seabattle import game
+from seabattle.game import Moves
+
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'SBREC'
+VERSION = 1
+# game.BaseGame.start_new_game не даёт поле больше 10x10
+MAX_SIZE = 10
+MAX_SHIPS = 16
+# priors.order не длиннее четверти поля
+MAX_PRIORS = MAX_SIZE ** 2 // 4
+MAX_MOVES = game.JOURNAL_LIMIT
+SEGMENT_RECORDS = 100000
+NO_CELL = 0xFF
+
+# исход партии и признак того, что журнал не поместился
+VICTORY = 1
+DEFEAT = 2
+TRUNCATED = 4
+
+HEADER = struct.Struct(str('<5sBH8x'))
+RECORD = np.dtype([
+    (str('finished'), '<f8'),
+    (str('seed'), '<u4'),
+    (str('kind'), 'u1'),
+    (str('size'), 'u1'),
+    (str('flags'), 'u1'),
+    (str('opponent'), 'S32'),
+    (str('ships'), 'u1', (MAX_SHIPS,)),
+    (str('field'), 'u1', ((MAX_SIZE ** 2 + 7) // 8,)),
+    (str('priors'), 'u1', (MAX_PRIORS,)),
+    (str('moves'), '<u2'),
+    (str('journal'), '<u2', (MAX_MOVES,)),
+    (str('shots'), '<u2'),
+    # время выбора выстрела в единицах по 10 мкс
+    (str('timings'), '<u2', (MAX_SIZE ** 2,)),
+])
+
+Replay = collections.namedtuple('Replay', ['game', 'exact', 'diverged'])
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+class RecordError(Exception):
+    pass
+
+
+def _opponent(opponent):
+    # обрезаем по символам, чтобы не разрезать букву посередине
+    opponent = (opponent or '')[:32]
+    while len(opponent.encode('utf-8')) > 32:
+        opponent = opponent[:-1]
+    return opponent.encode('utf-8')
+
+
+def encode(game_obj, opponent=None, finished=None):
+    """Доигранная (или брошенная) партия -> массив из одной записи RECORD"""
+    if game_obj.journal is None:
+        raise RecordError('Game has no journal')
+    try:
+        kind = codec.KINDS.index(type(game_obj))
+    except ValueError:
+        raise RecordError('Unsupported game class: %s' % type(game_obj).__name__)
+
+    cells = game_obj.size ** 2
+    rows = np.zeros(1, dtype=RECORD)
+    record = rows[0]
+    record['finished'] = finished if finished is not None else time.time()
+    record['seed'] = game_obj.seed
+    record['kind'] = kind
+    record['size'] = game_obj.size
+    record['opponent'] = _opponent(opponent)
+    record['ships'][:len(game_obj.ships)] = game_obj.ships
+    ships = np.zeros(MAX_SIZE ** 2, dtype=bool)
+    ships[:cells] = np.in1d(list(game_obj.field), [game.SHIP, game.HIT])
+    record['field'] = np.packbits(ships)
+
+    priors = getattr(game_obj, 'prior_order', None) or ()
+    record['priors'] = NO_CELL
+    record['priors'][:len(priors)] = priors
+
+    record['moves'] = len(game_obj.journal)
+    record['journal'][:len(game_obj.journal)] = game_obj.journal
+    timings = game_obj.shot_timings[:MAX_SIZE ** 2]
+    record['shots'] = len(timings)
+    record['timings'][:len(timings)] = timings
+
+    flags = 0
+    if game_obj.is_victory():
+        flags |= VICTORY
+    if game_obj.is_defeat():
+        flags |= DEFEAT
+    if len(game_obj.journal) >= MAX_MOVES or len(game_obj.shot_timings) > MAX_SIZE ** 2:
+        flags |= TRUNCATED
+    record['flags'] = flags
+    return rows
+
+
+def field(record):
+    """Своё поле в начале партии: SHIP и EMPTY по клеткам"""
+    cells = int(record['size']) ** 2
+    ships = np.unpackbits(record['field'])[:cells]
+    return [game.SHIP if ship else game.EMPTY for ship in ships]
+
+
+def ships(record):
+    return [int(length) for length in record['ships'] if length]
+
+
+def priors(record):
+    return tuple(int(index) for index in record['priors'] if index != NO_CELL) or None
+
+
+def journal(record):
+    return record['journal'][:record['moves']].tolist()
+
+
+class RecordWriter(object):
+    """Сегменты записей в одной директории; свой сегмент у каждого процесса"""
+
+    def __init__(self, directory, segment_records=SEGMENT_RECORDS):
+        self.directory = directory
+        self.segment_records = segment_records
+        self.stats = {
+            'written': 0,
+            'skipped': 0,
+            'segments': 0,
+        }
+        self._lock = threading.Lock()
+        self._fd = None
+        self._pid = None
+        self._count = 0
+        self._segments = 0
+
+    def append(self, game_obj, opponent=None):
+        """Дописывает партию; партии без журнала и чужих классов пропускает"""
+        try:
+            data = encode(game_obj, opponent).tostring()
+        except RecordError as e:
+            log.debug('Game is not recorded: %s', e)
+            self.stats['skipped'] += 1
+            return False
+
+        with self._lock:
+            if self._fd is None or self._pid != os.getpid() or self._count >= self.segment_records:
+                self._open()
+            os.write(self._fd, data)
+            self._count += 1
+        self.stats['written'] += 1
+        return True
+
+    def _open(self):
+        if self._fd is not None:
+            # после форка закрываем только свою копию дескриптора родителя
+            os.close(self._fd)
+        if self._pid != os.getpid():
+            self._segments = 0
+        self._pid = os.getpid()
+        path = os.path.join(self.directory, 'games-%s-%s-%s.rec' % (
+            time.strftime('%Y%m%d-%H%M%S'), self._pid, self._segments))
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        if not os.fstat(self._fd).st_size:
+            os.write(self._fd, HEADER.pack(MAGIC, VERSION, RECORD.itemsize))
+        self._count = 0
+        self._segments += 1
+        self.stats['segments'] += 1
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None and self._pid == os.getpid():
+                os.close(self._fd)
+            self._fd = None
+
+
+def get_writer(directory=None):
+    """Писатель для directory, по умолчанию - для SEABATTLE_RECORDS; None, если писать некуда"""
+    directory = directory or os.environ.get('SEABATTLE_RECORDS')
+    if not directory:
+        return None
+    writer = _writers.get(directory)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(directory)
+            if writer is None:
+                writer = _writers[directory] = RecordWriter(directory)
+    return writer
+
+
+def append(game_obj, opponent=None, directory=None):
+    writer = get_writer(directory)
+    if writer is not None:
+        writer.append(game_obj, opponent)
+
+
+class Segment(object):
+    """Файл записей, открытый через mmap"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise RecordError('Truncated segment header: %s' % path)
+        magic, version, itemsize = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise RecordError('Not a records segment: %s' % path)
+        if version != VERSION or itemsize != RECORD.itemsize:
+            raise RecordError('Unsupported records version %s in %s' % (version, path))
+
+        count = (os.path.getsize(path) - HEADER.size) // RECORD.itemsize
+        if count:
+            self.records = np.memmap(path, dtype=RECORD, mode='r', offset=HEADER.size, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+    def __iter__(self):
+        return iter(self.records)
+
+
+def segments(paths):
+    """Сегменты по списку файлов и директорий (в директории - все *.rec по имени)"""
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(glob.glob(os.path.join(path, '*.rec'))):
+                yield Segment(name)
+        else:
+            yield Segment(path)
+
+
+def iter_records(paths):
+    for segment in segments(paths):
+        for record in segment:
+            yield record
+
+
+def replay(record, game_cls=None):
+    """
+    Переигрывает запись через game_cls (по умолчанию - класс, который её сыграл).
+
+    Replay.exact - поле сгенерировано из seed заново и все выстрелы совпали с
+    записанными; diverged - номер хода журнала, где переигровка разошлась с
+    партией, или None.
+    """
+    game_cls = game_cls or codec.KINDS[record['kind']]
+    seed, size = int(record['seed']), int(record['size'])
+    initial = field(record)
+
+    game_obj = game_cls(seed)
+    game_obj.start_new_game(size, ships=ships(record), numbers=True)
+    generated = [state == game.SHIP for state in game_obj.field] == [state == game.SHIP for state in initial]
+    if not generated:
+        # поле задали снаружи, а не из seed: выстрелы повторятся только случайно
+        game_obj = game_cls(seed)
+        game_obj.start_new_game(size, field=initial, ships=ships(record), numbers=True)
+    game_obj.prior_order = priors(record)
+
+    diverged = None
+    for number, move in enumerate(journal(record)):
+        kind, index, message = Moves.unpack(move)
+        if kind == Moves.SHOT:
+            if diverged is None:
+                game_obj.do_shot()
+                if game_obj.calc_index(game_obj.last_shot_position) == index:
+                    continue
+                diverged = number
+            # стратегия уже отметила свою клетку как выбранную, дальше её не спрашиваем
+            game_obj.last_shot_position = game_obj.calc_position(index)
+        elif kind == Moves.REPLY:
+            game_obj.handle_enemy_reply(message)
+        elif kind == Moves.ENEMY_SHOT:
+            if game_obj.handle_enemy_shot(game_obj.calc_position(index)) != message and diverged is None:
+                diverged = number
+        elif kind == Moves.RESET:
+            game_obj.reset_last_shot()
+
+    return Replay(game_obj, generated and diverged is None, diverged)
+
+
+def summary(records):
+    """Сводка по массиву записей: всё считается по столбцам, без обхода записей"""
+    flags = records['flags']
+    victories = records[flags & VICTORY != 0]
+    shots = victories['shots']
+    # время всех выстрелов всех партий одной выборкой
+    taken = np.arange(MAX_SIZE ** 2) < records['shots'][:, None]
+    timings = records['timings'][taken] / 100.0
+    return {
+        'games': len(records),
+        'victories': len(victories),
+        'defeats': int((flags & DEFEAT != 0).sum()),
+        'truncated': int((flags & TRUNCATED != 0).sum()),
+        'mean_shots_to_win': float(shots.mean()) if len(shots) else None,
+        'shot_ms_p50': float(np.percentile(timings, 50)) if len(timings) else None,
+        'shot_ms_p95': float(np.percentile(timings, 95)) if len(timings) else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сводка и переигровка записанных партий')
+    parser.add_argument('paths', nargs='+', help='сегменты .rec или директории с ними')
+    parser.add_argument('--replay', type=int, default=None, metavar='INDEX',
+                        help='переиграть одну запись (номер по порядку во всех сегментах) с подробным логом')
+    parser.add_argument('--check', action='store_true', help='переиграть все записи и сверить выстрелы')
+    args = parser.parse_args()
+
+    if args.replay is not None:
+        logging.basicConfig(format='%(message)s', level=logging.INFO)
+        record = next(record for number, record in enumerate(iter_records(args.paths)) if number == args.replay)
+        result = replay(record)
+        log.info('Seed %s, opponent %s, exact: %s, diverged at move: %s',
+                 record['seed'], record['opponent'].decode('utf-8'), result.exact, result.diverged)
+        log.info('Own field:')
+        result.game.print_field()
+        log.info('Enemy field as seen:')
+        result.game.print_enemy_field()
+        return
+
+    totals = collections.Counter()
+    for segment in segments(args.paths):
+        stats = summary(segment.records)
+        print('%s: %s' % (segment.path, ', '.join('%s %s' % item for item in sorted(stats.items()))))
+        totals['games'] += len(segment)
+        if args.check:
+            started = time.time()
+            for record in segment:
+                totals['exact'] += replay(record).exact
+            totals['replay_seconds'] += time.time() - started
+
+    print('Games: %s' % totals['games'])
+    if args.check:
+        print('Replayed exactly: %s of %s, %.0f games/s' % (
+            totals['exact'], totals['games'], totals['games'] / (totals['replay_seconds'] or 1)))
+
+
+if __name__ == '__main__':
+    main()
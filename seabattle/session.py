@@ -1,18 +1,462 @@
 # coding: utf-8
+"""
+Сессии пользователей: игра, соперник и последний ответ навыка.
+
+Хранилище ограничено: сессия, к которой не обращались дольше ttl секунд,
+удаляется, а при превышении числа сессий или оценки занятой ими памяти
+вытесняются давно не использованные (LRU). Игра из сессии убирается сразу,
+как только закончилась (см. DialogManager), и перестаёт учитываться в памяти.
+
+Обработка реплики должна идти под замком пользователя, иначе два почти
+одновременных запроса (Алиса повторяет запрос, если не дождалась ответа)
+перемешают ходы в одной игре:
+
+    with session.user_lock(user_id):
+        session_obj = session.get(user_id)
+        ...
+        session.save(session_obj)
+
+Замок даёт хранилище, и действует он там же, где видны его сессии.
+
+Хранилищ два, оба с методами get(user_id), save(session_obj) и lock(user_id):
+    SessionStore        в памяти процесса, save ничего не делает, замок -
+                        threading (UserLocks). Другой процесс этих сессий не
+                        видит, поэтому webhook с ним работает в одном процессе
+                        (gunicorn_config.py ставит workers = 1);
+    SqliteSessionStore  в файле SQLite (WAL): игра хранится в виде codec.encode,
+                        поэтому сессии переживают перезапуск и доступны всем
+                        процессам webhook'а на одной машине. Замок - байт
+                        пользователя в файле рядом с базой (FileLocks), он общий
+                        для всех процессов.
+
+У каждой строки SqliteSessionStore есть версия. save записывает сессию, только
+если версия в базе та же, что при get, иначе бросает StaleSession: за это время
+сессию записал другой ход (Алиса повторила запрос, и он попал в другой воркер),
+и перезаписать её - значит молча потерять тот ход. Запрос тогда кончается
+ошибкой, и Алиса повторяет его уже поверх свежей сессии.
+
+Настройки берутся из окружения:
+    SEABATTLE_SESSION_STORE      memory (по умолчанию) или sqlite:///путь/к/файлу.db
+    SEABATTLE_SESSION_TTL        время жизни сессии без обращений, по умолчанию 3600 с
+    SEABATTLE_SESSION_MAX        число сессий, по умолчанию 50000
+    SEABATTLE_SESSION_MAX_BYTES  оценка памяти под сессии в памяти процесса, по умолчанию 256 МБ
+"""
 
 from __future__ import unicode_literals
 
+import collections
+import contextlib
+import errno
+import fcntl
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import types
+import zlib
 
-_sessions = {}
+import numpy as np
 
+from seabattle import codec
 
-def get(user_id):
-    session_obj = _sessions.get(user_id)
-    if not session_obj:
-        session_obj = {
-            'game': None,
-            'last': None,
-            'opponent': None,
+
+DEFAULT_TTL = 3600
+DEFAULT_MAX_ENTRIES = 50000
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+LOCK_STRIPES = 1 << 16
+
+_SKIP_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+
+
+def deep_size(obj, seen=None):
+    """Оценка памяти объекта вместе со всем, на что он ссылается"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or isinstance(obj, _SKIP_TYPES):
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, np.ndarray):
+        # свои данные массива getsizeof уже учёл, а общие таблицы (views) не наши
+        return size
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    if hasattr(obj, '__dict__'):
+        size += deep_size(obj.__dict__, seen)
+    return size
+
+
+class StaleSession(Exception):
+    """Сессию, прочитанную для хода, уже перезаписал другой ход"""
+
+
+class Session(dict):
+    """Словарь сессии, который сообщает хранилищу, когда в нём меняется игра"""
+
+    def __init__(self, store, user_id):
+        super(Session, self).__init__(game=None, last=None, opponent=None)
+        self.store = store
+        self.user_id = user_id
+        # версия строки SqliteSessionStore, из которой прочитана сессия; None - строки не было
+        self.version = None
+
+    def __setitem__(self, key, value):
+        released = key == 'game' and value is None and self.get('game') is not None
+        super(Session, self).__setitem__(key, value)
+        if key == 'game' and self.store is not None:
+            self.store.account(self, released)
+
+
+class UserLocks(object):
+    """
+    Замок на каждого пользователя. Запросы одного пользователя выполняются
+    строго по очереди, разных - параллельно. Замок существует, пока его кто-то
+    держит или ждёт, поэтому память не растёт с числом пользователей.
+    """
+
+    def __init__(self):
+        self._locks = {}
+        self._mutex = threading.Lock()
+
+    @contextlib.contextmanager
+    def __call__(self, user_id):
+        with self._mutex:
+            entry = self._locks.get(user_id)
+            if entry is None:
+                entry = self._locks[user_id] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._mutex:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[user_id]
+
+    def __len__(self):
+        return len(self._locks)
+
+
+class FileLocks(object):
+    """
+    Замок на каждого пользователя, общий для процессов, которые открыли один
+    файл: пользователь блокирует свой байт файла (fcntl.lockf). Ожидание идёт в
+    ядре, без опроса, а замки упавшего процесса снимаются вместе с ним.
+
+    Замки fcntl принадлежат процессу, а не потоку, поэтому потоки одного
+    процесса сначала встают в очередь за байтом в UserLocks. Байтов stripes:
+    пользователи с одинаковым хэшем ходят по очереди, как один.
+    """
+
+    def __init__(self, path, stripes=LOCK_STRIPES):
+        self.path = path
+        self.stripes = stripes
+        self._threads = UserLocks()
+        self._fd = None
+        self._pid = None
+        self._mutex = threading.Lock()
+
+    def _file(self):
+        with self._mutex:
+            if self._pid != os.getpid():
+                # замки fcntl в дочерний процесс не переходят, так что дескриптор родителя
+                # не закрываем (это сняло бы его замки), а открываем свой
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                self._pid = os.getpid()
+            return self._fd
+
+    @contextlib.contextmanager
+    def __call__(self, user_id):
+        stripe = (zlib.crc32(('%s' % user_id).encode('utf-8')) & 0xffffffff) % self.stripes
+        with self._threads(stripe):
+            fd = self._file()
+            while True:
+                try:
+                    fcntl.lockf(fd, fcntl.LOCK_EX, 1, stripe)
+                    break
+                except IOError as e:
+                    # ядро видит замки процессов, а не потоков, и может принять за
+                    # взаимную блокировку два потока одного процесса, ждущие разные байты
+                    if e.errno != errno.EDEADLK:
+                        raise
+                    time.sleep(0.001)
+            try:
+                yield
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, 1, stripe)
+
+    def __len__(self):
+        return len(self._threads)
+
+
+class SessionStore(object):
+    # сессии видны только этому процессу
+    shared = False
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES,
+                 clock=time.time):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.bytes = 0
+        self.stats = {
+            'created': 0,
+            'expired': 0,
+            'evicted': 0,
+            'released': 0,
         }
-        _sessions[user_id] = session_obj
-    return session_obj
+        # user_id -> [сессия, время последнего обращения, оценка памяти]
+        self._entries = collections.OrderedDict()
+        self._game_sizes = {}
+        self._empty_size = deep_size(Session(None, None))
+        self._lock = threading.Lock()
+        self.lock = UserLocks()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _size(self, session_obj):
+        game_obj = session_obj.get('game')
+        if game_obj is None:
+            return self._empty_size
+
+        # игры одного класса и размера поля весят примерно одинаково: меряем один раз
+        key = (type(game_obj), game_obj.size)
+        size = self._game_sizes.get(key)
+        if size is None:
+            size = self._game_sizes[key] = deep_size(game_obj)
+        return self._empty_size + size
+
+    def get(self, user_id):
+        now = self.clock()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.pop(user_id, None)
+            if entry is None:
+                session_obj = Session(self, user_id)
+                entry = [session_obj, now, self._size(session_obj)]
+                self.bytes += entry[2]
+                self.stats['created'] += 1
+            entry[1] = now
+            self._entries[user_id] = entry
+            self._evict()
+            return entry[0]
+
+    def account(self, session_obj, released=False):
+        """Пересчитывает память сессии после смены игры"""
+        with self._lock:
+            if released:
+                self.stats['released'] += 1
+            entry = self._entries.get(session_obj.user_id)
+            if entry is None or entry[0] is not session_obj:
+                return
+            size = self._size(session_obj)
+            self.bytes += size - entry[2]
+            entry[2] = size
+            self._evict()
+
+    def _expire(self, now):
+        while self._entries:
+            user_id, entry = next(iter(self._entries.items()))
+            if now - entry[1] <= self.ttl:
+                break
+            self._remove(user_id)
+            self.stats['expired'] += 1
+
+    def _evict(self):
+        # последнюю, только что использованную сессию не вытесняем
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.stats['evicted'] += 1
+
+    def _remove(self, user_id):
+        session_obj, _, size = self._entries.pop(user_id)
+        session_obj.store = None
+        self.bytes -= size
+
+    def save(self, session_obj):
+        # сессия живёт в памяти и уже изменена на месте
+        pass
+
+    def expire(self):
+        with self._lock:
+            self._expire(self.clock())
+
+    def metrics(self):
+        with self._lock:
+            return dict(
+                self.stats,
+                live=len(self._entries),
+                games=sum(1 for entry in self._entries.values() if entry[0]['game'] is not None),
+                bytes=self.bytes,
+            )
+
+
+class SqliteSessionStore(object):
+    """
+    Сессии в SQLite. get читает и декодирует сессию, save кодирует и пишет её
+    обратно, если строку с тех пор никто не перезаписал (сравнение версий).
+    Соединение своё у каждого потока и у каждого процесса после форка.
+    """
+
+    shared = True
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, clock=time.time,
+                 expire_every=1000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.expire_every = expire_every
+        self.stats = {
+            'created': 0,
+            'loaded': 0,
+            'saved': 0,
+            'expired': 0,
+            'evicted': 0,
+            'stale': 0,
+        }
+        self._local = threading.local()
+        self._saves = 0
+        self.lock = FileLocks(path + '.lock')
+        with self._connection() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS sessions ('
+                'user_id TEXT PRIMARY KEY, updated REAL NOT NULL, '
+                'opponent TEXT, last TEXT, game BLOB, version INTEGER NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)')
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, user_id):
+        session_obj = Session(None, user_id)
+        row = self._connection().execute(
+            'SELECT updated, opponent, last, game, version FROM sessions WHERE user_id = ?', (user_id,)
+        ).fetchone()
+        if row is not None:
+            # устаревшую сессию тоже перезаписываем сравнением версий
+            session_obj.version = row[4]
+        if row is None or self.clock() - row[0] > self.ttl:
+            self.stats['created'] += 1
+            return session_obj
+
+        _, opponent, last, game_data, _ = row
+        dict.update(
+            session_obj,
+            opponent=opponent,
+            last=_decode_last(last),
+            game=codec.decode(bytes(game_data)) if game_data is not None else None,
+        )
+        self.stats['loaded'] += 1
+        return session_obj
+
+    def save(self, session_obj):
+        """Записывает сессию или бросает StaleSession, если её уже перезаписал другой ход"""
+        game_obj = session_obj['game']
+        last = session_obj['last']
+        values = (
+            self.clock(),
+            session_obj['opponent'],
+            json.dumps(list(last)) if last is not None else None,
+            sqlite3.Binary(codec.encode(game_obj)) if game_obj is not None else None,
+        )
+        with self._connection() as connection:
+            if session_obj.version is None:
+                stale = connection.execute(
+                    'INSERT OR IGNORE INTO sessions (updated, opponent, last, game, version, user_id) '
+                    'VALUES (?, ?, ?, ?, 1, ?)',
+                    values + (session_obj.user_id,)
+                ).rowcount != 1
+            else:
+                stale = connection.execute(
+                    'UPDATE sessions SET updated = ?, opponent = ?, last = ?, game = ?, version = version + 1 '
+                    'WHERE user_id = ? AND version = ?',
+                    values + (session_obj.user_id, session_obj.version)
+                ).rowcount != 1
+        if stale:
+            self.stats['stale'] += 1
+            raise StaleSession(session_obj.user_id)
+        session_obj.version = (session_obj.version or 0) + 1
+        self.stats['saved'] += 1
+        self._saves += 1
+        if self._saves % self.expire_every == 0:
+            self.expire()
+
+    def expire(self):
+        """Удаляет сессии старше ttl и самые старые сверх max_entries"""
+        with self._connection() as connection:
+            expired = connection.execute(
+                'DELETE FROM sessions WHERE updated < ?', (self.clock() - self.ttl,)
+            ).rowcount
+            evicted = connection.execute(
+                'DELETE FROM sessions WHERE user_id IN ('
+                'SELECT user_id FROM sessions ORDER BY updated DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            ).rowcount
+        self.stats['expired'] += expired
+        self.stats['evicted'] += evicted
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+    def metrics(self):
+        live, games = self._connection().execute(
+            'SELECT COUNT(*), COUNT(game) FROM sessions WHERE updated >= ?', (self.clock() - self.ttl,)
+        ).fetchone()
+        return dict(self.stats, live=live, games=games)
+
+
+def _decode_last(data):
+    if data is None:
+        return None
+    # dialog_manager тянет за собой rasa, а session должен импортироваться и без неё
+    from seabattle.dialog_manager import DMResponse
+    return DMResponse(*json.loads(data))
+
+
+def _from_environ():
+    ttl = float(os.environ.get('SEABATTLE_SESSION_TTL', DEFAULT_TTL))
+    max_entries = int(os.environ.get('SEABATTLE_SESSION_MAX', DEFAULT_MAX_ENTRIES))
+
+    url = os.environ.get('SEABATTLE_SESSION_STORE', 'memory')
+    if url.startswith('sqlite://'):
+        return SqliteSessionStore(url[len('sqlite://'):], ttl=ttl, max_entries=max_entries)
+    if url != 'memory':
+        raise ValueError('Unknown session store: %s' % url)
+    return SessionStore(
+        ttl=ttl,
+        max_entries=max_entries,
+        max_bytes=int(os.environ.get('SEABATTLE_SESSION_MAX_BYTES', DEFAULT_MAX_BYTES)),
+    )
+
+
+store = _from_environ()
+
+
+def user_lock(user_id):
+    """Замок пользователя в хранилище сессий: ходы одного пользователя идут по очереди"""
+    return store.lock(user_id)
+
+
+def get(user_id):
+    return store.get(user_id)
+
+
+def save(session_obj):
+    store.save(session_obj)
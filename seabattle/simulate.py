@@ -1,82 +1,211 @@
 # coding: utf-8
-import sys
-import importlib
-import logging
-
-
-logging.basicConfig(format='%(message)s', level=logging.INFO)
-
+"""
+Турнир между двумя реализациями игры.
 
-player_1 = importlib.import_module(sys.argv[1])
-player_2 = importlib.import_module(sys.argv[2])
+    python -m seabattle.simulate seabattle.game seabattle.density --games 100000 --workers 8 --seed 1
 
-game_1 = player_1.Game()
-game_2 = player_2.Game()
+Играет заданное число партий в пуле процессов и печатает для каждого игрока
+долю побед, среднее и 95-й перцентиль числа выстрелов до победы и скорость
+в партиях в секунду. Каждая игра получает свой seed, выведенный из общего seed
+и номера партии, поэтому любую партию можно переиграть с ходами и полями:
 
-game_1.start_new_game()
-game_2.start_new_game()
+    python -m seabattle.simulate seabattle.game seabattle.density --seed 1 --replay 4242
 
-print 'Player 1 field:'
-game_1.print_field()
-print 'Player 2 field:'
-game_2.print_field()
+С --record DIR обе партии каждой игры дописываются в сегменты records (см.
+seabattle/records.py), каждый процесс пула - в свой.
+"""
 
+from __future__ import unicode_literals, print_function
 
-def get_name(game):
-    if game is game_1:
-        return 'Player 1'
-    else:
-        return 'Player 2'
-
-
-def prepare_text_coords(coords):
-    return coords.replace(',', '')
-
-
-active = game_1
-passive = game_2
+import argparse
+import importlib
+import logging
+import math
+import multiprocessing
+import random
+import time
 
+from seabattle import records
 
-# MAIN LOOP
-while True:
-    coords = active.convert_to_position(prepare_text_coords(active.do_shot()))
-    print '{}: MOVE {}-{}'.format(get_name(active), coords[0], coords[1])
-    result = passive.handle_enemy_shot(coords)
-    print '{}: {}'.format(get_name(passive), result.upper())
-    active.handle_enemy_reply(result)
 
-    if result == 'miss':
-        active, passive = passive, active
+log = logging.getLogger(__name__)
 
-    should_exit = False
+PLAYERS = (1, 2)
 
-    if game_1.is_victory():
-        print 'Player 1: VICTORY'
-        should_exit = True
-    elif game_1.is_defeat():
-        print 'Player 1: DEFEAT'
-        should_exit = True
 
-    if game_2.is_victory():
-        print 'Player 2: VICTORY'
-        should_exit = True
-    elif game_2.is_defeat():
-        print 'Player 2: DEFEAT'
-        should_exit = True
+def game_seeds(seed, index):
+    """Seed'ы обоих игроков в партии index турнира с общим seed"""
+    rng = random.Random(seed * 1000003 + index)
+    return rng.getrandbits(32), rng.getrandbits(32)
 
-    if should_exit:
-        break
 
+def prepare_text_coords(coords):
+    return coords.replace(',', '')
 
-print '=' * 50
-print 'Player 1 field:'
-print 'His POV:'
-game_1.print_field()
-print 'Opponents POV:'
-game_2.print_enemy_field()
 
-print 'Player 2 field:'
-print 'His POV:'
-game_2.print_field()
-print 'Opponents POV:'
-game_1.print_enemy_field()
+def play_game(player_1, player_2, seed, index, verbose=False, record=None):
+    """
+    Играет одну партию между модулями player_1 и player_2.
+
+    Первым ходит игрок 1 в чётных партиях и игрок 2 в нечётных. Возвращает словарь
+    с победителем (None при ничьей), числом выстрелов каждого игрока и ошибкой,
+    если реализация упала: упавший игрок (failed) считается проигравшим.
+    record - директория, куда записать обе партии (records).
+    """
+    seed_1, seed_2 = game_seeds(seed, index)
+    games = {
+        1: importlib.import_module(player_1).Game(seed_1),
+        2: importlib.import_module(player_2).Game(seed_2),
+    }
+    shots = {1: 0, 2: 0}
+    result = {'index': index, 'winner': None, 'shots': shots, 'error': None, 'failed': None}
+
+    active, passive = (1, 2) if index % 2 == 0 else (2, 1)
+    current = None
+    try:
+        for current in PLAYERS:
+            games[current].start_new_game(numbers=True)
+
+        if verbose:
+            for number in PLAYERS:
+                log.info('Player %s field:', number)
+                games[number].print_field()
+
+        max_shots = 4 * games[1].size ** 2
+        while shots[active] < max_shots:
+            current = active
+            coords = games[active].convert_to_position(prepare_text_coords(games[active].do_shot()))
+            shots[active] += 1
+            current = passive
+            reply = games[passive].handle_enemy_shot(coords)
+            current = active
+            games[active].handle_enemy_reply(reply)
+            if verbose:
+                log.info('Player %s: MOVE %s-%s', active, coords[0], coords[1])
+                log.info('Player %s: %s', passive, reply.upper())
+
+            if games[active].is_victory() or games[passive].is_defeat():
+                result['winner'] = active
+                break
+
+            if reply == 'miss':
+                active, passive = passive, active
+    except Exception as e:
+        result['failed'] = current
+        result['winner'] = 2 if current == 1 else 1
+        result['error'] = '%s: %s' % (type(e).__name__, e)
+        if verbose:
+            log.exception('Player %s failed', current)
+
+    if record is not None:
+        records.append(games[1], player_2, record)
+        records.append(games[2], player_1, record)
+
+    if verbose:
+        log.info('=' * 50)
+        for number in PLAYERS:
+            other = 2 if number == 1 else 1
+            log.info('Player %s field:', number)
+            log.info('His POV:')
+            games[number].print_field()
+            log.info('Opponents POV:')
+            games[other].print_enemy_field()
+        log.info('Winner: %s', 'Player %s' % result['winner'] if result['winner'] else 'none (draw)')
+
+    return result
+
+
+def _play_chunk(args):
+    player_1, player_2, seed, indexes, record = args
+    return [play_game(player_1, player_2, seed, index, record=record) for index in indexes]
+
+
+def percentile(values, fraction):
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = int(math.ceil(fraction * len(values)))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+def run_tournament(player_1, player_2, games, seed, workers=None, chunk_size=200, record=None):
+    """Играет партии 0..games-1 в пуле процессов и возвращает сводную статистику"""
+    tasks = [
+        (player_1, player_2, seed, range(start, min(start + chunk_size, games)), record)
+        for start in xrange(0, games, chunk_size)
+    ]
+
+    started = time.time()
+    if workers == 1:
+        chunks = map(_play_chunk, tasks)
+    else:
+        pool = multiprocessing.Pool(workers)
+        try:
+            chunks = list(pool.imap_unordered(_play_chunk, tasks))
+        finally:
+            pool.close()
+            pool.join()
+    elapsed = time.time() - started
+
+    return summarize([result for chunk in chunks for result in chunk], elapsed)
+
+
+def summarize(results, elapsed):
+    stats = {
+        'games': len(results),
+        'draws': sum(1 for r in results if r['winner'] is None),
+        'elapsed': elapsed,
+        'games_per_second': len(results) / elapsed if elapsed else None,
+        'players': {},
+    }
+    for number in PLAYERS:
+        won = [r['shots'][number] for r in results if r['winner'] == number]
+        stats['players'][number] = {
+            'wins': len(won),
+            'win_rate': float(len(won)) / len(results) if results else None,
+            'mean_shots_to_win': float(sum(won)) / len(won) if won else None,
+            'p95_shots_to_win': percentile(won, 0.95),
+            'errors': [r['index'] for r in results if r['failed'] == number],
+        }
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Турнир между двумя реализациями морского боя')
+    parser.add_argument('player_1', help='модуль с классом Game, например seabattle.game')
+    parser.add_argument('player_2')
+    parser.add_argument('-n', '--games', type=int, default=1000)
+    parser.add_argument('-j', '--workers', type=int, default=None, help='по умолчанию по числу ядер')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--replay', type=int, default=None, metavar='INDEX',
+                        help='переиграть одну партию турнира с подробным логом')
+    parser.add_argument('--record', default=None, metavar='DIR',
+                        help='дописывать партии в сегменты records в этой директории')
+    args = parser.parse_args()
+
+    if args.replay is not None:
+        logging.basicConfig(format='%(message)s', level=logging.INFO)
+        play_game(args.player_1, args.player_2, args.seed, args.replay, verbose=True)
+        return
+
+    logging.basicConfig(format='%(message)s', level=logging.WARNING)
+    stats = run_tournament(args.player_1, args.player_2, args.games, args.seed, args.workers, record=args.record)
+
+    print('Games: %(games)s, draws: %(draws)s, %(elapsed).1f s, %(games_per_second).0f games/s' % stats)
+    for number, name in zip(PLAYERS, [args.player_1, args.player_2]):
+        player = stats['players'][number]
+        print('Player %s (%s): win rate %.2f%%, shots to win mean %s, p95 %s, errors %s' % (
+            number,
+            name,
+            100 * player['win_rate'],
+            '%.2f' % player['mean_shots_to_win'] if player['mean_shots_to_win'] is not None else '-',
+            player['p95_shots_to_win'] if player['p95_shots_to_win'] is not None else '-',
+            len(player['errors']),
+        ))
+        if player['errors']:
+            print('  failed games (use --replay): %s' % ', '.join(str(i) for i in player['errors'][:10]))
+
+
+if __name__ == '__main__':
+    main()
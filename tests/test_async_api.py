@@ -0,0 +1,176 @@
+# coding: utf-8
+from __future__ import unicode_literals
+from seabattle import session
+
+import io
+import json
+import time
+
+import pytest
+
+pytest.importorskip('klein')
+
+from twisted.internet import defer  # noqa: E402
+from twisted.web import server  # noqa: E402
+from twisted.web.test.requesthelper import DummyChannel  # noqa: E402
+
+from seabattle import async_api  # noqa: E402
+
+
+class Request(server.Request):
+    """Запрос twisted.web без сети: тело ответа копится в written"""
+
+    def __init__(self, path, body=None):
+        server.Request.__init__(self, DummyChannel(), False)
+        data = json.dumps(body).encode('utf-8') if body is not None else b''
+        self.gotLength(len(data))
+        self.content = io.BytesIO(data)
+        self.site = server.Site(None)
+        self.site.displayTracebacks = False
+        self.setHost(b'localhost', 8080)
+        self.uri = path
+        self.prepath = []
+        self.postpath = path.split(b'/')[1:]
+        self.method = b'POST' if body is not None else b'GET'
+        self.clientproto = b'HTTP/1.1'
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+        server.Request.write(self, data)
+
+    def body(self):
+        assert self.finished
+        return b''.join(self.written).decode('utf-8')
+
+
+def _dialog(user_id, message_id, text):
+    return {
+        'version': '1.0',
+        'session': {'new': message_id == 1, 'message_id': message_id, 'session_id': user_id, 'user_id': user_id},
+        'request': {'command': text, 'original_utterance': text, 'type': 'SimpleUtterance'},
+    }
+
+
+class GatedTurns(object):
+    """Ход сервера, который уходит в "пул" сразу, а выполняется, когда тест откроет его gate"""
+
+    def __init__(self):
+        self.started = []
+        self.gates = []
+
+    def __call__(self, user_id, message, deadline):
+        self.started.append((user_id, message))
+        gate = defer.Deferred()
+        gate.addCallback(lambda _: async_api._handle(user_id, message, deadline, time.time()))
+        self.gates.append(gate)
+        return gate
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = session.SessionStore()
+    monkeypatch.setattr(session, 'store', store)
+    return store
+
+
+@pytest.fixture
+def server_obj(store, monkeypatch):
+    server_obj = async_api.Server()
+    # без реактора: ход выполняется сразу в потоке теста
+    monkeypatch.setattr(server_obj, '_turn', lambda user_id, message, deadline: defer.maybeDeferred(
+        async_api._handle, user_id, message, deadline, time.time()))
+    return server_obj
+
+
+def _post(server_obj, user_id, message_id, text):
+    request = Request(b'/', _dialog(user_id, message_id, text))
+    server_obj.app.resource().render(request)
+    return request
+
+
+def test_ready(server_obj, monkeypatch):
+    monkeypatch.setattr(async_api.nlu, 'is_ready', lambda: False)
+    request = Request(b'/ready')
+    server_obj.app.resource().render(request)
+    assert request.code == 503
+    assert json.loads(request.body()) == {'ready': False}
+
+    monkeypatch.setattr(async_api.nlu, 'is_ready', lambda: True)
+    request = Request(b'/ready')
+    server_obj.app.resource().render(request)
+    assert request.code == 200
+    assert json.loads(request.body()) == {'ready': True}
+
+
+def test_metrics(server_obj):
+    request = Request(b'/metrics')
+    server_obj.app.resource().render(request)
+    assert request.code == 200
+    assert 'seabattle_server_in_flight 0' in request.body()
+    assert 'seabattle_server_users_queued 0' in request.body()
+
+
+def test_turns(server_obj, store):
+    request = _post(server_obj, 'user', 1, 'новая игра')
+    response = json.loads(request.body())
+    assert response['session']['user_id'] == 'user'
+    assert response['response']['text'].startswith('Инициализирована новая игра')
+    assert store.get('user')['game'] is not None
+
+    request = _post(server_obj, 'user', 2, 'начинай')
+    assert 'Я хожу' in json.loads(request.body())['response']['text']
+    assert server_obj.stats['in_flight'] == 0
+
+
+def test_turns_of_one_user_run_in_order(server_obj, store, monkeypatch):
+    turns = GatedTurns()
+    monkeypatch.setattr(server_obj, '_turn', turns)
+
+    first = _post(server_obj, 'user', 1, 'новая игра')
+    second = _post(server_obj, 'user', 2, 'начинай')
+    third = _post(server_obj, 'user', 3, 'ранил')
+    other = _post(server_obj, 'other', 1, 'новая игра')
+    # второй и третий ходы ждут в реакторе, другой пользователь - нет
+    assert turns.started == [('user', 'новая игра'), ('other', 'новая игра')]
+    assert server_obj.stats['waiting_for_user'] == 2
+    assert server_obj.stats['in_flight'] == 4
+
+    turns.gates[1].callback(None)
+    assert other.finished
+    assert not first.finished
+    assert len(turns.started) == 2
+
+    turns.gates[0].callback(None)
+    assert first.finished
+    assert turns.started[2] == ('user', 'начинай')
+    assert not second.finished and not third.finished
+
+    turns.gates[2].callback(None)
+    assert second.finished
+    assert turns.started[3] == ('user', 'ранил')
+    turns.gates[3].callback(None)
+    assert third.finished
+
+    assert 'новая игра' in json.loads(first.body())['response']['text']
+    assert 'Я хожу' in json.loads(second.body())['response']['text']
+    assert 'Я хожу' in json.loads(third.body())['response']['text']
+    # выстрел, "ранил" и второй выстрел легли в одну игру, ни один ход не потерялся
+    assert len(store.get('user')['game'].journal) == 3
+    assert server_obj.stats['in_flight'] == 0
+    assert not server_obj._tails
+
+
+def test_failed_turn_releases_user(server_obj, monkeypatch):
+    turns = GatedTurns()
+    monkeypatch.setattr(server_obj, '_turn', turns)
+
+    failed = _post(server_obj, 'user', 1, 'новая игра')
+    queued = _post(server_obj, 'user', 2, 'новая игра')
+    turns.gates[0].errback(RuntimeError('turn failed'))
+    assert failed.code == 500
+    assert turns.started[1] == ('user', 'новая игра')
+
+    turns.gates[1].callback(None)
+    assert queued.code == 200
+    assert not server_obj._tails
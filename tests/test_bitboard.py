@@ -0,0 +1,102 @@
+# coding: utf-8
+from __future__ import unicode_literals
+from seabattle import bitboard, game as gm
+
+import random
+
+import pytest
+
+
+FIELD = [0, 0, 0, 0, 0, 0, 1, 0, 0, 1,
+         1, 1, 1, 0, 0, 0, 0, 0, 0, 1,
+         0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+         0, 0, 0, 1, 0, 1, 0, 1, 0, 0,
+         1, 1, 0, 1, 0, 0, 0, 0, 0, 0,
+         0, 0, 0, 1, 0, 0, 0, 0, 0, 0,
+         0, 1, 0, 1, 0, 1, 1, 1, 0, 0,
+         0, 1, 0, 0, 0, 0, 0, 0, 0, 0,
+         0, 0, 0, 0, 0, 1, 0, 0, 0, 0,
+         1, 0, 0, 0, 0, 0, 0, 0, 0, 0]
+
+
+@pytest.fixture
+def game_with_field():
+    g = bitboard.Game()
+    g.start_new_game(field=list(FIELD))
+
+    return g
+
+
+def test_board_behaves_like_list():
+    board = bitboard.BitBoard(10, FIELD)
+    assert board == FIELD
+    assert len(board) == 100
+    assert board[6] == gm.SHIP
+    assert board[-1] == gm.EMPTY
+    assert board[10:13] == [1, 1, 1]
+
+    board[6] = gm.HIT
+    assert board[6] == gm.HIT
+    assert board.states[gm.SHIP] & (1 << 6) == 0
+
+    with pytest.raises(IndexError):
+        board[100]
+
+
+def test_dilate_does_not_wrap_rows():
+    masks = bitboard.get_masks(3)
+    assert list(bitboard.iter_bits(masks.dilate(1 << 2))) == [1, 2, 4, 5]
+    assert list(bitboard.iter_bits(masks.dilate(1 << 3))) == [0, 1, 3, 4, 6, 7]
+
+
+def test_shot(game_with_field):
+    assert game_with_field.handle_enemy_shot((10, 1)) == 'hit'
+    assert game_with_field.handle_enemy_shot((10, 2)) == 'kill'
+    assert game_with_field.handle_enemy_shot((1, 10)) == 'kill'
+    assert game_with_field.ships_count == 8
+
+
+def test_handle_shot(game_with_field):
+    assert game_with_field.handle_enemy_shot((4, 7)) == 'hit'
+    assert game_with_field.handle_enemy_shot((4, 7)) == 'hit'
+
+    assert game_with_field.handle_enemy_shot((1, 2)) == 'hit'
+    assert game_with_field.handle_enemy_shot((2, 2)) == 'hit'
+    assert game_with_field.handle_enemy_shot((3, 2)) == 'kill'
+    assert game_with_field.handle_enemy_shot((2, 2)) == 'kill'
+
+    assert game_with_field.handle_enemy_shot((4, 2)) == 'miss'
+
+    with pytest.raises(ValueError):
+        game_with_field.handle_enemy_shot((19, 6))
+
+
+def test_mark_killed():
+    g = bitboard.Game()
+    g.start_new_game(size=3, field=[0] * 9)
+    g.last_shot_position = (1, 1)
+    g.handle_enemy_reply('kill')
+    assert g.enemy_field == [1, 4, 0, 4, 4, 0, 0, 0, 0]
+
+
+def test_generate_field():
+    g = bitboard.Game()
+    g.start_new_game()
+    assert list(g.field).count(gm.SHIP) == sum(g.ships)
+    assert gm.BLOCKED not in list(g.field)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_same_answers_as_list_field(seed):
+    list_game = gm.Game()
+    list_game.start_new_game()
+
+    bit_game = bitboard.Game()
+    bit_game.start_new_game(field=list(list_game.field))
+
+    rnd = random.Random(seed)
+    for _ in xrange(150):
+        position = (rnd.randint(1, 10), rnd.randint(1, 10))
+        assert bit_game.handle_enemy_shot(position) == list_game.handle_enemy_shot(position)
+    assert bit_game.field == list_game.field
+    assert bit_game.ships_count == list_game.ships_count
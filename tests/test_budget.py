@@ -0,0 +1,80 @@
+# coding: utf-8
+from __future__ import unicode_literals
+from seabattle import budget
+
+import threading
+
+import pytest
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_deadline_and_stage():
+    clock = Clock()
+    deadline = budget.Deadline(1.0, clock=clock)
+    nlu = deadline.stage(0.6)
+
+    clock.now += 0.5
+    assert deadline.remaining() == pytest.approx(0.5)
+    assert nlu.remaining() == pytest.approx(0.1)
+    assert not nlu.expired()
+
+    clock.now += 0.2
+    assert nlu.expired()
+    assert nlu.remaining() == 0.0
+    assert not deadline.expired()
+
+
+def test_workers_return_result_in_time():
+    workers = budget.Workers(1)
+    assert workers.call(budget.Deadline(5.0), lambda a, b: a + b, 2, 3) == 5
+
+
+def test_workers_raise_errors():
+    def fail():
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        budget.Workers(1).call(budget.Deadline(5.0), fail)
+
+
+def test_workers_give_up_on_deadline():
+    release = threading.Event()
+    finished = threading.Event()
+
+    def slow():
+        release.wait()
+        finished.set()
+        return 'late'
+
+    workers = budget.Workers(1)
+    with pytest.raises(budget.DeadlineExceeded):
+        workers.call(budget.Deadline(0.02), slow)
+
+    # опоздавший вызов дорабатывает в своём потоке
+    release.set()
+    assert finished.wait(5.0)
+    assert workers.call(budget.Deadline(5.0), lambda: 'next') == 'next'
+
+
+def test_workers_drop_calls_expired_in_queue(monkeypatch):
+    monkeypatch.setitem(budget.stats, 'calls_dropped', 0)
+    release = threading.Event()
+    ran = []
+
+    workers = budget.Workers(1)
+    with pytest.raises(budget.DeadlineExceeded):
+        workers.call(budget.Deadline(0.02), release.wait)
+    with pytest.raises(budget.DeadlineExceeded):
+        workers.call(budget.Deadline(0.02), ran.append, 'stale')
+
+    release.set()
+    assert workers.call(budget.Deadline(5.0), lambda: 'next') == 'next'
+    assert ran == []
+    assert budget.stats['calls_dropped'] == 1
@@ -0,0 +1,140 @@
+# coding: utf-8
+from __future__ import unicode_literals
+from seabattle import codec, density, game as gm
+
+import random
+import struct
+
+import pytest
+
+
+def _play(player, defender, shots):
+    for _ in xrange(shots):
+        player.do_shot()
+        player.handle_enemy_reply(defender.handle_enemy_shot(player.last_shot_position))
+
+
+@pytest.mark.parametrize('game_cls', codec.KINDS)
+def test_round_trip_every_turn(game_cls):
+    defender = gm.Game(seed=1)
+    defender.start_new_game()
+    player = game_cls(seed=2)
+    player.start_new_game(numbers=True)
+
+    while not player.is_victory():
+        _play(player, defender, 1)
+        data = codec.encode(player)
+        decoded = codec.decode(data)
+
+        assert type(decoded) is game_cls
+        assert codec.encode(decoded) == data
+        assert list(decoded.field) == list(player.field)
+        assert list(decoded.enemy_field) == list(player.enemy_field)
+        assert decoded.maps == player.maps
+        assert decoded.consumed == player.consumed
+        assert list(decoded.targets or []) == list(player.targets or [])
+        assert decoded.enemy_ships == player.enemy_ships
+        assert decoded.ship_under_fire == player.ship_under_fire
+        assert decoded.rng.getstate() == player.rng.getstate()
+        player = decoded
+
+    assert defender.is_defeat()
+    # журнал растёт на слово за ход и время за выстрел, остальное состояние - нет
+    journal = 4 + 2 * (len(player.journal) + len(player.shot_timings))
+    assert len(data) - journal < 600
+    assert list(decoded.journal) == list(player.journal)
+
+
+def test_density_heat_is_restored():
+    defender = gm.Game(seed=3)
+    defender.start_new_game()
+    player = density.Game(seed=4)
+    player.start_new_game()
+    _play(player, defender, 30)
+
+    decoded = codec.decode(codec.encode(player))
+    assert (decoded.unknown == player.unknown).all()
+    for length, heat in player.heat.items():
+        assert (decoded.heat[length] == heat).all()
+        assert (decoded.alive[length] == player.alive[length]).all()
+
+
+@pytest.mark.parametrize('game_cls', [gm.Game, density.Game])
+def test_decoded_game_keeps_playing_the_same_shots(game_cls):
+    defender = gm.Game(seed=5)
+    defender.start_new_game()
+    player = game_cls(seed=6)
+    player.start_new_game()
+    _play(player, defender, 10)
+
+    decoded = codec.decode(codec.encode(player))
+    for _ in xrange(5):
+        assert decoded.do_shot() == player.do_shot()
+
+
+def _with_rng_state(game_obj, data, version):
+    """Запись в формате до версии 4: всё состояние генератора вместо числа слов"""
+    start = codec._HEADER.size + codec._BASE.size + len(game_obj.ships) + 2 * game_obj.size ** 2
+    rng_version, rng_state, gauss = game_obj.rng.getstate()
+    rng = codec._RNG_STATE.pack(rng_version, *(rng_state + (gauss is not None, gauss or 0.0)))
+    return data[:2] + struct.pack(str('<B'), version) + data[3:start] + rng + data[start + codec._RNG.size:]
+
+
+def test_rng_words():
+    game_obj = gm.Game(seed=3)
+    assert codec.rng_words(game_obj.rng, 3) == 0
+    game_obj.start_new_game()
+    for words in [1, 2, 623, 624, 625, 5000]:
+        game_obj.rng = random.Random(3)
+        game_obj.rng.getrandbits(32 * words)
+        assert codec.rng_words(game_obj.rng, 3) == words
+        assert codec.decode(codec.encode(game_obj)).rng.getstate() == game_obj.rng.getstate()
+
+    game_obj.rng = random.Random(4)
+    with pytest.raises(codec.CodecError):
+        codec.encode(game_obj)
+
+
+def test_version_3_with_rng_state():
+    defender = gm.Game(seed=7)
+    defender.start_new_game()
+    player = gm.Game(seed=8)
+    player.start_new_game()
+    _play(player, defender, 10)
+
+    decoded = codec.decode(_with_rng_state(player, codec.encode(player), 3))
+    assert decoded.rng.getstate() == player.rng.getstate()
+    assert list(decoded.journal) == list(player.journal)
+    assert codec.decode(codec.encode(decoded)).rng.getstate() == player.rng.getstate()
+
+
+def test_version_1_without_targets():
+    defender = gm.Game(seed=7)
+    defender.start_new_game()
+    player = gm.Game(seed=8)
+    player.start_new_game()
+    _play(player, defender, 10)
+
+    data = _with_rng_state(player, codec.encode(player), 1)
+    targets = 3 + 2 * len(player.targets)
+    journal = 4 + 2 * (len(player.journal) + len(player.shot_timings))
+    decoded = codec.decode(data[:-targets - journal])
+    assert decoded.targets is None
+    assert decoded.journal is None
+    assert decoded.consumed == player.consumed
+    _play(decoded, defender, 10)
+
+
+def test_bad_data():
+    game_obj = gm.Game()
+    game_obj.start_new_game()
+    data = codec.encode(game_obj)
+
+    with pytest.raises(codec.CodecError):
+        codec.decode(data[:-1])
+    with pytest.raises(codec.CodecError):
+        codec.decode(data + b'\x00')
+    with pytest.raises(codec.CodecError):
+        codec.decode(b'XX' + data[2:])
+    with pytest.raises(codec.CodecError):
+        codec.decode(data[:2] + b'\x09' + data[3:])
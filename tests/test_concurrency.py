@@ -0,0 +1,206 @@
+# coding: utf-8
+from __future__ import unicode_literals
+from seabattle import game as gm, session
+
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+
+THREADS = 16
+
+
+def _turn(store, locks, defenders, shots, user_id):
+    """Ход, как его делает DialogManager: прочитать сессию, выстрелить, сохранить"""
+    with locks(user_id):
+        session_obj = store.get(user_id)
+        game_obj = session_obj['game']
+        if game_obj is None:
+            game_obj = gm.Game()
+            game_obj.start_new_game()
+            session_obj['game'] = game_obj
+        if game_obj.is_victory():
+            return
+
+        game_obj.do_shot()
+        # отдаём GIL между выстрелом и ответом, чтобы без замка ходы перемешивались
+        time.sleep(0.0005)
+        game_obj.handle_enemy_reply(defenders[user_id].handle_enemy_shot(game_obj.last_shot_position))
+        shots[user_id].append(game_obj.last_shot_position)
+        store.save(session_obj)
+
+
+def _hammer(store, users, turns_per_user):
+    locks = store.lock
+    defenders = {}
+    shots = {}
+    for user_id in users:
+        defenders[user_id] = gm.Game()
+        defenders[user_id].start_new_game()
+        shots[user_id] = []
+
+    work = [user_id for _ in xrange(turns_per_user) for user_id in users]
+    errors = []
+    cursor = iter(work)
+    cursor_lock = threading.Lock()
+
+    def worker():
+        while True:
+            with cursor_lock:
+                user_id = next(cursor, None)
+            if user_id is None:
+                return
+            try:
+                _turn(store, locks, defenders, shots, user_id)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in xrange(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(locks) == 0
+    for user_id in users:
+        assert len(set(shots[user_id])) == len(shots[user_id])
+        if len(shots[user_id]) < turns_per_user:
+            assert defenders[user_id].is_defeat()
+    return shots
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmpdir):
+    if request.param == 'memory':
+        return session.SessionStore()
+    return session.SqliteSessionStore(str(tmpdir.join('sessions.db')))
+
+
+def test_one_user(store):
+    shots = _hammer(store, ['user'], 120)
+    assert len(shots['user']) <= 100
+
+
+def test_many_users(store):
+    _hammer(store, ['user%s' % i for i in xrange(40)], 30)
+
+
+def test_other_users_are_not_blocked():
+    locks = session.UserLocks()
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with locks('slow'):
+            held.set()
+            release.wait()
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    held.wait()
+
+    entered = threading.Event()
+
+    def enter_other():
+        with locks('fast'):
+            entered.set()
+
+    other = threading.Thread(target=enter_other)
+    other.start()
+    other.join(1)
+    assert entered.is_set()
+
+    same = threading.Event()
+
+    def wait_same():
+        with locks('slow'):
+            same.set()
+
+    blocked = threading.Thread(target=wait_same)
+    blocked.start()
+    blocked.join(0.1)
+    assert not same.is_set()
+
+    release.set()
+    blocked.join()
+    thread.join()
+    assert same.is_set()
+
+
+def _miss_turns(path, user_id, turns, errors):
+    store = session.SqliteSessionStore(path)
+    for _ in xrange(turns):
+        try:
+            with store.lock(user_id):
+                session_obj = store.get(user_id)
+                session_obj['game'].do_shot()
+                time.sleep(0.0005)
+                session_obj['game'].handle_enemy_reply(gm.Messages.MISS)
+                store.save(session_obj)
+        except session.StaleSession:
+            errors.value += 1
+
+
+def test_one_user_in_two_processes(tmpdir):
+    store = session.SqliteSessionStore(str(tmpdir.join('sessions.db')))
+    session_obj = store.get('user')
+    session_obj['game'] = gm.Game()
+    session_obj['game'].start_new_game()
+    store.save(session_obj)
+
+    errors = multiprocessing.Value('i', 0)
+    processes = [
+        multiprocessing.Process(target=_miss_turns, args=(store.path, 'user', 30, errors))
+        for _ in xrange(2)
+    ]
+    for process in processes:
+        process.start()
+    _miss_turns(store.path, 'user', 30, errors)
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    # под общим замком ни одна запись не устарела, и все 90 выстрелов легли в одну игру
+    assert errors.value == 0
+    game_obj = store.get('user')['game']
+    assert len(game_obj.journal) == 180
+    assert game_obj.enemy_field.count(gm.MISS) == 90
+
+
+def _hold(path, user_id, held, release):
+    locks = session.FileLocks(path)
+    with locks(user_id):
+        held.set()
+        release.wait()
+
+
+def test_file_locks_between_processes(tmpdir):
+    path = str(tmpdir.join('sessions.db.lock'))
+    held, release = multiprocessing.Event(), multiprocessing.Event()
+    holder = multiprocessing.Process(target=_hold, args=(path, 'slow', held, release))
+    holder.start()
+    held.wait()
+
+    locks = session.FileLocks(path)
+    with locks('fast'):
+        pass
+
+    entered = threading.Event()
+
+    def wait_same():
+        with locks('slow'):
+            entered.set()
+
+    blocked = threading.Thread(target=wait_same)
+    blocked.start()
+    blocked.join(0.1)
+    assert not entered.is_set()
+
+    release.set()
+    blocked.join()
+    holder.join()
+    assert entered.is_set()
+    assert len(locks) == 0
@@ -0,0 +1,62 @@
+# coding: utf-8
+from __future__ import unicode_literals
+from seabattle import coords, game as gm
+
+import pytest
+
+
+@pytest.fixture
+def parser():
+    return coords.PositionParser(gm.BaseGame.str_letters, gm.BaseGame.str_numbers, gm.BaseGame.letters_mapping)
+
+
+def test_spellings(parser):
+    assert parser.parse('7 10') == (7, 10)
+    assert parser.parse('07 01') == (7, 1)
+    assert parser.parse('Восемь, четыре.') == (8, 4)
+    assert parser.parse('k два') == (10, 2)
+    assert parser.parse('zh 3') == (7, 3)
+    assert parser.parse('в5') == (3, 5)
+    assert parser.parse('трень 4') == (3, 4)
+
+
+def test_letters_only_for_x(parser):
+    with pytest.raises(ValueError):
+        parser.parse('5 д')
+
+
+def test_numbers_outside_board(parser):
+    with pytest.raises(ValueError):
+        parser.parse('0 1')
+    with pytest.raises(ValueError):
+        parser.parse('11 1')
+    with pytest.raises(ValueError):
+        parser.parse('а 11')
+
+
+def test_fuzzy(parser):
+    assert parser.parse('читыре 5') == (4, 5)
+    assert parser.parse('5 восем') == (5, 8)
+    assert parser.parse('шесьт 1') == (6, 1)
+    assert parser.stats['fuzzy'] == 3
+
+    # одинаково далеко от "шесть" и "десять"
+    with pytest.raises(ValueError):
+        parser.parse('десть 5')
+    # короткие слова опечаток не прощают
+    with pytest.raises(ValueError):
+        parser.parse('тре 5')
+
+
+def test_memo(parser):
+    parser.memo_size = 2
+    assert parser.parse('1 2') == (1, 2)
+    assert parser.parse('1 2') == (1, 2)
+    for _ in xrange(2):
+        with pytest.raises(ValueError):
+            parser.parse('я хожу')
+    assert parser.stats['memo_hits'] == 2
+    assert parser.stats['failed'] == 2
+
+    parser.parse('3 4')
+    assert parser.metrics()['memo'] == 1
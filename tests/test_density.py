@@ -0,0 +1,102 @@
+# coding: utf-8
+from __future__ import unicode_literals
+from seabattle import budget, density, game as gm, placements
+
+import pytest
+
+
+@pytest.fixture
+def game():
+    g = density.Game()
+    g.start_new_game()
+
+    return g
+
+
+def test_miss_closes_placements(game):
+    before = game.total_heat()
+    game.last_shot_position = (5, 5)
+    game.handle_enemy_reply('miss')
+    after = game.total_heat()
+
+    assert after[game.calc_index((5, 5))] == 0
+    assert (after <= before).all()
+    assert game.choose_shot_position() != (5, 5)
+
+
+def test_hunts_around_wounded(game):
+    game.last_shot_position = (5, 5)
+    game.handle_enemy_reply('hit')
+    for _ in xrange(3):
+        x, y = game.choose_shot_position()
+        assert abs(x - 5) + abs(y - 5) == 1
+        game.last_shot_position = (x, y)
+        game.handle_enemy_reply('miss')
+
+
+def test_kill_marks_halo(game):
+    game.last_shot_position = (1, 1)
+    game.handle_enemy_reply('kill')
+    assert game.enemy_ships[1] == 3
+    for point in [(1, 1), (1, 2), (2, 1), (2, 2)]:
+        assert not game.unknown[game.calc_index(point)]
+
+
+@pytest.mark.parametrize('attempt', range(10))
+def test_wins_whole_game(attempt):
+    defender = gm.Game()
+    defender.start_new_game()
+
+    player = density.Game()
+    player.start_new_game()
+
+    shots = set()
+    while not player.is_victory():
+        player.do_shot()
+        assert player.last_shot_position not in shots
+        shots.add(player.last_shot_position)
+        player.handle_enemy_reply(defender.handle_enemy_shot(player.last_shot_position))
+
+    assert defender.is_defeat()
+    assert len(shots) <= 100
+
+
+def test_weights_follow_field_distribution(game):
+    table = placements.get_table(10)
+    rows = [tuple(cells) for cells in table.cells(4).tolist()]
+    weights = game.weights[4]
+    assert (weights > 0).all()
+    # corners ставит длинные корабли в углы, а не в середину поля
+    assert weights[rows.index((0, 1, 2, 3))] > weights[rows.index((43, 44, 45, 46))]
+    assert density.weights(10, game.ships, 'corners') is game.weights
+
+
+def test_default_weights_are_built_on_import():
+    key = (10, tuple(sorted(gm.Game.default_ships)), density.Game.ENEMY_DISTRIBUTION)
+    assert key in density._weights
+
+
+def test_prior_cells_first(game):
+    game.prior_order = (55, 0)
+    assert game.choose_shot_position() == (6, 6)
+    game.last_shot_position = (6, 6)
+    game.handle_enemy_reply('miss')
+    assert game.choose_shot_position() == (1, 1)
+
+
+def test_expired_deadline_still_shoots(game, monkeypatch):
+    monkeypatch.setitem(budget.stats, 'shots_cut', 0)
+    expired = budget.Deadline(0.0)
+    for _ in xrange(5):
+        position = game.choose_shot_position(expired)
+        assert game.enemy_field[game.calc_index(position)] == gm.EMPTY
+        game.last_shot_position = position
+        game.handle_enemy_reply('miss')
+    assert budget.stats['shots_cut'] == 5
+
+
+def test_heat_is_cut_after_longest_ships(game):
+    # самые длинные корабли считаются всегда, остальные - пока есть время
+    cut = game.total_heat(budget.Deadline(0.0))
+    assert (cut == game.enemy_ships[4] * game.heat[4]).all()
+    assert (game.total_heat(budget.Deadline(60.0)) == game.total_heat()).all()
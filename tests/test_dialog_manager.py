@@ -74,3 +74,47 @@ def test_game_1():
     assert say('корабль утонул') == shot(shots[4])
     assert say('мимо. я хожу 1 2') == kill()
     assert say('ура победа') == defeat()
+
+
+def test_dontunderstand_after_winning_kill():
+    def intent(name):
+        return {'intent': {'name': name, 'confidence': 1.0}, 'entities': []}
+
+    session_obj = session.Session(None, 'user2')
+    session_obj['opponent'] = 'яндекс'
+    game = gm.Game()
+    game.start_new_game(3, [gm.SHIP] + [gm.EMPTY] * 8, [1])
+    game.enemy_ships = {4: 0, 3: 0, 2: 0, 1: 1}
+    game.last_shot_position = (1, 1)
+    game.do_shot = mock.Mock(return_value='1, 1')
+    session_obj['game'] = game
+
+    with mock.patch.object(dm.DialogManager, '_parse', side_effect=[intent('kill'), intent('dontunderstand')]):
+        assert dm.DialogManager(session_obj).handle_message('убила').text == dm.MESSAGE_TEMPLATES['victory']
+        assert session_obj['game'] is None
+        assert dm.DialogManager(session_obj).handle_message('что').text == \
+            opponent('яндекс') + dm.MESSAGE_TEMPLATES['victory']
+
+
+def test_repeated_shot_is_not_a_new_shot():
+    def intent(name):
+        return {'intent': {'name': name, 'confidence': 1.0}, 'entities': []}
+
+    session_obj = session.Session(None, 'user3')
+    session_obj['opponent'] = 'яндекс'
+    game = gm.Game()
+    game.start_new_game()
+    game.do_shot = mock.Mock(return_value='1, 1')
+    game.repeat = mock.Mock(return_value='1, 1')
+    session_obj['game'] = game
+
+    with mock.patch.object(dm.DialogManager, '_parse', side_effect=[intent('letsstart'), intent('dontunderstand')]):
+        dm_obj = dm.DialogManager(session_obj)
+        dm_obj.handle_message('начинай')
+        assert dm_obj.event['shot'] == '1, 1'
+
+        dm_obj = dm.DialogManager(session_obj)
+        dm_obj.handle_message('что')
+        assert 'shot' not in dm_obj.event
+        assert dm_obj.event['repeated_shot'] == '1, 1'
+    assert game.do_shot.call_count == 1
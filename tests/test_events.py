@@ -0,0 +1,77 @@
+# coding: utf-8
+from __future__ import unicode_literals
+from seabattle import events, game as gm
+
+import json
+import logging
+import threading
+
+import pytest
+
+
+class ThreadRecordingHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.setFormatter(events.EventFormatter('%(message)s'))
+        self.lines = []
+        self.threads = set()
+
+    def emit(self, record):
+        self.threads.add(threading.current_thread().name)
+        self.lines.append(self.format(record))
+
+
+@pytest.fixture
+def handler():
+    root = logging.getLogger()
+    saved = root.handlers[:], root.level
+    recording = ThreadRecordingHandler()
+    events.configure(level='DEBUG', sample_rate=1.0, handler=recording)
+    yield recording
+    events._listener.stop()
+    events._listener = None
+    root.handlers, root.level = saved
+    events._sample_rate = 1.0
+
+
+def test_event_is_formatted_in_background(handler):
+    events.emit('turn', {'intent': 'miss', 'confidence': 0.9, 'timings': {'nlu_ms': 1.5}})
+    events._listener.stop()
+
+    assert handler.threads == {'seabattle-log'}
+    record = json.loads(handler.lines[0])
+    assert record['event'] == 'turn'
+    assert record['intent'] == 'miss'
+    assert record['timings'] == {'nlu_ms': 1.5}
+
+
+def test_sampling(handler):
+    events._sample_rate = 0.0
+    emitted = events.stats['emitted']
+    events.emit('turn', {'intent': 'miss'})
+    events._listener.stop()
+
+    assert handler.lines == []
+    assert events.stats['emitted'] == emitted
+
+
+def test_lazy_board_keeps_snapshot(handler):
+    game = gm.Game()
+    game.start_new_game(size=3, field=[1, 0, 0, 0, 0, 0, 0, 0, 0])
+    logging.getLogger('seabattle.test').debug('field:%s', events.LazyBoard(game, game.field))
+    game.field[0] = gm.HIT
+    events._listener.stop()
+
+    assert handler.lines == ['field:\n-----\n|1..|\n|...|\n|...|\n-----']
+
+
+def test_lazy_json():
+    assert json.loads(unicode(events.LazyJson({'text': 'мимо'}))) == {'text': 'мимо'}
+
+
+def test_unsampled_event_is_always_written(handler):
+    events._sample_rate = 0.0
+    events.emit('game', {'opponent': 'алиса'}, sampled=False)
+    events._listener.stop()
+
+    assert json.loads(handler.lines[0])['event'] == 'game'
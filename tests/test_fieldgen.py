@@ -0,0 +1,80 @@
+# coding: utf-8
+from __future__ import unicode_literals
+from seabattle import bitboard, fieldgen, game as gm, placements
+
+import random
+
+import pytest
+
+
+SHIPS = [1, 1, 1, 1, 2, 2, 2, 3, 3, 4]
+
+
+def _check(size, ships, field):
+    assert sorted(len(ship) for ship in field) == sorted(ships)
+    occupied = set()
+    for ship in field:
+        halo = placements._halo(size, ship)
+        assert not occupied.intersection(ship)
+        assert not occupied.intersection(halo)
+        occupied.update(ship)
+
+
+@pytest.mark.parametrize('distribution', fieldgen.DISTRIBUTIONS)
+def test_valid_fields(distribution):
+    rng = random.Random(0)
+    for _ in xrange(300):
+        _check(10, SHIPS, fieldgen.generate(10, SHIPS, rng, distribution))
+
+
+@pytest.mark.parametrize('distribution', fieldgen.DISTRIBUTIONS)
+def test_same_seed_same_field(distribution):
+    first = fieldgen.generate(10, SHIPS, random.Random(42), distribution)
+    assert first == fieldgen.generate(10, SHIPS, random.Random(42), distribution)
+
+
+def test_corners_prefer_border():
+    border = placements._to_mask([x in (0, 9) or y in (0, 9) for y in xrange(10) for x in xrange(10)])
+    rng = random.Random(0)
+    on_border = 0
+    for _ in xrange(100):
+        longest = fieldgen.generate(10, SHIPS, rng, 'corners')[0]
+        on_border += any(border >> index & 1 for index in longest)
+    assert on_border == 100
+
+
+def test_exhausted_budget_falls_back_to_ordered_search(monkeypatch):
+    search = fieldgen._search
+
+    def unlucky(size, ships, rng, distribution, budget):
+        if isinstance(rng, random.Random):
+            return None
+        return search(size, ships, rng, distribution, budget)
+
+    monkeypatch.setattr(fieldgen, '_search', unlucky)
+    _check(10, SHIPS, fieldgen.generate(10, SHIPS, random.Random(0), budget=len(SHIPS)))
+
+    with pytest.raises(fieldgen.FieldGenerationError):
+        fieldgen.generate(10, SHIPS, random.Random(0), budget=1)
+
+
+def test_impossible_fleet():
+    with pytest.raises(fieldgen.FieldGenerationError):
+        fieldgen.generate(3, [2, 2, 2], random.Random(0))
+
+
+def test_unknown_distribution():
+    with pytest.raises(ValueError):
+        fieldgen.generate(10, SHIPS, random.Random(0), 'diagonal')
+
+
+@pytest.mark.parametrize('game_cls', [gm.Game, bitboard.Game])
+def test_game_fields(game_cls):
+    g = game_cls(seed=7)
+    g.start_new_game()
+    assert list(g.field).count(gm.SHIP) == 20
+    assert gm.BLOCKED not in list(g.field)
+
+    other = game_cls(seed=7)
+    other.start_new_game()
+    assert list(other.field) == list(g.field)
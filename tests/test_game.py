@@ -44,17 +44,17 @@ def test_helper_functions(game):
 
     assert game.calc_position(63) == (4, 7)
 
-    # assert game.convert_to_position('a10') == (1, 10)
-    # assert game.convert_to_position('d 7') == (5, 7)
-    # assert game.convert_to_position('д 5') == (5, 5)
-    # assert game.convert_to_position('g 3') == (4, 3)
+    assert game.convert_to_position('a10') == (1, 10)
+    assert game.convert_to_position('d 7') == (5, 7)
+    assert game.convert_to_position('д 5') == (5, 5)
+    assert game.convert_to_position('g 3') == (4, 3)
 
-    # assert game.convert_to_position('k 1') == (10, 1)
-    # assert game.convert_to_position('k 2') == (10, 2)
-    # assert game.convert_to_position('k 10') == (10, 10)
-    # assert game.convert_to_position('k два') == (10, 2)
+    assert game.convert_to_position('k 1') == (10, 1)
+    assert game.convert_to_position('k 2') == (10, 2)
+    assert game.convert_to_position('k 10') == (10, 10)
+    assert game.convert_to_position('k два') == (10, 2)
 
-    # assert game.convert_to_position('d пять') == (5, 5)
+    assert game.convert_to_position('d пять') == (5, 5)
 
     assert game.convert_to_position('10 10') == (10, 10)
     assert game.convert_to_position('1 10') == (1, 10)
@@ -63,18 +63,18 @@ def test_helper_functions(game):
     assert game.convert_to_position('8 4') == (8, 4)
     assert game.convert_to_position('восемь четыре') == (8, 4)
 
-    # assert game.convert_to_position('уже 4') == (7, 4)
-    # assert game.convert_to_position('the 4') == (8, 4)
-    # assert game.convert_to_position('за 4') == (8, 4)
+    assert game.convert_to_position('уже 4') == (7, 4)
+    assert game.convert_to_position('the 4') == (8, 4)
+    assert game.convert_to_position('за 4') == (8, 4)
 
     with pytest.raises(ValueError):
         assert game.convert_to_position('1') == (1, 1)
 
-    # with pytest.raises(ValueError):
-    #    game.convert_to_position('т шесть')
+    with pytest.raises(ValueError):
+        game.convert_to_position('т шесть')
 
-    # with pytest.raises(ValueError):
-    #    game.convert_to_position('д пятнадцать')
+    with pytest.raises(ValueError):
+        game.convert_to_position('д пятнадцать')
 
     # assert game.convert_from_position((1, 1)) == 'а, 1'
     # assert game.convert_from_position((6, 5)) == 'е, 5'
@@ -116,6 +116,12 @@ def test_handle_shot(game_with_field):
     with pytest.raises(ValueError):
         game_with_field.handle_enemy_shot((19, 6))
 
+    with pytest.raises(ValueError):
+        game_with_field.handle_enemy_shot((0, 1))
+
+    with pytest.raises(ValueError):
+        game_with_field.handle_enemy_shot((1, 0))
+
 
 def test_shot2(game):
     result = game.do_shot()
@@ -184,6 +190,18 @@ def test_middle_2(game):
     assert len(middle_2) == 32
 
 
+def test_maps_are_shared(game):
+    other = Game(seed=game.seed)
+    other.start_new_game()
+    assert other.base_point == game.base_point
+    assert other.maps is game.maps
+    assert [len(cells) for cells in game.maps] == [len(points) for points in game.build_maps()]
+
+    position = game.hunt_for_new()
+    assert game.consumed[game.state] == 1 << game.calc_index(position)
+    assert other.consumed == [0] * len(other.maps)
+
+
 def test_strategy_recheck_after_4(game):
     game.do_shot()
     game.handle_enemy_reply('hit')
@@ -334,3 +352,29 @@ def test_shots(game):
     game.do_shot()
     game.handle_enemy_reply('kill')
     game.print_enemy_field()
+
+
+def test_napalm_devastated(game):
+    game.enemy_ships = {4: 0, 3: 0, 2: 0, 1: 1}
+    game.state = 4
+    game.enemy_field = [4] * 100
+    with pytest.raises(Exception):
+        game.do_shot()
+
+
+def test_unanswered_shot_is_offered_again(game):
+    first = game.calc_index(game.convert_to_position(game.do_shot()))
+    game.reset_last_shot()
+    while len(game.targets):
+        game.enemy_field[game.targets.pop_random(game.rng)] = 4
+    assert game.do_shot() == game.convert_from_position(game.geometry.positions[first])
+    assert game.state == 0
+
+
+def test_napalm_finishes_unanswered_cells(game):
+    game.enemy_ships = {4: 0, 3: 0, 2: 0, 1: 1}
+    game.state = 4
+    game.enemy_field = [4] * 99 + [0]
+    game.do_shot()
+    game.reset_last_shot()
+    assert game.do_shot() == game.convert_from_position((10, 10))
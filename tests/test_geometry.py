@@ -0,0 +1,53 @@
+# coding: utf-8
+from __future__ import unicode_literals
+from seabattle import game as gm, geometry
+
+import sys
+
+
+def test_neighbours_on_edges():
+    g = geometry.get_geometry(10)
+    assert g is geometry.get_geometry(10)
+
+    # угол (1, 1): сверху и слева соседей нет
+    assert g.sides[0] == (10, 1)
+    assert g.diagonals[0] == (11,)
+    assert sorted(g.neighbours[0]) == [1, 10, 11]
+    assert len(g.neighbours[55]) == 8
+    assert g.vertical[55] == (45, 65)
+    assert g.horizontal[55] == (54, 56)
+    assert g.rows[2] == tuple(xrange(20, 30))
+    assert g.columns[3][:3] == (3, 13, 23)
+    assert g.positions[63] == (4, 7)
+
+
+def test_halo_and_flood():
+    g = geometry.get_geometry(5)
+    field = [gm.EMPTY] * 25
+    for index in [6, 7, 8, 24]:
+        field[index] = gm.SHIP
+
+    assert g.flood(field, 7, gm.SHIP) == {6, 7, 8}
+    assert g.halo([6, 7, 8]) == [0, 1, 2, 3, 4, 5, 9, 10, 11, 12, 13, 14]
+    assert g.halo([24]) == [18, 19, 23]
+
+
+def test_mark_killed_ship_bounds_on_large_board():
+    # змейка длиннее предела рекурсии: рекурсивная обводка на ней падала
+    size = 50
+    game = gm.Game(seed=1)
+    game.size = size
+    game.enemy_field = [gm.EMPTY] * size ** 2
+    ship = []
+    for y in xrange(1, size + 1, 2):
+        ship.extend((x, y) for x in xrange(1, size + 1))
+        if y + 1 < size:
+            ship.append((size if y % 4 == 1 else 1, y + 1))
+    assert len(ship) > sys.getrecursionlimit()
+    for position in ship:
+        game.enemy_field[game.calc_index(position)] = gm.SHIP
+
+    game.mark_killed_ship_bounds((1, 1))
+    assert game.enemy_field.count(gm.SHIP) == len(ship)
+    assert game.enemy_field.count(gm.EMPTY) == 0
+    assert game.enemy_field[game.calc_index((1, 2))] == gm.MISS
@@ -0,0 +1,106 @@
+# coding: utf-8
+from __future__ import unicode_literals
+from seabattle import grammar
+
+import io
+import json
+import os
+
+import pytest
+
+
+def _examples():
+    with io.open(grammar.INTENTS_CONFIG, encoding='utf-8') as f:
+        return json.load(f)['rasa_nlu_data']['common_examples']
+
+
+@pytest.mark.parametrize('example', _examples(), ids=lambda example: example['text'])
+def test_agrees_with_training_data(example):
+    parsed = grammar.parse(example['text'])
+    if example['intent'] == 'miss' or (example['intent'] in grammar.PHRASE_INTENTS and not example['entities']):
+        assert parsed is not None
+    if parsed is None:
+        return
+
+    assert parsed['intent']['name'] == example['intent']
+    assert parsed['intent']['confidence'] == 1.0
+    expected = [(e['entity'], e['value']) for e in example['entities']]
+    assert [(e['entity'], e['value']) for e in parsed['entities']] == expected
+
+
+
+def _heldout():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        'benchmarks', 'grammar_heldout.json')
+    with io.open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize('example', _heldout(), ids=lambda example: example['text'])
+def test_never_misparses_heldout(example):
+    # незнакомое грамматика отдаёт rasa, но узнанное должно быть разобрано верно
+    parsed = grammar.parse(example['text'])
+    if parsed is None:
+        return
+
+    assert parsed['intent']['name'] == example['intent']
+    expected = [(e['entity'], e['value']) for e in example['entities']]
+    assert [(e['entity'], grammar.normalize(e['value'])) for e in parsed['entities']] == expected
+
+@pytest.mark.parametrize('message, coords', [
+    ('мимо. я хожу 2 2', '2 2'),
+    ('Я хожу в семь, девять', 'семь девять'),
+    ('я хожу на 10 10', '10 10'),
+    ('мимо! Я ухожу трень 4', 'трень 4'),
+])
+def test_shots(message, coords):
+    parsed = grammar.parse(message)
+    assert parsed['intent']['name'] == 'miss'
+    entity = parsed['entities'][0]
+    assert entity['value'] == coords
+    assert parsed['text'][entity['start']:entity['end']] == coords
+
+
+@pytest.mark.parametrize('message, intent', [
+    ('Ранил!', 'hit'),
+    ('ты попала', 'hit'),
+    ('корабль утонул', 'kill'),
+    ('Ура, победа', 'victory'),
+    ('я не понял', 'dontunderstand'),
+    ('новая игра', 'newgame'),
+])
+def test_phrases(message, intent):
+    assert grammar.parse(message)['intent']['name'] == intent
+
+
+@pytest.mark.parametrize('message', [
+    'новая игра с яндексом',
+    'мимо',
+    'я хожу а 5',
+    'я хожу 2',
+    'я хожу 0 1',
+    'я хожу 11 5',
+    'я хожу 2 10 и ещё 3 4',
+    'ранил, я хожу 2 2',
+    '',
+])
+def test_hands_off_to_rasa(message):
+    assert grammar.parse(message) is None
+
+
+@pytest.mark.parametrize('message, coords', [
+    ('ну я пожалуй хожу три пять', 'три пять'),
+    ('Мимо! а я тогда 2 10', '2 10'),
+])
+def test_guess_finds_single_shot(message, coords):
+    guessed = grammar.guess(message)
+    assert guessed['intent'] == {'name': 'miss', 'confidence': 0.8}
+    assert guessed['entities'][0]['value'] == coords
+    assert guessed['source'] == 'guess'
+
+
+@pytest.mark.parametrize('message', ['что-то непонятное', 'я хожу 1 2 3', 'три, а потом пять'])
+def test_guess_gives_up(message):
+    guessed = grammar.guess(message)
+    assert guessed['intent']['name'] == 'dontunderstand'
+    assert guessed['intent']['confidence'] < 0.8
@@ -0,0 +1,106 @@
+# coding: utf-8
+from __future__ import unicode_literals
+from seabattle import metrics, pool
+
+import os
+
+import pytest
+
+
+def _value(text, line_prefix):
+    for line in text.splitlines():
+        if line.startswith(line_prefix + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    raise AssertionError('%s not found' % line_prefix)
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram('test_seconds', 'test', (0.1, 1.0), ('intent',))
+    for value in [0.05, 0.1, 0.5, 3.0]:
+        histogram.observe(value, ('hit',))
+
+    samples = {(name, labels): value for name, labels, value in histogram.samples()}
+    assert samples[('test_seconds_bucket', '{intent="hit",le="0.1"}')] == 2
+    assert samples[('test_seconds_bucket', '{intent="hit",le="1.0"}')] == 3
+    assert samples[('test_seconds_bucket', '{intent="hit",le="+Inf"}')] == 4
+    assert samples[('test_seconds_count', '{intent="hit"}')] == 4
+    assert samples[('test_seconds_sum', '{intent="hit"}')] == pytest.approx(3.65)
+
+
+def test_label_values_are_escaped():
+    counter = metrics.Counter('test_total', 'test', ('response',))
+    counter.inc(('a "b"\\\n',))
+    assert counter.samples() == [('test_total', '{response="a \\"b\\"\\\\\\n"}', 1)]
+
+
+def test_observe_turn():
+    text = metrics.render()
+    before_request = 0.0
+    if 'seabattle_request_seconds_count{intent="miss"}' in text:
+        before_request = _value(text, 'seabattle_request_seconds_count{intent="miss"}')
+
+    metrics.observe_turn({
+        'intent': 'miss',
+        'confidence': 0.95,
+        'nlu': 'grammar',
+        'response': 'miss',
+        'shot': '3, 5',
+        'result': 'miss',
+        'timings': {'nlu_ms': 0.2, 'handler_ms': 1.5, 'response_ms': 0.1, 'request_ms': 2.0},
+    })
+    metrics.observe_turn({
+        'intent': 'hit',
+        'confidence': 0.4,
+        'nlu': 'rasa',
+        'response': 'dontunderstand',
+        'timings': {'nlu_ms': 30.0, 'handler_ms': 0.01, 'request_ms': 31.0},
+    })
+
+    text = metrics.render()
+    assert _value(text, 'seabattle_request_seconds_count{intent="miss"}') == before_request + 1
+    assert _value(text, 'seabattle_stage_seconds_count{stage="handler",intent="miss"}') >= 1
+    assert _value(text, 'seabattle_stage_seconds_bucket{stage="nlu",intent="hit",le="0.05"}') >= 1
+    assert _value(text, 'seabattle_nlu_confidence_bucket{source="rasa",le="0.4"}') >= 1
+    assert _value(text, 'seabattle_responses_total{response="dontunderstand"}') >= 1
+    assert _value(text, 'seabattle_enemy_shots_total{result="miss"}') >= 1
+    assert _value(text, 'seabattle_shots_total') >= 1
+
+
+def test_repeated_shot_is_not_counted():
+    before = _value(metrics.render(), 'seabattle_shots_total') if metrics.shots.samples() else 0
+    metrics.observe_turn({
+        'intent': 'dontunderstand',
+        'confidence': 1.0,
+        'response': 'miss',
+        'repeated_shot': '3, 5',
+        'timings': {},
+    })
+    after = _value(metrics.render(), 'seabattle_shots_total') if metrics.shots.samples() else 0
+    assert after == before
+
+
+def test_render_does_not_create_pool(monkeypatch):
+    monkeypatch.setattr(pool, '_pool', None)
+    text = metrics.render()
+    assert 'seabattle_pool_' not in text
+    assert pool._pool is None
+
+
+@pytest.fixture
+def game_pool(monkeypatch):
+    game_pool = pool.GamePool(high=2, start=False)
+    monkeypatch.setattr(pool, '_pool', game_pool)
+    monkeypatch.setattr(pool, '_pool_pid', os.getpid())
+    return game_pool
+
+
+def test_render_includes_component_metrics(game_pool):
+    text = metrics.render([('seabattle_server_in_flight', 'gauge', 3)])
+    assert '# TYPE seabattle_session_created_total counter' in text
+    assert '# TYPE seabattle_session_live gauge' in text
+    assert '# TYPE seabattle_pool_hits_total counter' in text
+    assert '# TYPE seabattle_budget_missed_total counter' in text
+    assert _value(text, 'seabattle_server_in_flight') == 3
+    # hit_rate пула до первой партии не определён и не выводится
+    for line in text.splitlines():
+        assert not line.endswith(' None')
@@ -0,0 +1,55 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import pytest
+
+pytest.importorskip('rasa_nlu')
+
+from seabattle import nlu  # noqa: E402
+
+
+class RecordingRouter(object):
+    def __init__(self):
+        self.warmed = []
+        self.forked = False
+
+    def warm(self, texts):
+        self.warmed.extend(texts)
+
+    def reset_after_fork(self):
+        self.forked = True
+
+
+@pytest.fixture
+def router(monkeypatch):
+    recording = RecordingRouter()
+    monkeypatch.setattr(nlu, 'router', recording)
+    monkeypatch.setattr(nlu.events, 'configure', lambda: None)
+    yield recording
+    nlu._ready.clear()
+
+
+def test_warmup_marks_ready(router):
+    nlu._ready.clear()
+    assert not nlu.is_ready()
+    nlu.warmup(['убил', 'я хожу 2 10'])
+    assert router.warmed == ['убил', 'я хожу 2 10']
+    assert nlu.is_ready()
+
+
+def test_default_warmup_texts(monkeypatch, tmpdir):
+    monkeypatch.delenv('SEABATTLE_NLU_WARMUP', raising=False)
+    assert 'я хожу 2 10' in nlu.warmup_texts()
+
+    phrases = tmpdir.join('phrases.txt')
+    phrases.write_text('мимо\n\nубил\n', encoding='utf-8')
+    monkeypatch.setenv('SEABATTLE_NLU_WARMUP', str(phrases))
+    assert nlu.warmup_texts() == ['мимо', 'убил']
+
+
+def test_post_fork_rewarms(router):
+    nlu.warmup([])
+    nlu.post_fork()
+    assert router.forked
+    assert nlu.is_ready()
+    assert len(router.warmed) == len(nlu.warmup_texts())
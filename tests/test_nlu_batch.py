@@ -0,0 +1,86 @@
+# coding: utf-8
+from __future__ import unicode_literals
+from seabattle import nlu_batch, nlu_cache
+
+import threading
+
+
+class BatchRouter(object):
+    """DataRouter, который запоминает, какими пачками его разбирали"""
+
+    def __init__(self):
+        self.batches = []
+
+    def extract(self, data):
+        return {'text': data['q']}
+
+    def parse_many(self, datas):
+        self.batches.append([data['text'] for data in datas])
+        if any(data['text'] == 'сломай' for data in datas):
+            raise ValueError('broken batch')
+        return [{'text': data['text'], 'intent': {'name': 'hit', 'confidence': 1.0}} for data in datas]
+
+
+def _parse_concurrently(batching, texts):
+    results, errors = {}, []
+
+    def parse(text):
+        try:
+            results[text] = batching.parse(batching.extract({'q': text}))
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=parse, args=(text,)) for text in texts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_concurrent_requests_share_a_batch():
+    router = BatchRouter()
+    batching = nlu_batch.BatchingRouter(router, window=0.2, max_batch=4, parse_many=router.parse_many)
+    results, errors = _parse_concurrently(batching, ['раз', 'два', 'три', 'четыре', 'пять'])
+
+    assert not errors
+    assert sorted(results) == sorted(['раз', 'два', 'три', 'четыре', 'пять'])
+    assert all(results[text]['text'] == text for text in results)
+    assert sorted(len(batch) for batch in router.batches) == [1, 4]
+    metrics = batching.metrics()
+    assert (metrics['batches'], metrics['texts'], metrics['largest']) == (2, 5, 4)
+
+
+def test_batch_waits_no_longer_than_window():
+    router = BatchRouter()
+    batching = nlu_batch.BatchingRouter(router, window=0.0, max_batch=16, parse_many=router.parse_many)
+    for text in ['раз', 'два']:
+        assert batching.parse(batching.extract({'q': text}))['text'] == text
+    assert router.batches == [['раз'], ['два']]
+
+
+def test_errors_reach_every_waiter():
+    router = BatchRouter()
+    batching = nlu_batch.BatchingRouter(router, window=0.5, max_batch=2, parse_many=router.parse_many)
+    results, errors = _parse_concurrently(batching, ['сломай', 'два'])
+    assert not results
+    assert len(errors) == 2
+
+
+def test_cache_warms_through_batches(tmpdir):
+    router = BatchRouter()
+    batching = nlu_batch.BatchingRouter(router, max_batch=2, parse_many=router.parse_many)
+    cached = nlu_cache.CachedRouter(batching, str(tmpdir))
+    cached.warm(['убил', 'мимо', 'Убил!', 'ранил'])
+    assert router.batches == [['убил', 'мимо'], ['ранил']]
+    assert cached.parse('убил')['source'] == 'cache'
+
+
+def test_disabled_by_environ(monkeypatch):
+    router = BatchRouter()
+    monkeypatch.setenv('SEABATTLE_NLU_BATCH_SIZE', '1')
+    assert nlu_batch.from_environ(router) is router
+    monkeypatch.setenv('SEABATTLE_NLU_BATCH_SIZE', '8')
+    monkeypatch.setenv('SEABATTLE_NLU_BATCH_WINDOW_MS', '5')
+    batching = nlu_batch.from_environ(router)
+    assert (batching.max_batch, batching.window) == (8, 0.005)
@@ -0,0 +1,94 @@
+# coding: utf-8
+from __future__ import unicode_literals
+from seabattle import nlu_cache
+
+import pytest
+
+
+class CountingRouter(object):
+    """DataRouter с тем же интерфейсом extract/parse, который считает разборы"""
+
+    def __init__(self):
+        self.parsed = []
+
+    def extract(self, data):
+        return {'text': data['q']}
+
+    def parse(self, data):
+        self.parsed.append(data['text'])
+        return {'text': data['text'], 'intent': {'name': 'hit', 'confidence': 0.9}, 'entities': []}
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def mldata(tmpdir):
+    tmpdir.mkdir('default').mkdir('model_20180701-120000')
+    return tmpdir
+
+
+def test_hits_by_normalized_text(mldata):
+    router = CountingRouter()
+    cached = nlu_cache.CachedRouter(router, str(mldata))
+
+    first = cached.parse('Ты попала!')
+    second = cached.parse('ты   попала')
+    assert router.parsed == ['Ты попала!']
+    assert 'source' not in first
+    assert second['source'] == 'cache'
+    assert second['intent'] == first['intent']
+
+    second['intent']['name'] = 'kill'
+    assert cached.parse('ты попала')['intent']['name'] == 'hit'
+
+    metrics = cached.metrics()
+    assert (metrics['hits'], metrics['misses'], metrics['size']) == (2, 1, 1)
+    assert metrics['hit_rate'] == 2.0 / 3
+
+
+def test_lru_eviction(mldata):
+    router = CountingRouter()
+    cached = nlu_cache.CachedRouter(router, str(mldata), maxsize=2)
+    for text in ['убил', 'мимо', 'убил', 'ранил', 'убил', 'мимо']:
+        cached.parse(text)
+
+    assert router.parsed == ['убил', 'мимо', 'ранил', 'мимо']
+    assert cached.stats['evictions'] == 2
+
+
+def test_new_model_invalidates(mldata):
+    router = CountingRouter()
+    clock = Clock()
+    cached = nlu_cache.CachedRouter(router, str(mldata), check_interval=5, clock=clock)
+    cached.parse('убил')
+
+    mldata.join('default').mkdir('model_20180702-120000')
+    clock.now = 1
+    cached.parse('убил')
+    assert len(router.parsed) == 1
+
+    clock.now = 10
+    cached.parse('убил')
+    assert len(router.parsed) == 2
+    assert cached.stats['invalidations'] == 1
+
+
+def test_warm_and_disabled(mldata):
+    router = CountingRouter()
+    cached = nlu_cache.CachedRouter(router, str(mldata))
+    cached.warm(['убил', 'мимо', 'Убил!'])
+    assert router.parsed == ['убил', 'мимо']
+    cached.parse('мимо')
+    assert cached.stats['hits'] == 1
+
+    disabled = nlu_cache.CachedRouter(CountingRouter(), str(mldata), maxsize=0)
+    disabled.parse('мимо')
+    disabled.parse('мимо')
+    assert disabled.router.parsed == ['мимо', 'мимо']
+    assert disabled.metrics()['size'] == 0
@@ -0,0 +1,32 @@
+# coding: utf-8
+from __future__ import unicode_literals
+from seabattle import placements
+
+import numpy as np
+
+
+def test_table():
+    table = placements.get_table(10)
+    assert table is placements.get_table(10)
+    assert len(table.cover(4)) == 140
+    assert len(table.cover(1)) == 100
+    assert table.cover(4).sum(axis=1).tolist() == [4] * 140
+    assert not table.cover(2).flags.writeable
+
+
+def test_cells_and_halo():
+    table = placements.get_table(3)
+    assert table.cells(3).tolist() == [[0, 1, 2], [3, 4, 5], [6, 7, 8], [0, 3, 6], [1, 4, 7], [2, 5, 8]]
+    assert np.flatnonzero(table.halo(1)[0]).tolist() == [1, 3, 4]
+    assert np.flatnonzero(table.halo(2)[0]).tolist() == [2, 3, 4, 5]
+    assert table.masks(2)[0] == (0b11, 0b111100)
+
+
+def test_save_and_mmap(tmpdir):
+    path = str(tmpdir.join('placements-5.npy'))
+    placements.PlacementTable.build(5).save(path)
+    loaded = placements.PlacementTable.load(path, 5)
+    assert isinstance(loaded.data, np.memmap)
+    assert (loaded.cover(3) == placements.get_table(5).cover(3)).all()
+    assert loaded.cells(3).tolist() == placements.get_table(5).cells(3).tolist()
+
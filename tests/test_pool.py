@@ -0,0 +1,68 @@
+# coding: utf-8
+from __future__ import unicode_literals
+from seabattle import bitboard, game as gm, pool
+
+import functools
+import os
+import time
+
+
+def test_hits_and_misses():
+    game_pool = pool.GamePool(high=2, low=1, start=False)
+    game_pool.fill()
+    assert game_pool.size() == 2
+
+    for _ in xrange(3):
+        game_obj = game_pool.get()
+        assert list(game_obj.field).count(gm.SHIP) == 20
+        assert game_obj.numbers
+
+    metrics = game_pool.metrics()
+    assert (metrics['hits'], metrics['misses'], metrics['generated'], metrics['refills']) == (2, 1, 2, 1)
+    assert metrics['size'] == 0
+    assert metrics['hit_rate'] == 2.0 / 3
+
+
+def test_games_are_independent():
+    game_pool = pool.GamePool(high=2, start=False)
+    game_pool.fill()
+    first, second = game_pool.get(), game_pool.get()
+    assert first is not second
+    assert first.seed != second.seed
+
+
+def test_background_refill():
+    game_pool = pool.GamePool(high=4, low=2, factory=functools.partial(pool.new_game, bitboard.Game))
+    deadline = time.time() + 5
+    while game_pool.size() < 4 and time.time() < deadline:
+        time.sleep(0.01)
+    assert game_pool.size() == 4
+
+    for _ in xrange(3):
+        assert isinstance(game_pool.get(), bitboard.Game)
+    while game_pool.stats['refills'] < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    while game_pool.size() < 4 and time.time() < deadline:
+        time.sleep(0.01)
+    assert game_pool.stats['hits'] == 3
+    assert game_pool.stats['generated'] == 7
+
+
+def test_disabled_pool():
+    game_pool = pool.GamePool(high=0)
+    assert game_pool.get().size == 10
+    assert game_pool.metrics()['misses'] == 1
+
+
+def test_get_pool_without_create(monkeypatch):
+    monkeypatch.setattr(pool, '_pool', None)
+    assert pool.get_pool(create=False) is None
+    assert pool._pool is None
+
+    game_pool = pool.GamePool(high=0)
+    monkeypatch.setattr(pool, '_pool', game_pool)
+    monkeypatch.setattr(pool, '_pool_pid', os.getpid())
+    assert pool.get_pool(create=False) is game_pool
+    # пул другого процесса (до форка) в этом процессе не используется
+    monkeypatch.setattr(pool, '_pool_pid', -1)
+    assert pool.get_pool(create=False) is None
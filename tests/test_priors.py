@@ -0,0 +1,113 @@
+# coding: utf-8
+from __future__ import unicode_literals
+from seabattle import game as gm, priors
+
+import json
+
+import pytest
+
+
+def _event(opponent, field, size=3):
+    return {'event': 'game', 'opponent': opponent, 'size': size,
+            'enemy_field': ''.join('%d' % state for state in field)}
+
+
+# корабль соперника всегда в левом верхнем углу
+CORNER = [gm.SHIP, gm.MISS, gm.EMPTY,
+          gm.MISS, gm.MISS, gm.EMPTY,
+          gm.EMPTY, gm.EMPTY, gm.MISS]
+
+
+@pytest.fixture
+def aggregator():
+    aggregator = priors.Aggregator(size=3)
+    aggregator.read(json.dumps(_event('Алиса', CORNER)) for _ in xrange(priors.MIN_GAMES))
+    return aggregator
+
+
+def test_record():
+    game = gm.Game()
+    game.start_new_game(size=3, field=[0] * 9, ships=[1])
+    game.enemy_field = list(CORNER)
+    game.enemy_ships_count = 0
+
+    assert priors.record(game, ' Яндекс ') == {
+        'opponent': 'яндекс', 'size': 3, 'victory': True, 'enemy_field': '140440004'}
+
+
+def test_read_counts_only_games(aggregator):
+    aggregator.read([
+        'not a json line',
+        json.dumps({'event': 'turn', 'intent': 'miss'}),
+        json.dumps(_event('алиса', CORNER, size=10)),
+    ])
+
+    assert aggregator.stats == {'games': priors.MIN_GAMES, 'skipped': 1, 'evicted': 0}
+    row = aggregator.table()[0]
+    assert row['opponent'] == 'алиса'
+    assert list(row['ships']) == [priors.MIN_GAMES] + [0] * 8
+    assert list(row['seen']) == [priors.MIN_GAMES] * 2 + [0] + [priors.MIN_GAMES] * 2 + [0] * 3 + [priors.MIN_GAMES]
+
+
+def test_order_needs_enough_games(aggregator):
+    aggregator.add(_event('яндекс', CORNER))
+    table = priors.Priors(aggregator.table())
+
+    assert table.order('АЛИСА', 3) == (0,)
+    assert table.order('яндекс', 3) is None
+    assert table.order('незнакомец', 3) is None
+    assert table.order('алиса', 10) is None
+    assert table.metrics() == {'lookups': 4, 'known': 1, 'opponents': 2}
+
+
+def test_unknown_opponents_are_not_cached(aggregator):
+    table = priors.Priors(aggregator.table())
+    for index in xrange(100):
+        assert table.order('игрок %s' % index, 3) is None
+    assert table.order('алиса', 3) == (0,)
+    assert sorted(table._orders) == ['алиса']
+
+
+def test_bounded_opponents():
+    aggregator = priors.Aggregator(size=3, max_opponents=2)
+    for opponent in ['алиса', 'алиса', 'яндекс', 'маруся']:
+        aggregator.add(_event(opponent, CORNER))
+
+    assert sorted(aggregator.table()['opponent']) == ['алиса', 'маруся']
+    assert aggregator.stats['evicted'] == 1
+
+
+def test_saved_file_is_mmapped(aggregator, tmpdir, monkeypatch):
+    path = str(tmpdir.join('priors-3.npy'))
+    aggregator.save(path)
+    monkeypatch.setenv('SEABATTLE_PRIORS', path)
+    monkeypatch.setattr(priors, '_priors', None)
+
+    assert priors.get_priors().rows.filename is not None
+    assert priors.order('алиса', 3) == (0,)
+    assert type(priors.order('алиса', 3)[0]) is int
+
+
+def test_without_file(monkeypatch):
+    monkeypatch.delenv('SEABATTLE_PRIORS', raising=False)
+    monkeypatch.setattr(priors, '_priors', None)
+
+    assert priors.get_priors() is None
+    assert priors.order('алиса', 10) is None
+
+
+def test_game_shoots_prior_cells_first():
+    game = gm.Game(seed=1)
+    game.start_new_game()
+    game.prior_order = (99, 0, 55)
+    game.enemy_field[0] = gm.MISS
+
+    game.do_shot()
+    assert game.last_shot_position == (10, 10)
+    game.handle_enemy_reply('miss')
+    game.do_shot()
+    assert game.last_shot_position == (6, 6)
+    game.handle_enemy_reply('miss')
+    game.do_shot()
+    assert game.enemy_field[game.calc_index(game.last_shot_position)] == gm.EMPTY
+    assert game.calc_index(game.last_shot_position) not in (99, 0, 55)
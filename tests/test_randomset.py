@@ -0,0 +1,35 @@
+# coding: utf-8
+from __future__ import unicode_literals
+from seabattle import randomset
+
+import random
+
+import pytest
+
+
+def test_add_discard():
+    items = randomset.RandomSet(10, [3, 5, 7])
+    items.add(5)
+    assert len(items) == 3
+    items.discard(3)
+    items.discard(4)
+    assert 3 not in items
+    assert sorted(items) == [5, 7]
+    items.discard_all([5, 7])
+    assert len(items) == 0
+    items.add_all([2, 9, 2])
+    assert sorted(items) == [2, 9]
+
+
+def test_pop_random_is_seeded_and_exhaustive():
+    def pops(seed):
+        items = randomset.RandomSet(100, xrange(0, 100, 3))
+        rng = random.Random(seed)
+        return [items.pop_random(rng) for _ in xrange(len(items))]
+
+    assert pops(1) == pops(1)
+    assert pops(1) != pops(2)
+    assert sorted(pops(1)) == range(0, 100, 3)
+
+    with pytest.raises(IndexError):
+        randomset.RandomSet(5).pop_random(random.Random(1))
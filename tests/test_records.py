@@ -0,0 +1,127 @@
+# coding: utf-8
+from __future__ import unicode_literals
+from seabattle import codec, game as gm, records, simulate
+
+import os
+
+import pytest
+
+
+def _play(game_cls, seed, enemy_shots=True):
+    defender = gm.Game(seed=seed + 1)
+    defender.start_new_game()
+    player = game_cls(seed=seed)
+    player.start_new_game(numbers=True)
+    enemy = gm.Game(seed=seed + 2)
+    enemy.start_new_game()
+    while not player.is_victory():
+        player.do_shot()
+        player.handle_enemy_reply(defender.handle_enemy_shot(player.last_shot_position))
+        if enemy_shots and not player.is_victory():
+            enemy.do_shot()
+            player.handle_enemy_shot(enemy.last_shot_position)
+    return player
+
+
+@pytest.fixture
+def directory(tmpdir):
+    return str(tmpdir)
+
+
+def test_journal():
+    game = gm.Game(seed=1)
+    game.start_new_game(numbers=True)
+    game.do_shot()
+    shot = game.calc_index(game.last_shot_position)
+    game.handle_enemy_reply('hit')
+    answer = game.handle_enemy_shot((1, 1))
+    game.reset_last_shot()
+    game.reset_last_shot()
+
+    assert [gm.Moves.unpack(move) for move in game.journal] == [
+        (gm.Moves.SHOT, shot, None),
+        (gm.Moves.REPLY, 0, 'hit'),
+        (gm.Moves.ENEMY_SHOT, 0, answer),
+        (gm.Moves.RESET, 0, None),
+    ]
+    assert len(game.shot_timings) == 1
+
+
+@pytest.mark.parametrize('game_cls', codec.KINDS)
+def test_written_games_replay_exactly(game_cls, directory):
+    played = [_play(game_cls, seed) for seed in xrange(3)]
+    for game in played:
+        records.append(game, 'Алиса', directory)
+
+    read = list(records.iter_records([directory]))
+    assert len(read) == 3
+    for game, record in zip(played, read):
+        assert record['seed'] == game.seed
+        assert record['opponent'].decode('utf-8') == 'Алиса'
+        assert record['flags'] == records.VICTORY
+        assert records.journal(record) == list(game.journal)
+        assert list(record['timings'][:record['shots']]) == list(game.shot_timings)
+
+        replay = records.replay(record)
+        assert replay.exact
+        assert replay.diverged is None
+        assert list(replay.game.journal) == list(game.journal)
+        assert list(replay.game.enemy_field) == list(game.enemy_field)
+
+
+def test_replay_follows_diverged_game(directory):
+    game = _play(gm.Game, 4)
+    record = records.encode(game)[0]
+    shots = [number for number, move in enumerate(records.journal(record)) if move >> 12 == gm.Moves.SHOT]
+    kind, index, _ = gm.Moves.unpack(record['journal'][shots[3]])
+    other = next(cell for cell in xrange(100) if game.enemy_field[cell] == gm.MISS and cell != index)
+    record['journal'][shots[3]] = gm.Moves.pack(kind, other)
+
+    replay = records.replay(record)
+    assert not replay.exact
+    assert replay.diverged == shots[3]
+    assert replay.game.is_victory()
+
+
+def test_segments_roll_over_and_skip_partial_record(directory):
+    writer = records.RecordWriter(directory, segment_records=2)
+    for seed in xrange(3):
+        assert writer.append(_play(gm.Game, seed, enemy_shots=False))
+    writer.close()
+
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory))
+    assert [len(records.Segment(path)) for path in paths] == [2, 1]
+    assert writer.stats == {'written': 3, 'skipped': 0, 'segments': 2}
+
+    with open(paths[1], 'ab') as f:
+        f.write(b'\x00' * (records.RECORD.itemsize // 2))
+    assert len(records.Segment(paths[1])) == 1
+
+
+def test_game_without_journal_is_skipped(directory):
+    game = gm.Game()
+    game.start_new_game()
+    game.journal = None
+    writer = records.RecordWriter(directory)
+
+    assert not writer.append(game)
+    assert writer.stats['skipped'] == 1
+    assert os.listdir(directory) == []
+
+
+def test_bad_segment(directory):
+    path = os.path.join(directory, 'bad.rec')
+    with open(path, 'wb') as f:
+        f.write(b'not a segment at all')
+    with pytest.raises(records.RecordError):
+        records.Segment(path)
+
+
+def test_simulate_records_both_players(directory):
+    simulate.run_tournament('seabattle.game', 'seabattle.density', 4, seed=1, workers=1, record=directory)
+
+    segment, = records.segments([directory])
+    stats = records.summary(segment.records)
+    assert stats['games'] == 8
+    assert stats['victories'] == 4
+    assert all(records.replay(record).exact for record in segment)
@@ -0,0 +1,173 @@
+# coding: utf-8
+from __future__ import unicode_literals
+from seabattle import game as gm, session
+
+import multiprocessing
+
+import pytest
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def _game():
+    game_obj = gm.Game()
+    game_obj.start_new_game()
+    return game_obj
+
+
+def test_same_session_for_user():
+    store = session.SessionStore()
+    session_obj = store.get('user')
+    assert session_obj == {'game': None, 'last': None, 'opponent': None}
+    session_obj['opponent'] = 'Алиса'
+    assert store.get('user') is session_obj
+    assert store.metrics()['created'] == 1
+
+
+def test_idle_sessions_expire():
+    clock = Clock()
+    store = session.SessionStore(ttl=10, clock=clock)
+    first = store.get('first')
+    clock.now = 5
+    store.get('second')
+    clock.now = 12
+    store.expire()
+
+    assert len(store) == 1
+    assert store.get('first') is not first
+    assert store.metrics()['expired'] == 1
+
+
+def test_lru_by_entries():
+    store = session.SessionStore(max_entries=2)
+    store.get('a')
+    store.get('b')
+    store.get('a')
+    store.get('c')
+
+    assert list(store._entries) == ['a', 'c']
+    assert store.metrics()['evicted'] == 1
+
+
+def test_lru_by_bytes():
+    store = session.SessionStore()
+    store.get('a')['game'] = _game()
+    game_bytes = store.bytes
+    store.max_bytes = game_bytes * 2
+
+    store.get('b')['game'] = _game()
+    assert len(store) == 2
+    store.get('c')['game'] = _game()
+
+    assert list(store._entries) == ['b', 'c']
+    assert store.bytes <= store.max_bytes
+    assert store.metrics()['evicted'] == 1
+
+
+def test_released_game_is_not_counted():
+    store = session.SessionStore()
+    session_obj = store.get('a')
+    empty = store.bytes
+    session_obj['game'] = _game()
+    assert store.bytes > empty + 10000
+
+    session_obj['game'] = None
+    metrics = store.metrics()
+    assert store.bytes == empty
+    assert (metrics['released'], metrics['games'], metrics['live']) == (1, 0, 1)
+
+
+def test_evicted_session_stays_usable():
+    store = session.SessionStore(max_entries=1)
+    first = store.get('a')
+    store.get('b')
+    first['game'] = _game()
+    assert list(store._entries) == ['b']
+    assert store.metrics()['games'] == 0
+
+
+@pytest.fixture
+def sqlite_store(tmpdir):
+    return session.SqliteSessionStore(str(tmpdir.join('sessions.db')), clock=Clock())
+
+
+def test_sqlite_round_trip(sqlite_store):
+    session_obj = sqlite_store.get('user')
+    assert session_obj == {'game': None, 'last': None, 'opponent': None}
+
+    session_obj['game'] = _game()
+    session_obj['opponent'] = 'Алиса'
+    sqlite_store.save(session_obj)
+
+    other_process = session.SqliteSessionStore(sqlite_store.path, clock=sqlite_store.clock)
+    loaded = other_process.get('user')
+    assert loaded is not session_obj
+    assert loaded['opponent'] == 'Алиса'
+    assert list(loaded['game'].field) == list(session_obj['game'].field)
+    assert other_process.metrics()['games'] == 1
+
+
+def test_sqlite_ttl_and_cap(sqlite_store):
+    sqlite_store.ttl = 10
+    sqlite_store.max_entries = 2
+    for user_id in ['a', 'b', 'c']:
+        sqlite_store.clock.now += 1
+        sqlite_store.save(sqlite_store.get(user_id))
+
+    sqlite_store.expire()
+    assert len(sqlite_store) == 2
+    assert sqlite_store.stats['evicted'] == 1
+
+    sqlite_store.clock.now += 9.5
+    assert sqlite_store.get('b') == {'game': None, 'last': None, 'opponent': None}
+    sqlite_store.expire()
+    assert len(sqlite_store) == 1
+
+
+def _shoot_in_other_process(path, user_id):
+    store = session.SqliteSessionStore(path, clock=Clock())
+    session_obj = store.get(user_id)
+    session_obj['game'].do_shot()
+    store.save(session_obj)
+
+
+def test_sqlite_rejects_stale_writes(sqlite_store):
+    session_obj = sqlite_store.get('user')
+    session_obj['game'] = _game()
+    sqlite_store.save(session_obj)
+
+    # ход, который прочёл сессию раньше, чем другой процесс записал свой
+    stale = sqlite_store.get('user')
+    stale['game'].do_shot()
+    other = multiprocessing.Process(target=_shoot_in_other_process, args=(sqlite_store.path, 'user'))
+    other.start()
+    other.join()
+    assert other.exitcode == 0
+
+    with pytest.raises(session.StaleSession):
+        sqlite_store.save(stale)
+    assert sqlite_store.stats['stale'] == 1
+
+    # выстрел другого процесса не потерян, и следующий ход пишется поверх него
+    fresh = sqlite_store.get('user')
+    assert len(fresh['game'].journal) == 1
+    fresh['game'].do_shot()
+    sqlite_store.save(fresh)
+    assert len(sqlite_store.get('user')['game'].journal) == 2
+
+
+def test_sqlite_rejects_second_new_session(sqlite_store):
+    first = sqlite_store.get('user')
+    second = sqlite_store.get('user')
+    first['opponent'] = 'Алиса'
+    sqlite_store.save(first)
+    second['opponent'] = 'Яндекс'
+    with pytest.raises(session.StaleSession):
+        sqlite_store.save(second)
+    assert sqlite_store.get('user')['opponent'] == 'Алиса'
@@ -0,0 +1,36 @@
+# coding: utf-8
+from __future__ import unicode_literals
+from seabattle import game as gm, simulate
+
+
+def test_seeded_game_is_reproducible():
+    first, second = gm.Game(seed=42), gm.Game(seed=42)
+    first.start_new_game()
+    second.start_new_game()
+    assert first.field == second.field
+    assert [first.do_shot() for _ in xrange(5)] == [second.do_shot() for _ in xrange(5)]
+
+
+def test_play_game_replays():
+    first = simulate.play_game('seabattle.game', 'seabattle.density', 7, 3)
+    second = simulate.play_game('seabattle.game', 'seabattle.density', 7, 3)
+    assert first == second
+    assert first['winner'] in (1, 2)
+    assert first['error'] is None
+
+
+def test_tournament():
+    stats = simulate.run_tournament('seabattle.game', 'seabattle.game', 6, seed=1, workers=1, chunk_size=4)
+    assert stats['games'] == 6
+    players = stats['players']
+    assert players[1]['wins'] + players[2]['wins'] + stats['draws'] == 6
+    for player in players.values():
+        if player['wins']:
+            assert 20 <= player['mean_shots_to_win'] <= 100
+            assert player['p95_shots_to_win'] >= player['mean_shots_to_win'] - 1
+
+
+def test_percentile():
+    assert simulate.percentile([], 0.95) is None
+    assert simulate.percentile([3, 1, 2], 0.5) == 2
+    assert simulate.percentile(range(1, 101), 0.95) == 95